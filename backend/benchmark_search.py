@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Product search benchmark for YAMA+
+Compares the in-memory search index against a linear case-insensitive regex
+scan (what the old $regex query made MongoDB do) on synthetic catalogs.
+
+Index latency depends on the posting-list sizes of the query terms, the
+regex scan on the total amount of text, so the gap widens as the catalog grows.
+
+Usage: python benchmark_search.py [size ...]
+"""
+import random
+import re
+import sys
+import time
+
+from services.search_service import SearchIndex
+
+PRODUCT_TYPES = [
+    "réfrigérateur", "congélateur", "climatiseur", "téléviseur", "téléphone", "smartphone",
+    "ordinateur portable", "casque bluetooth", "enceinte", "machine à laver", "micro-ondes",
+    "cuisinière", "ventilateur", "canapé", "fauteuil", "table basse", "lampe", "miroir",
+    "parfum", "crème hydratante", "savon", "shampooing", "pneu", "batterie", "huile moteur",
+]
+ADJECTIVES = ["noir", "blanc", "inox", "économique", "silencieux", "compact", "cuir", "bois", "premium"]
+CATEGORIES = ["electronique", "electromenager", "decoration", "beaute", "automobile"]
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "su", "ti", "vo", "zé", "ba", "do", "fu", "gé", "ri"]
+QUERIES = ["refrigerateur samsung", "télé", "climatiseur inox", "casque bluetooth", "parfun", "brand42 model7"]
+
+
+def make_catalog(size: int, seed: int = 42) -> list:
+    """Catalog whose brands and vocabulary grow with its size, like a real one"""
+    rng = random.Random(seed)
+    brands = ["Samsung", "LG", "Hisense", "Tecno"] + [f"Brand{i}" for i in range(max(size // 50, 1))]
+    vocabulary = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(max(size // 2, 200))]
+    products = []
+    for i in range(size):
+        brand = rng.choice(brands)
+        products.append({
+            "product_id": f"prod_{i:08d}",
+            "name": f"{rng.choice(PRODUCT_TYPES).capitalize()} {brand} Model{rng.randint(1, 99)} {rng.choice(ADJECTIVES)}",
+            "brand": brand,
+            "category": rng.choice(CATEGORIES),
+            "description": " ".join(rng.choices(vocabulary, k=25)),
+        })
+    return products
+
+
+def regex_scan(products: list, query: str) -> list:
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    return [p for p in products if pattern.search(p["name"]) or pattern.search(p["description"])]
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(sizes):
+    print(f"{'products':>10} {'build (ms)':>12} {'index (ms/query)':>18} {'regex scan (ms/query)':>22}")
+    for size in sizes:
+        products = make_catalog(size)
+        index = SearchIndex()
+        build_ms = timed(lambda: index.build(products), 1)
+        index_ms = sum(timed(lambda: index.search(q, limit=50), 20) for q in QUERIES) / len(QUERIES)
+        scan_ms = sum(timed(lambda: regex_scan(products, q), 3) for q in QUERIES) / len(QUERIES)
+        print(f"{size:>10} {build_ms:>12.1f} {index_ms:>18.3f} {scan_ms:>22.3f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000, 50000])
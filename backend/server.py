@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 import logging
 import io
@@ -15,11 +17,14 @@ import re
 import time
 import aiohttp
 import base64
+import bisect
 import secrets
-from collections import defaultdict
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr, validator
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter, create_model, validator
+from typing import Dict, List, Optional, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 import httpx
@@ -28,6 +33,7 @@ import jwt
 from mailersend import MailerSendClient, EmailBuilder
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.triggers.cron import CronTrigger
 
 # Image compression
 from PIL import Image as PILImage
@@ -42,6 +48,24 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer, Image
 from reportlab.lib.units import cm, mm
 
+# In-memory cache
+from services.cache_service import TTLCache
+from services.cache_bus import InProcessInvalidationBus, MongoInvalidationBus
+from services.search_service import SearchIndex
+from services.suggest_service import SuggestIndex
+from services.product_loader import ProductLoader
+from services.recommendation_service import SIMILARITY_MEASURES, CoOccurrenceIndex
+from services.similarity_service import SimilarityIndex
+from services.pagination import (
+    paginate, count as count_total, encode_cursor, decode_cursor, InvalidCursor, COUNT_MODES
+)
+from services.catalog_replica import CatalogReplica, project
+from services.retention import RetentionPolicy, ensure_ttl_indexes, sweep
+from services.http_cache import (
+    EncodedResponse, encode_response,
+    CachePolicy, CachePolicyRegistry, conditional_response
+)
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -108,37 +132,126 @@ client = AsyncIOMotorClient(
 )
 db = client[os.environ['DB_NAME']]
 
-# Simple in-memory cache for frequently accessed data
-_cache = {}
-_cache_ttl = {}
+# In-memory cache for frequently accessed data (bounded LRU with TTL and tag invalidation)
 CACHE_DURATION = 60  # Cache for 60 seconds
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_PURGE_INTERVAL_SECONDS = 15
+# Stale-while-revalidate window for hot catalog keys (0 disables it)
+CACHE_STALE_SECONDS = int(os.environ.get("CACHE_STALE_SECONDS", "30"))
+
+cache = TTLCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, default_ttl=CACHE_DURATION)
 
 def get_cached(key):
     """Get value from cache if not expired"""
-    if key in _cache and key in _cache_ttl:
-        if time.time() < _cache_ttl[key]:
-            return _cache[key]
-        else:
-            del _cache[key]
-            del _cache_ttl[key]
-    return None
+    return cache.get(key)
 
-def set_cached(key, value, ttl=CACHE_DURATION):
-    """Set value in cache with TTL"""
-    _cache[key] = value
-    _cache_ttl[key] = time.time() + ttl
+def set_cached(key, value, ttl=CACHE_DURATION, tags=None):
+    """Set value in cache with TTL (keys are always tagged with their namespace)"""
+    cache.set(key, value, ttl=ttl, tags=tags)
 
 def clear_cache(prefix=None):
-    """Clear cache, optionally by prefix"""
-    global _cache, _cache_ttl
+    """Clear cache, optionally by namespace/tag"""
     if prefix:
-        keys_to_delete = [k for k in _cache.keys() if k.startswith(prefix)]
-        for k in keys_to_delete:
-            _cache.pop(k, None)
-            _cache_ttl.pop(k, None)
+        cache.invalidate_tag(prefix)
     else:
-        _cache = {}
-        _cache_ttl = {}
+        cache.clear()
+
+async def purge_expired_cache():
+    """Scheduled job: evict expired entries (runs on the event loop, not the thread pool)"""
+    cache.purge_expired()
+
+# Cross-worker invalidation: "mongo" tails a capped collection, "memory" is single-process
+CACHE_BUS_BACKEND = os.environ.get("CACHE_BUS_BACKEND", "mongo")
+CATALOG_CACHE_TTL = int(os.environ.get("CATALOG_CACHE_TTL", "30"))
+CATALOG_CACHE_TAGS = ("products", "flash_sales")
+
+if CACHE_BUS_BACKEND == "memory":
+    cache_bus = InProcessInvalidationBus()
+else:
+    cache_bus = MongoInvalidationBus(db, "cache_invalidations")
+
+# Catalog version: bumped by every local or remote catalog invalidation, drives Last-Modified
+catalog_state = {"version": 0, "last_modified": datetime.now(timezone.utc)}
+
+def apply_cache_invalidation(tags, product_ids=None):
+    """Drop cached entries for the given tags in this worker"""
+    for tag in tags:
+        cache.invalidate_tag(tag)
+    if any(tag in CATALOG_CACHE_TAGS for tag in tags):
+        catalog_state["version"] += 1
+        catalog_state["last_modified"] = datetime.now(timezone.utc)
+    for snapshot_tags, name, refresh in snapshot_subscriptions:
+        if any(tag in snapshot_tags for tag in tags):
+            schedule_snapshot_refresh(name, refresh)
+
+# In-memory snapshots (homepage, review highlights) register (tags, name, refresh)
+# here; matching invalidations schedule a debounced background refresh.
+SNAPSHOT_DEBOUNCE_SECONDS = 0.5
+snapshot_subscriptions = []
+snapshot_refresh_tasks = {}
+
+def schedule_snapshot_refresh(name, refresh):
+    """Run refresh() shortly, once per burst of invalidations"""
+    task = snapshot_refresh_tasks.get(name)
+    if task is not None and not task.done():
+        return
+    
+    async def run():
+        # Let a burst of admin writes settle into a single rebuild
+        await asyncio.sleep(SNAPSHOT_DEBOUNCE_SECONDS)
+        snapshot_refresh_tasks.pop(name, None)
+        try:
+            await refresh()
+        except Exception as e:
+            logger.error(f"Snapshot refresh '{name}' failed: {e}")
+    
+    try:
+        snapshot_refresh_tasks[name] = asyncio.get_running_loop().create_task(run())
+    except RuntimeError:
+        pass  # No running loop (import time); the first request builds it
+
+# Async callbacks (product_ids) run after every catalog invalidation, local or remote.
+# In-memory indexes register here to stay current; product_ids=None means "everything".
+catalog_listeners = []
+
+async def notify_catalog_listeners(tags, product_ids=None):
+    if not any(tag in CATALOG_CACHE_TAGS for tag in tags):
+        return
+    for listener in catalog_listeners:
+        try:
+            await listener(product_ids)
+        except Exception as e:
+            logger.error(f"Catalog listener {listener.__name__} failed: {e}")
+
+# Published on the bus when an admin clears the whole cache
+CACHE_CLEAR_ALL_TAG = "*"
+
+async def on_remote_invalidation(tags, product_ids=None):
+    """Invalidation published by another worker"""
+    if CACHE_CLEAR_ALL_TAG in tags:
+        cache.clear()
+        return
+    apply_cache_invalidation(tags, product_ids)
+    if "recommendations" in tags and product_ids:
+        # A paid order counted by another worker (product_ids are its items)
+        recommendation_index.add_order(product_ids)
+    await notify_catalog_listeners(tags, product_ids)
+
+async def invalidate_cache(tags, product_ids=None):
+    """Invalidate tags here and broadcast them to every other worker"""
+    tags = list(tags)
+    apply_cache_invalidation(tags, product_ids)
+    await cache_bus.publish(tags, product_ids)
+    await notify_catalog_listeners(tags, product_ids)
+
+def product_cache_tag(product_id: str) -> str:
+    """Tag of the cache entries of one product (detail views, bundle)"""
+    return f"product:{product_id}"
+
+async def invalidate_catalog(product_ids=None):
+    """Invalidate every catalog cache after a product or flash sale change"""
+    await invalidate_cache(CATALOG_CACHE_TAGS, product_ids)
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'lumina-senegal-secret-key-2024')
@@ -253,11 +366,63 @@ RATE_LIMIT_REQUESTS = 100  # requests per window
 RATE_LIMIT_WINDOW = 60  # seconds
 MAX_RATE_LIMIT_ENTRIES = 1000  # Prevent memory bloat
 
+# ============== HTTP CACHE POLICIES ==============
+
+# Public read endpoints revalidate with ETag/Last-Modified (304 on repeat visits);
+# anything not listed here (auth, cart, orders, admin) stays no-store
+CATALOG_CACHE_POLICY = CachePolicy(
+    "catalog", "public, no-cache", conditional=True,
+    last_modified=lambda: catalog_state["last_modified"]
+)
+CONTENT_CACHE_POLICY = CachePolicy("content", "public, no-cache", conditional=True)
+STATIC_CACHE_POLICY = CachePolicy("static", "public, max-age=3600", conditional=True)
+
+cache_policies = CachePolicyRegistry()
+for route in [
+    "/api/products",
+    "/api/products/facets",
+    "/api/products/changes",
+    "/api/products/{product_id}",
+    "/api/products/{product_id}/similar",
+    "/api/products/{product_id}/frequently-bought",
+    "/api/flash-sales",
+]:
+    cache_policies.add(route, CATALOG_CACHE_POLICY)
+for route in [
+    "/api/products/{product_id}/reviews",
+    "/api/products/{product_id}/bundle",
+    "/api/home",
+    "/api/reviews/featured",
+    "/api/reviews/stats",
+    "/api/blog/posts",
+    "/api/blog/posts/{slug}",
+    "/api/gift-box/config",
+    "/api/gift-box/active-template",
+    "/api/gift-box/products",
+]:
+    cache_policies.add(route, CONTENT_CACHE_POLICY)
+for route in [
+    "/api/categories",
+    "/api/delivery/zones",
+    "/api/services/categories",
+    "/api/services/locations",
+]:
+    cache_policies.add(route, STATIC_CACHE_POLICY)
+
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """Add security headers to all responses"""
     async def dispatch(self, request: Request, call_next):
         response = await call_next(request)
         
+        # Cache control for API responses (per-route policy, see cache_policies)
+        if request.url.path.startswith("/api/"):
+            policy = cache_policies.resolve(request.method, request.url.path)
+            # A Cache-Control set by the route itself (admin profiles, uploads) wins
+            cache_control = response.headers.get("cache-control", policy.cache_control)
+            if policy.conditional and response.status_code == 200:
+                response = await conditional_response(request, response, policy)
+            response.headers["Cache-Control"] = cache_control
+        
         # Security headers
         response.headers["X-Content-Type-Options"] = "nosniff"
         response.headers["X-Frame-Options"] = "DENY"
@@ -265,10 +430,6 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
         response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
         
-        # Cache control for API responses
-        if request.url.path.startswith("/api/"):
-            response.headers["Cache-Control"] = "no-store, max-age=0"
-        
         return response
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
@@ -402,6 +563,44 @@ class Product(ProductBase):
     product_id: str
     created_at: datetime
     updated_at: datetime
+    # Stamped on every catalog write (see reserve_catalog_versions)
+    catalog_version: Optional[int] = None
+    # Maintained from reviews (see apply_rating_change)
+    rating_avg: float = 0
+    rating_count: int = 0
+    rating_histogram: Optional[Dict[str, int]] = None
+
+class ProductCard(BaseModel):
+    """What a product grid tile renders"""
+    model_config = ConfigDict(extra="ignore")
+    product_id: str
+    name: str
+    price: int
+    original_price: Optional[int] = None
+    category: str
+    brand: Optional[str] = None
+    images: List[str] = []
+    stock: int = 0
+    is_new: bool = False
+    is_promo: bool = False
+    is_flash_sale: bool = False
+    flash_sale_price: Optional[int] = None
+    flash_sale_end: Optional[str] = None
+    is_on_order: bool = False
+    order_delivery_days: Optional[int] = None
+    rating_avg: float = 0
+    rating_count: int = 0
+
+class ProductAdmin(Product):
+    """The stored document as is, internal counters included"""
+    model_config = ConfigDict(extra="allow")
+
+# Sparse fieldsets (?fields=): every Product field optional, only the requested ones are serialized
+ProductFields = create_model(
+    "ProductFields",
+    __config__=ConfigDict(extra="ignore"),
+    **{name: (Optional[field.annotation], None) for name, field in Product.model_fields.items()}
+)
 
 class CartItem(BaseModel):
     product_id: str
@@ -440,6 +639,9 @@ class OrderCreate(BaseModel):
     subtotal: int
     shipping_cost: int
     total: int
+    # Signed breakdown from POST /cart/quote, required: its prices and totals
+    # replace the ones above
+    quote_token: Optional[str] = None
 
 class OrderStatusHistory(BaseModel):
     status: str
@@ -918,6 +1120,11 @@ async def detect_and_process_abandoned_carts():
         
         processed_count = 0
         
+        # Every product of every cart in one query
+        products = await ProductLoader(db.products, {"_id": 0, "name": 1, "price": 1, "images": {"$slice": 1}}).load_many(
+            item["product_id"] for cart in abandoned_carts for item in cart.get("items", [])
+        )
+        
         for cart in abandoned_carts:
             user_id = cart.get("user_id")
             if not user_id:
@@ -946,10 +1153,7 @@ async def detect_and_process_abandoned_carts():
             cart_total = 0
             
             for item in cart.get("items", []):
-                product = await db.products.find_one(
-                    {"product_id": item["product_id"]},
-                    {"_id": 0, "name": 1, "price": 1, "images": 1}
-                )
+                product = products.get(item["product_id"])
                 if product:
                     item_data = {
                         "product_id": item["product_id"],
@@ -1005,13 +1209,48 @@ async def detect_and_process_abandoned_carts():
     except Exception as e:
         logger.error(f"Error in abandoned cart detection: {str(e)}")
 
+# ============== DATA RETENTION ==============
+
+# Aged documents are archived here as gzip NDJSON, one directory per collection
+RETENTION_ARCHIVE_DIR = Path(os.environ.get("RETENTION_ARCHIVE_DIR", ROOT_DIR / "archive"))
+
+RETENTION_POLICIES = [
+    # Native Date expires_at with a TTL index; tokens are never archived
+    RetentionPolicy("user_sessions", "user_sessions", "expires_at", timedelta(0), ttl=True, archive=False),
+    RetentionPolicy("password_resets", "password_resets", "expires_at", timedelta(0), ttl=True, archive=False),
+    RetentionPolicy("stock_reservations", "stock_reservations", "purge_at", timedelta(0), ttl=True, archive=False),
+    RetentionPolicy("guest_carts", "carts", "updated_at", timedelta(days=30), query={"user_id": None}),
+    RetentionPolicy("user_carts", "carts", "updated_at", timedelta(days=180), query={"user_id": {"$ne": None}}),
+    RetentionPolicy("chat_sessions", "chat_sessions", "updated_at", timedelta(days=90)),
+    RetentionPolicy("notifications", "notifications", "sent_at", timedelta(days=90)),
+    RetentionPolicy("abandoned_cart_stats", "abandoned_cart_stats", "run_at", timedelta(days=90)),
+    RetentionPolicy("abandoned_cart_emails", "abandoned_cart_emails", "sent_at", timedelta(days=180)),
+]
+
+retention_state = {"last_run": None}
+
+async def run_retention_sweep():
+    """Archive and delete documents past their retention (daily job)"""
+    now = datetime.now(timezone.utc)
+    results = {}
+    for policy in RETENTION_POLICIES:
+        try:
+            results[policy.name] = await sweep(db, policy, RETENTION_ARCHIVE_DIR, now)
+        except Exception as e:
+            logger.error(f"Retention sweep failed for {policy.name}: {e}")
+            results[policy.name] = {"error": str(e)}
+    retention_state["last_run"] = {"run_at": now.isoformat(), "results": results}
+    removed = sum(r.get("deleted", 0) for r in results.values())
+    logger.info(f"Retention sweep complete. Removed {removed} documents.")
+    return results
+
 # Initialize scheduler
 scheduler = AsyncIOScheduler()
 
 # ============== AUTH ROUTES ==============
 
 @api_router.post("/auth/register")
-async def register(user_data: UserCreate, response: Response):
+async def register(user_data: UserCreate, request: Request, response: Response):
     existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing:
         raise HTTPException(status_code=400, detail="Cet email est déjà utilisé")
@@ -1036,6 +1275,8 @@ async def register(user_data: UserCreate, response: Response):
     user_for_email = {k: v for k, v in user_doc.items() if k != "_id"}
     asyncio.create_task(send_welcome_email(user_for_email))
     
+    await merge_guest_cart(request, user_id)
+    
     token = create_token(user_id, user_data.email)
     response.set_cookie(
         key="session_token",
@@ -1057,7 +1298,7 @@ async def register(user_data: UserCreate, response: Response):
     }
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin, response: Response):
+async def login(credentials: UserLogin, request: Request, response: Response):
     user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
@@ -1068,6 +1309,8 @@ async def login(credentials: UserLogin, response: Response):
     if not verify_password(credentials.password, user_doc["password"]):
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     
+    await merge_guest_cart(request, user_doc["user_id"])
+    
     token = create_token(user_doc["user_id"], user_doc["email"])
     response.set_cookie(
         key="session_token",
@@ -1098,7 +1341,7 @@ class GoogleCallbackRequest(BaseModel):
     redirect_uri: str
 
 @api_router.post("/auth/google/callback")
-async def google_oauth_callback(callback_data: GoogleCallbackRequest, response: Response):
+async def google_oauth_callback(callback_data: GoogleCallbackRequest, request: Request, response: Response):
     """Process Google OAuth authorization code and create user session"""
     
     try:
@@ -1172,6 +1415,8 @@ async def google_oauth_callback(callback_data: GoogleCallbackRequest, response:
             }
             await db.users.insert_one(user_doc)
         
+        await merge_guest_cart(request, user_id)
+        
         # Create session
         session_token = f"session_{uuid.uuid4().hex}"
         expires_at = datetime.now(timezone.utc) + timedelta(days=7)
@@ -1181,7 +1426,7 @@ async def google_oauth_callback(callback_data: GoogleCallbackRequest, response:
             {"$set": {
                 "user_id": user_id,
                 "session_token": session_token,
-                "expires_at": expires_at.isoformat(),
+                "expires_at": expires_at,
                 "created_at": datetime.now(timezone.utc).isoformat()
             }},
             upsert=True
@@ -1414,29 +1659,506 @@ async def get_uploaded_image(filename: str, response: Response):
         }
     )
 
+# ============== PAGINATION ==============
+
+# Keyset sorts for admin lists; the last field is unique (see services/pagination.py)
+ORDER_LIST_SORT = [("created_at", -1), ("order_id", -1)]
+USER_LIST_SORT = [("_id", 1)]
+
+async def paginate_or_400(collection, query: dict, projection: dict, sort, limit: int,
+                          cursor: Optional[str], skip: int) -> Tuple[list, Optional[str]]:
+    """paginate() with malformed cursors reported as a client error"""
+    try:
+        return await paginate(collection, query, projection, sort, max(limit, 1), cursor=cursor, skip=skip)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+async def count_or_400(collection, query: dict, mode: str) -> Optional[int]:
+    if mode not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count doit être l'un de : {', '.join(COUNT_MODES)}")
+    return await count_total(collection, query, mode)
+
+# ============== PRODUCT SEARCH ==============
+
+# Ranked, accent-insensitive search over the catalog (see services/search_service.py).
+# Built at startup and kept current by catalog invalidations.
+search_index = SearchIndex()
+SEARCH_MAX_CANDIDATES = 500
+SEARCH_INDEX_PROJECTION = {
+    "_id": 0, "product_id": 1, "name": 1, "brand": 1, "category": 1,
+    "subcategory": 1, "short_description": 1, "description": 1,
+    # Used by the suggestion index only
+    "price": 1, "images": {"$slice": 1}, "stock": 1, "is_on_order": 1,
+    "featured": 1, "is_new": 1, "is_promo": 1
+}
+
+# Typeahead for the search box (see services/suggest_service.py), same lifecycle
+suggest_index = SuggestIndex()
+
+async def load_sales_counts() -> dict:
+    """Units sold per product, used as suggestion popularity"""
+    pipeline = [
+        {"$match": {"order_status": {"$nin": ["cancelled", "refunded"]}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": "$items.product_id", "sold": {"$sum": "$items.quantity"}}}
+    ]
+    rows = await db.orders.aggregate(pipeline).to_list(None)
+    return {row["_id"]: row["sold"] for row in rows if row["_id"]}
+
+async def rebuild_search_index():
+    """Load every product into the search and suggestion indexes"""
+    docs = await db.products.find({}, SEARCH_INDEX_PROJECTION).to_list(None)
+    search_index.build(docs)
+    try:
+        sales = await load_sales_counts()
+    except Exception as e:
+        logger.warning(f"Could not load sales counts for suggestions: {e}")
+        sales = {}
+    suggest_index.build(docs, sales=sales, category_labels={c["id"]: c["name"] for c in CATEGORIES})
+    logger.info(f"Search index built: {search_index.stats()}, suggestions: {suggest_index.stats()}")
+
+async def refresh_search_index(product_ids=None):
+    """Catalog listener: re-index changed products (all of them when ids are unknown)"""
+    if product_ids is None:
+        await rebuild_search_index()
+        return
+    docs = await db.products.find({"product_id": {"$in": product_ids}}, SEARCH_INDEX_PROJECTION).to_list(None)
+    found = set()
+    for doc in docs:
+        search_index.upsert(doc)
+        suggest_index.upsert(doc)
+        found.add(doc["product_id"])
+    for product_id in product_ids:
+        if product_id not in found:
+            search_index.remove(product_id)
+            suggest_index.remove(product_id)
+
+catalog_listeners.append(refresh_search_index)
+
+async def search_products(query: dict, search: str, projection: dict, limit: int, skip: int) -> list:
+    """Ranked search; filters in query are applied to the ranked candidates"""
+    if not search_index.ready:
+        # Index not loaded yet: fall back to the MongoDB text index
+        query = {**query, "$text": {"$search": search}}
+        projection = {**projection, "score": {"$meta": "textScore"}}
+        return await db.products.find(query, projection).sort(
+            [("score", {"$meta": "textScore"})]
+        ).skip(skip).limit(limit).to_list(limit)
+    
+    ranked_ids = [product_id for product_id, _ in search_index.search(search, limit=SEARCH_MAX_CANDIDATES)]
+    if not ranked_ids:
+        return []
+    
+    if replica_ready() and CatalogReplica.supports(query):
+        found = catalog_replica.get_many(ranked_ids, projection, query)
+        return [found[pid] for pid in ranked_ids if pid in found][skip:skip + limit]
+    
+    products = await db.products.find(
+        {**query, "product_id": {"$in": ranked_ids}},
+        projection
+    ).to_list(len(ranked_ids))
+    rank = {product_id: position for position, product_id in enumerate(ranked_ids)}
+    products.sort(key=lambda p: rank[p["product_id"]])
+    return products[skip:skip + limit]
+
+@api_router.get("/search/suggest")
+async def search_suggest(q: str = "", limit: int = 8):
+    """Typeahead suggestions (products, brands, categories), served from memory"""
+    limit = max(1, min(limit, 20))
+    return {"query": q, "suggestions": suggest_index.suggest(q[:100], limit=limit)}
+
+# ============== CATALOG CHANGE FEED ==============
+
+# Every product write takes the next value of a persistent counter and stamps
+# it on the product (catalog_version); deletions leave a tombstone with their
+# version. Clients holding a replica ask for everything after the last
+# version they saw. Each write has its own version, so a page can end at
+# any version without splitting one.
+#
+# Versions are reserved before the write lands, so the counter alone may be
+# ahead of what is readable. The counter document also lists the ranges
+# still being written; the feed only reports up to the committed watermark,
+# just below the lowest of them. Ranges of a writer that died are ignored
+# after CATALOG_PENDING_TIMEOUT_SECONDS.
+CATALOG_VERSION_COUNTER = "catalog_version"
+CATALOG_PENDING_TIMEOUT_SECONDS = 300
+CHANGES_MAX_LIMIT = 1000
+
+@asynccontextmanager
+async def reserve_catalog_versions(count: int = 1):
+    """
+    Reserve count versions for a write made inside the block; yields the
+    highest. The range stays pending (above the watermark) until the block exits.
+    """
+    if count <= 0:
+        yield await committed_catalog_version()
+        return
+    token = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    # Counter and pending range change in one atomic update, so no reader sees one without the other
+    counter = await db.counters.find_one_and_update(
+        {"_id": CATALOG_VERSION_COUNTER},
+        [
+            {"$set": {"value": {"$add": [{"$ifNull": ["$value", 0]}, count]}}},
+            {"$set": {"pending": {"$concatArrays": [
+                {"$ifNull": ["$pending", []]},
+                [{
+                    "token": token,
+                    "first": {"$subtract": ["$value", count - 1]},
+                    "expires_at": now + timedelta(seconds=CATALOG_PENDING_TIMEOUT_SECONDS)
+                }]
+            ]}}}
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    try:
+        yield counter["value"]
+    finally:
+        await db.counters.update_one(
+            {"_id": CATALOG_VERSION_COUNTER},
+            {"$pull": {"pending": {"$or": [{"token": token}, {"expires_at": {"$lt": now}}]}}}
+        )
+
+async def committed_catalog_version() -> int:
+    """Highest version below which every reserved write has landed"""
+    counter = await db.counters.find_one({"_id": CATALOG_VERSION_COUNTER})
+    if not counter:
+        return 0
+    now = datetime.now(timezone.utc)
+    pending = [
+        entry["first"] for entry in counter.get("pending", [])
+        if entry["expires_at"].replace(tzinfo=timezone.utc) > now
+    ]
+    return min(pending) - 1 if pending else counter["value"]
+
+async def record_product_deletion(product_id: str):
+    async with reserve_catalog_versions() as version:
+        await db.catalog_tombstones.insert_one({
+            "product_id": product_id,
+            "catalog_version": version,
+            "deleted_at": datetime.now(timezone.utc).isoformat()
+        })
+
+async def backfill_catalog_versions():
+    """Give products created before the change feed a version of their own"""
+    try:
+        legacy = await db.products.find(
+            {"catalog_version": {"$exists": False}}, {"_id": 0, "product_id": 1}
+        ).to_list(None)
+        if not legacy:
+            return
+        async with reserve_catalog_versions(len(legacy)) as highest:
+            first = highest - len(legacy) + 1
+            await db.products.bulk_write([
+                UpdateOne(
+                    {"product_id": product["product_id"], "catalog_version": {"$exists": False}},
+                    {"$set": {"catalog_version": first + position}}
+                )
+                for position, product in enumerate(legacy)
+            ], ordered=False)
+        logger.info(f"Catalog versions assigned to {len(legacy)} products")
+    except Exception as e:
+        logger.error(f"Catalog version backfill failed: {e}")
+
+@api_router.get("/products/changes")
+async def get_catalog_changes(since: int = 0, limit: int = 500):
+    """
+    Products upserted and deleted after catalog version `since`, oldest first.
+    Call again with since=version while has_more is true.
+    """
+    limit = max(1, min(limit, CHANGES_MAX_LIMIT))
+    # Read first: every version up to it is readable by the queries below
+    watermark = await committed_catalog_version()
+    changed = {"catalog_version": {"$gt": since, "$lte": watermark}}
+    
+    upserts, deletions = await asyncio.gather(
+        db.products.find(changed, PRODUCT_LIST_PROJECTION).sort("catalog_version", 1).limit(limit + 1).to_list(limit + 1),
+        db.catalog_tombstones.find(changed, {"_id": 0}).sort("catalog_version", 1).limit(limit + 1).to_list(limit + 1)
+    )
+    
+    # Merge both streams and cut the page at a version boundary
+    events = sorted(
+        [("upsert", p) for p in upserts] + [("delete", t) for t in deletions],
+        key=lambda event: event[1]["catalog_version"]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    version = events[-1][1]["catalog_version"] if has_more else max(watermark, since)
+    
+    page_upserts = [doc for kind, doc in events if kind == "upsert"]
+    return encode_response({
+        "since": since,
+        "version": version,
+        "has_more": has_more,
+        "upserts": PRODUCT_LIST_ADAPTER.dump_python(PRODUCT_LIST_ADAPTER.validate_python(page_upserts), mode="json"),
+        "deletions": [
+            {"product_id": doc["product_id"], "catalog_version": doc["catalog_version"]}
+            for kind, doc in events if kind == "delete"
+        ]
+    }).to_response()
+
+# ============== CATALOG REPLICA ==============
+
+# Optional in-process copy of the catalog (see services/catalog_replica.py)
+# answering listings, flash sales, facets and similar products. Loaded at
+# startup and synced from the change feed after each catalog invalidation
+# and by a poll. It is only read while no invalidation is pending, so a
+# fresh cache entry is never built from a replica that lags behind a write.
+CATALOG_REPLICA_ENABLED = os.environ.get("CATALOG_REPLICA", "true").lower() in ("1", "true", "yes")
+CATALOG_REPLICA_POLL_SECONDS = 15
+CATALOG_REPLICA_RELOAD_MINUTES = 60
+catalog_replica = CatalogReplica()
+# catalog_state["version"] the replica is known to reflect
+catalog_replica_state = {"synced_at": -1}
+catalog_replica_lock = asyncio.Lock()
+
+def replica_ready() -> bool:
+    return catalog_replica.ready and catalog_replica_state["synced_at"] == catalog_state["version"]
+
+async def load_catalog_replica():
+    """Full (re)load of the replica"""
+    if not CATALOG_REPLICA_ENABLED:
+        return
+    async with catalog_replica_lock:
+        try:
+            synced_at = catalog_state["version"]
+            # Read the version first: writes racing the scan are replayed by the next sync
+            version = await committed_catalog_version()
+            products = await db.products.find({}).to_list(None)
+            catalog_replica.load(products, version)
+            catalog_replica_state["synced_at"] = synced_at
+            logger.info(f"Catalog replica loaded: {catalog_replica.stats()}")
+        except Exception as e:
+            logger.error(f"Catalog replica load failed: {e}")
+
+async def sync_catalog_replica():
+    """Apply catalog changes since the replica's version"""
+    if not catalog_replica.ready:
+        return
+    async with catalog_replica_lock:
+        synced_at = catalog_state["version"]
+        # Writes still in flight stay above the watermark and are picked up by a later sync
+        watermark = await committed_catalog_version()
+        if watermark <= catalog_replica.version:
+            catalog_replica_state["synced_at"] = synced_at
+            return
+        changed = {"catalog_version": {"$gt": catalog_replica.version, "$lte": watermark}}
+        upserts, deletions = await asyncio.gather(
+            db.products.find(changed).to_list(None),
+            db.catalog_tombstones.find(changed, {"_id": 0, "product_id": 1, "catalog_version": 1}).to_list(None)
+        )
+        catalog_replica.apply(upserts, [doc["product_id"] for doc in deletions], watermark)
+        catalog_replica_state["synced_at"] = synced_at
+
+async def refresh_catalog_replica(product_ids=None):
+    """Catalog listener: sync shortly (listings read MongoDB until then)"""
+    if catalog_replica.ready:
+        schedule_snapshot_refresh("catalog_replica", sync_catalog_replica)
+
+catalog_listeners.append(refresh_catalog_replica)
+
+def _replica_page(query: dict, projection: dict, limit: int, skip: int,
+                  cursor: Optional[str]) -> Tuple[list, Optional[str]]:
+    """A listing page from the replica, same cursors as paginate() on PRODUCT_LIST_SORT"""
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(PRODUCT_LIST_SORT, cursor)[0]
+            skip = 0
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    try:
+        products, last_key = catalog_replica.find(query, projection, max(limit, 1), skip, after)
+    except TypeError:
+        # Cursor value not comparable with ObjectIds
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    next_cursor = encode_cursor(PRODUCT_LIST_SORT, {"_id": last_key}) if last_key is not None else None
+    return products, next_cursor
+
 # ============== PRODUCTS ROUTES ==============
 
 @api_router.get("/products", response_model=List[Product])
 async def get_products(
+    request: Request,
     category: Optional[str] = None,
     featured: Optional[bool] = None,
     is_new: Optional[bool] = None,
     is_promo: Optional[bool] = None,
     search: Optional[str] = None,
     limit: int = 50,
-    skip: int = 0
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    profile: Optional[str] = None,
+    fields: Optional[str] = None
 ):
     # Enforce maximum limit to prevent memory issues
     limit = min(limit, 100)
+    view = await resolve_product_profile(request, profile, fields, default="list")
     
-    # Build cache key for cacheable queries (no search, skip=0)
-    cache_key = None
-    if not search and skip == 0 and limit <= 50:
-        cache_key = f"products:{category}:{featured}:{is_new}:{is_promo}:{limit}"
-        cached = get_cached(cache_key)
-        if cached:
-            return cached
-    
+    async def load_encoded():
+        products, next_cursor = await _load_products(
+            category, featured, is_new, is_promo, search, limit, skip, cursor, view.projection
+        )
+        # The body stays a plain list; the next page is advertised in a header
+        return view.encode_list(products, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+    
+    # Cacheable queries (first page, no search) go through the single-flight cache.
+    # The cache holds the final JSON bytes, so hits skip Pydantic entirely.
+    if not search and not cursor and skip == 0 and limit <= 50:
+        cache_key = f"products:{category}:{featured}:{is_new}:{is_promo}:{limit}:{view.name}"
+        encoded = await cache.get_or_load(
+            cache_key,
+            load_encoded,
+            ttl=CATALOG_CACHE_TTL,
+            stale_ttl=CACHE_STALE_SECONDS
+        )
+    else:
+        encoded = await load_encoded()
+    
+    return encoded.to_response()
+
+# Insertion order (what the unsorted listing returned), _id is unique so no tiebreaker is needed
+PRODUCT_LIST_SORT = [("_id", 1)]
+
+# Validate and serialize product payloads in one pass with pydantic-core
+PRODUCT_ADAPTER = TypeAdapter(Product)
+PRODUCT_LIST_ADAPTER = TypeAdapter(List[Product])
+
+def encode_products(products: list, headers: Optional[Dict[str, str]] = None) -> EncodedResponse:
+    """Encode a product list exactly as response_model=List[Product] would"""
+    return EncodedResponse(PRODUCT_LIST_ADAPTER.dump_json(PRODUCT_LIST_ADAPTER.validate_python(products)), headers)
+
+def encode_product(product: dict) -> EncodedResponse:
+    """Encode a single product exactly as response_model=Product would"""
+    return EncodedResponse(PRODUCT_ADAPTER.dump_json(PRODUCT_ADAPTER.validate_python(product)))
+
+# Listing fields (limits data transfer and memory usage)
+PRODUCT_LIST_PROJECTION = {
+    "_id": 0,
+    "product_id": 1,
+    "name": 1,
+    "description": 1,
+    "short_description": 1,
+    "price": 1,
+    "original_price": 1,
+    "category": 1,
+    "subcategory": 1,
+    "images": {"$slice": 2},  # Limit to first 2 images
+    "stock": 1,
+    "featured": 1,
+    "is_new": 1,
+    "is_promo": 1,
+    "is_flash_sale": 1,
+    "flash_sale_price": 1,
+    "flash_sale_end": 1,
+    "brand": 1,
+    "colors": 1,
+    "sizes": 1,
+    "is_on_order": 1,
+    "order_delivery_days": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "rating_avg": 1,
+    "rating_count": 1,
+    "rating_histogram": 1,
+    "catalog_version": 1
+}
+
+# ============== PRODUCT PROFILES ==============
+
+class ProductProfile:
+    """
+    A named product representation: the projection read from MongoDB and the
+    model its documents are encoded with. Cache keys include the profile name.
+    """
+    __slots__ = ("name", "projection", "adapter", "list_adapter", "exclude_unset", "admin_only", "headers")
+
+    def __init__(self, name: str, projection: dict, model, exclude_unset: bool = False, admin_only: bool = False):
+        self.name = name
+        self.projection = projection
+        self.adapter, self.list_adapter = _product_adapters(model)
+        self.exclude_unset = exclude_unset
+        self.admin_only = admin_only
+        # Admin payloads must never end up in a shared cache
+        self.headers = {"Cache-Control": "private, no-store"} if admin_only else {}
+
+    def dump_list(self, products: list) -> list:
+        return self.list_adapter.dump_python(
+            self.list_adapter.validate_python(products), mode="json", exclude_unset=self.exclude_unset
+        )
+
+    def encode(self, product: dict) -> EncodedResponse:
+        body = self.adapter.dump_json(self.adapter.validate_python(product), exclude_unset=self.exclude_unset)
+        return EncodedResponse(body, dict(self.headers))
+
+    def encode_list(self, products: list, headers: Optional[Dict[str, str]] = None) -> EncodedResponse:
+        body = self.list_adapter.dump_json(self.list_adapter.validate_python(products), exclude_unset=self.exclude_unset)
+        return EncodedResponse(body, {**self.headers, **(headers or {})})
+
+@lru_cache(maxsize=None)
+def _product_adapters(model) -> Tuple[TypeAdapter, TypeAdapter]:
+    return TypeAdapter(model), TypeAdapter(List[model])
+
+PRODUCT_CARD_PROJECTION = {
+    "_id": 0,
+    **{field: 1 for field in ProductCard.model_fields},
+    # ProductCard.js rotates through the first 3 images
+    "images": {"$slice": 3}
+}
+
+PRODUCT_PROFILES = {
+    # Grids and carousels
+    "card": ProductProfile("card", PRODUCT_CARD_PROJECTION, ProductCard),
+    # Default listing representation (what /products has always returned)
+    "list": ProductProfile("list", PRODUCT_LIST_PROJECTION, Product),
+    # Product page
+    "detail": ProductProfile("detail", {"_id": 0}, Product),
+    # Back office: the whole stored document
+    "admin": ProductProfile("admin", {"_id": 0}, ProductAdmin, admin_only=True),
+}
+
+SPARSE_PRODUCT_FIELDS = frozenset(Product.model_fields)
+SPARSE_PROFILE_CACHE_SIZE = 256
+
+@lru_cache(maxsize=SPARSE_PROFILE_CACHE_SIZE)
+def sparse_product_profile(fields: Tuple[str, ...]) -> ProductProfile:
+    """Profile for a ?fields= list (sorted, deduplicated); product_id is always included"""
+    projection = {"_id": 0, "product_id": 1, **{field: 1 for field in fields}}
+    return ProductProfile("fields=" + ",".join(fields), projection, ProductFields, exclude_unset=True)
+
+async def resolve_product_profile(
+    request: Request,
+    profile: Optional[str],
+    fields: Optional[str],
+    default: str
+) -> ProductProfile:
+    """Profile for a product endpoint: ?fields= wins over ?profile=, then the endpoint default"""
+    if fields:
+        requested = sorted({field.strip() for field in fields.split(",") if field.strip()})
+        unknown = [field for field in requested if field not in SPARSE_PRODUCT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Champs inconnus: {', '.join(unknown)}")
+        if requested:
+            return sparse_product_profile(tuple(requested))
+    
+    selected = PRODUCT_PROFILES.get(profile or default)
+    if selected is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profil inconnu: {profile} (profils: {', '.join(PRODUCT_PROFILES)})"
+        )
+    if selected.admin_only:
+        await require_admin(request)
+    return selected
+
+def build_product_query(
+    category: Optional[str],
+    featured: Optional[bool],
+    is_new: Optional[bool],
+    is_promo: Optional[bool]
+) -> dict:
+    """MongoDB filter for the product listing, shared with the facets endpoint"""
     query = {}
     
     if category:
@@ -1447,64 +2169,215 @@ async def get_products(
         query["is_new"] = is_new
     if is_promo is not None:
         query["is_promo"] = is_promo
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
     
-    # Use projection to limit data transfer and memory usage
-    projection = {
-        "_id": 0,
-        "product_id": 1,
-        "name": 1,
-        "description": 1,
-        "short_description": 1,
-        "price": 1,
-        "original_price": 1,
-        "category": 1,
-        "subcategory": 1,
-        "images": {"$slice": 2},  # Limit to first 2 images
-        "stock": 1,
-        "featured": 1,
-        "is_new": 1,
-        "is_promo": 1,
-        "is_flash_sale": 1,
-        "flash_sale_price": 1,
-        "flash_sale_end": 1,
-        "brand": 1,
-        "colors": 1,
-        "sizes": 1,
-        "is_on_order": 1,
-        "order_delivery_days": 1,
-        "created_at": 1,
-        "updated_at": 1
-    }
+    return query
+
+async def _load_products(
+    category: Optional[str],
+    featured: Optional[bool],
+    is_new: Optional[bool],
+    is_promo: Optional[bool],
+    search: Optional[str],
+    limit: int,
+    skip: int,
+    cursor: Optional[str] = None,
+    projection: dict = PRODUCT_LIST_PROJECTION
+) -> Tuple[list, Optional[str]]:
+    """Query products from MongoDB (uncached), returns (products, next_cursor)"""
+    query = build_product_query(category, featured, is_new, is_promo)
+    
+    if search:
+        # Relevance-ranked results have no stable key to resume from
+        return await search_products(query, search, projection, limit, skip), None
     
-    products = await db.products.find(query, projection).skip(skip).limit(limit).to_list(limit)
+    if replica_ready() and CatalogReplica.supports(query):
+        return _replica_page(query, projection, limit, skip, cursor)
     
+    # ISO date strings are left as-is, the Product adapter parses them while encoding
+    return await paginate_or_400(db.products, query, projection, PRODUCT_LIST_SORT, limit, cursor, skip)
+
+class ProductBatchRequest(BaseModel):
+    product_ids: List[str] = Field(..., max_length=100)
+
+@api_router.post("/products/batch")
+async def get_products_batch(data: ProductBatchRequest):
+    """Hydrate many products in one call (listing fields, request order, unknown ids in "missing")"""
+    found = await ProductLoader(db.products, PRODUCT_LIST_PROJECTION).load_many(data.product_ids)
+    ordered = [found[pid] for pid in dict.fromkeys(data.product_ids) if pid in found]
+    return encode_response({
+        "products": PRODUCT_LIST_ADAPTER.dump_python(PRODUCT_LIST_ADAPTER.validate_python(ordered), mode="json"),
+        "missing": [pid for pid in dict.fromkeys(data.product_ids) if pid not in found]
+    }).to_response()
+
+# Price bucket boundaries in FCFA (last bucket is open-ended)
+FACET_PRICE_BOUNDARIES = [0, 10000, 25000, 50000, 100000, 250000, 500000, 1000000]
+
+def _facet_pipeline(query: dict) -> list:
+    """One $facet aggregation computing every filter count for a product listing"""
+    return [
+        {"$match": query},
+        {"$facet": {
+            "categories": [{"$sortByCount": "$category"}],
+            "brands": [
+                {"$match": {"brand": {"$nin": [None, ""]}}},
+                {"$sortByCount": "$brand"},
+                {"$limit": 50}
+            ],
+            "subcategories": [
+                {"$match": {"subcategory": {"$nin": [None, ""]}}},
+                {"$sortByCount": "$subcategory"},
+                {"$limit": 50}
+            ],
+            "price_ranges": [
+                {"$bucket": {
+                    "groupBy": "$price",
+                    "boundaries": FACET_PRICE_BOUNDARIES,
+                    "default": "more",
+                    "output": {"count": {"$sum": 1}}
+                }}
+            ],
+            "price_stats": [
+                {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}
+            ],
+            "flags": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "is_promo": {"$sum": {"$cond": [{"$eq": ["$is_promo", True]}, 1, 0]}},
+                    "is_new": {"$sum": {"$cond": [{"$eq": ["$is_new", True]}, 1, 0]}},
+                    "is_flash_sale": {"$sum": {"$cond": [{"$eq": ["$is_flash_sale", True]}, 1, 0]}},
+                    "in_stock": {"$sum": {"$cond": [{"$gt": [{"$ifNull": ["$stock", 0]}, 0]}, 1, 0]}},
+                    "on_order": {"$sum": {"$cond": [{"$eq": ["$is_on_order", True]}, 1, 0]}}
+                }}
+            ]
+        }}
+    ]
+
+def _replica_facets(products) -> dict:
+    """The _facet_pipeline result computed over replica documents"""
+    categories, brands, subcategories, buckets = Counter(), Counter(), Counter(), Counter()
+    flags = Counter()
+    prices = []
     for product in products:
-        for field in ['created_at', 'updated_at']:
-            if isinstance(product.get(field), str):
-                product[field] = datetime.fromisoformat(product[field])
+        categories[product.get("category")] += 1
+        if product.get("brand"):
+            brands[product["brand"]] += 1
+        if product.get("subcategory"):
+            subcategories[product["subcategory"]] += 1
+        price = product.get("price")
+        if isinstance(price, (int, float)):
+            prices.append(price)
+        if isinstance(price, (int, float)) and FACET_PRICE_BOUNDARIES[0] <= price < FACET_PRICE_BOUNDARIES[-1]:
+            buckets[FACET_PRICE_BOUNDARIES[bisect.bisect_right(FACET_PRICE_BOUNDARIES, price) - 1]] += 1
+        else:
+            buckets["more"] += 1
+        flags["total"] += 1
+        for flag in ("is_promo", "is_new", "is_flash_sale"):
+            flags[flag] += product.get(flag) is True
+        flags["in_stock"] += (product.get("stock") or 0) > 0
+        flags["on_order"] += product.get("is_on_order") is True
     
-    # Cache the result
-    if cache_key:
-        set_cached(cache_key, products, ttl=30)  # Cache for 30 seconds
+    if not flags:
+        return {}
     
-    return products
+    def by_count(counter, limit=None):
+        return [{"_id": value, "count": count} for value, count in counter.most_common(limit)]
+    
+    return {
+        "categories": by_count(categories),
+        "brands": by_count(brands, 50),
+        "subcategories": by_count(subcategories, 50),
+        # $bucket output order: boundaries ascending, then the default bucket
+        "price_ranges": [{"_id": b, "count": buckets[b]} for b in FACET_PRICE_BOUNDARIES if buckets[b]]
+        + ([{"_id": "more", "count": buckets["more"]}] if buckets["more"] else []),
+        "price_stats": [{"_id": None, "min": min(prices, default=None), "max": max(prices, default=None)}],
+        "flags": [{"_id": None, **flags}]
+    }
+
+def _format_facets(result: dict) -> dict:
+    def counts(rows):
+        return [{"value": row["_id"], "count": row["count"]} for row in rows if row["_id"] is not None]
+    
+    boundaries = FACET_PRICE_BOUNDARIES
+    price_ranges = []
+    for row in result.get("price_ranges", []):
+        if row["_id"] == "more":
+            price_ranges.append({"min": boundaries[-1], "max": None, "count": row["count"]})
+        else:
+            upper = boundaries[boundaries.index(row["_id"]) + 1]
+            price_ranges.append({"min": row["_id"], "max": upper, "count": row["count"]})
+    
+    stats = (result.get("price_stats") or [{}])[0]
+    flags = (result.get("flags") or [{}])[0]
+    total = flags.get("total", 0)
+    return {
+        "total": total,
+        "categories": counts(result.get("categories", [])),
+        "brands": counts(result.get("brands", [])),
+        "subcategories": counts(result.get("subcategories", [])),
+        "price_ranges": price_ranges,
+        "price": {"min": stats.get("min"), "max": stats.get("max")},
+        "flags": {key: flags.get(key, 0) for key in ("is_promo", "is_new", "is_flash_sale", "on_order")},
+        "stock": {"in_stock": flags.get("in_stock", 0), "out_of_stock": total - flags.get("in_stock", 0)}
+    }
+
+@api_router.get("/products/facets")
+async def get_product_facets(
+    category: Optional[str] = None,
+    featured: Optional[bool] = None,
+    is_new: Optional[bool] = None,
+    is_promo: Optional[bool] = None,
+    search: Optional[str] = None
+):
+    """Filter counts (brand, subcategory, price range, flags, stock) for a product listing"""
+    query = build_product_query(category, featured, is_new, is_promo)
+    
+    async def load_encoded():
+        if replica_ready() and CatalogReplica.supports(query) and (not search or search_index.ready):
+            ranked = search_index.search(search, limit=SEARCH_MAX_CANDIDATES) if search else None
+            matching = catalog_replica.match(query, [product_id for product_id, _ in ranked] if search else None)
+            return encode_response(_format_facets(_replica_facets(catalog_replica.documents(matching))))
+        
+        facet_query = query
+        if search and search_index.ready:
+            ranked = search_index.search(search, limit=SEARCH_MAX_CANDIDATES)
+            facet_query = {**query, "product_id": {"$in": [product_id for product_id, _ in ranked]}}
+        elif search:
+            facet_query = {**query, "$text": {"$search": search}}
+        results = await db.products.aggregate(_facet_pipeline(facet_query)).to_list(1)
+        return encode_response(_format_facets(results[0] if results else {}))
+    
+    # Keyed by the same filter signature as the cached product lists
+    if search:
+        encoded = await load_encoded()
+    else:
+        encoded = await cache.get_or_load(
+            f"products:facets:{category}:{featured}:{is_new}:{is_promo}",
+            load_encoded,
+            ttl=CATALOG_CACHE_TTL,
+            stale_ttl=CACHE_STALE_SECONDS
+        )
+    return encoded.to_response()
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"product_id": product_id}, {"_id": 0})
-    if not product:
+async def get_product(request: Request, product_id: str, profile: Optional[str] = None, fields: Optional[str] = None):
+    view = await resolve_product_profile(request, profile, fields, default="detail")
+    
+    async def load_encoded():
+        product = await db.products.find_one({"product_id": product_id}, view.projection)
+        return view.encode(product) if product else None
+    
+    encoded = await cache.get_or_load(
+        f"product:{product_id}:{view.name}",
+        load_encoded,
+        ttl=CATALOG_CACHE_TTL,
+        tags=["products", product_cache_tag(product_id)],
+        stale_ttl=CACHE_STALE_SECONDS
+    )
+    if encoded is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
-    for field in ['created_at', 'updated_at']:
-        if isinstance(product.get(field), str):
-            product[field] = datetime.fromisoformat(product[field])
-    
-    return product
+    return encoded.to_response()
 
 @api_router.post("/products", response_model=Product)
 async def create_product(product_data: ProductCreate, user: User = Depends(require_admin)):
@@ -1515,12 +2388,12 @@ async def create_product(product_data: ProductCreate, user: User = Depends(requi
     product_doc["product_id"] = product_id
     product_doc["created_at"] = now.isoformat()
     product_doc["updated_at"] = now.isoformat()
+    async with reserve_catalog_versions() as version:
+        product_doc["catalog_version"] = version
+        await db.products.insert_one(product_doc)
     
-    await db.products.insert_one(product_doc)
-    
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    # Clear products cache in every worker
+    await invalidate_catalog([product_id])
     
     product_doc["created_at"] = now
     product_doc["updated_at"] = now
@@ -1535,15 +2408,15 @@ async def update_product(product_id: str, product_data: ProductCreate, user: Use
     
     update_doc = product_data.model_dump()
     update_doc["updated_at"] = datetime.now(timezone.utc).isoformat()
+    async with reserve_catalog_versions() as version:
+        update_doc["catalog_version"] = version
+        await db.products.update_one(
+            {"product_id": product_id},
+            {"$set": update_doc}
+        )
     
-    await db.products.update_one(
-        {"product_id": product_id},
-        {"$set": update_doc}
-    )
-    
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    # Clear products cache in every worker
+    await invalidate_catalog([product_id])
     
     updated = await db.products.find_one({"product_id": product_id}, {"_id": 0})
     for field in ['created_at', 'updated_at']:
@@ -1560,9 +2433,10 @@ async def delete_product(product_id: str, user: User = Depends(require_admin)):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
-    # Clear products cache
-    clear_cache("products")
-    clear_cache("flash_sales")
+    await record_product_deletion(product_id)
+    
+    # Clear products cache in every worker
+    await invalidate_catalog([product_id])
     
     return {"message": "Produit supprimé"}
 
@@ -1571,36 +2445,54 @@ async def delete_product(product_id: str, user: User = Depends(require_admin)):
 @api_router.get("/flash-sales")
 async def get_flash_sales():
     """Get all active flash sale products with memory optimization and caching"""
-    # Check cache first
-    cached = get_cached("flash_sales")
-    if cached:
-        return cached
-    
+    async def load_encoded():
+        return encode_response(await _load_flash_sales())
+    
+    encoded = await cache.get_or_load(
+        "flash_sales",
+        load_encoded,
+        ttl=CATALOG_CACHE_TTL,
+        stale_ttl=CACHE_STALE_SECONDS
+    )
+    return encoded.to_response()
+
+# Use projection to limit data transfer
+FLASH_SALE_PROJECTION = {
+    "_id": 0,
+    "product_id": 1,
+    "name": 1,
+    "description": 1,
+    "short_description": 1,
+    "price": 1,
+    "original_price": 1,
+    "category": 1,
+    "subcategory": 1,
+    "images": {"$slice": 2},  # Limit to first 2 images
+    "stock": 1,
+    "featured": 1,
+    "is_new": 1,
+    "is_promo": 1,
+    "flash_sale_end": 1,
+    "flash_sale_price": 1,
+    "is_flash_sale": 1,
+    "specs": 1,
+    "created_at": 1,
+    "updated_at": 1
+}
+
+FLASH_SALE_LIMIT = 20
+
+async def _load_flash_sales() -> list:
+    """Active flash sale products, soonest ending first (uncached)"""
     now = datetime.now(timezone.utc).isoformat()
     
-    # Use projection to limit data transfer
-    projection = {
-        "_id": 0,
-        "product_id": 1,
-        "name": 1,
-        "description": 1,
-        "short_description": 1,
-        "price": 1,
-        "original_price": 1,
-        "category": 1,
-        "subcategory": 1,
-        "images": {"$slice": 2},  # Limit to first 2 images
-        "stock": 1,
-        "featured": 1,
-        "is_new": 1,
-        "is_promo": 1,
-        "flash_sale_end": 1,
-        "flash_sale_price": 1,
-        "is_flash_sale": 1,
-        "specs": 1,
-        "created_at": 1,
-        "updated_at": 1
-    }
+    if replica_ready():
+        active = [
+            product for product in catalog_replica.documents(catalog_replica.match({"is_flash_sale": True}))
+            if isinstance(product.get("flash_sale_end"), str) and product["flash_sale_end"] > now
+        ]
+        active.sort(key=lambda product: product["flash_sale_end"])
+        return [project(product, FLASH_SALE_PROJECTION) for product in active[:FLASH_SALE_LIMIT]]
     
     # Find products with active flash sales, limit to 20 to prevent memory issues
     products = await db.products.find(
@@ -1608,18 +2500,10 @@ async def get_flash_sales():
             "is_flash_sale": True,
             "flash_sale_end": {"$gt": now}
         },
-        projection
-    ).sort("flash_sale_end", 1).limit(20).to_list(20)
-    
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
-        if isinstance(product.get('updated_at'), str):
-            product['updated_at'] = datetime.fromisoformat(product['updated_at'])
-    
-    # Cache for 30 seconds
-    set_cached("flash_sales", products, ttl=30)
+        FLASH_SALE_PROJECTION
+    ).sort("flash_sale_end", 1).limit(FLASH_SALE_LIMIT).to_list(FLASH_SALE_LIMIT)
     
+    # Dates are stored as ISO strings and returned unchanged
     return products
 
 @api_router.post("/admin/flash-sales/{product_id}")
@@ -1636,126 +2520,484 @@ async def create_flash_sale(
     if not flash_sale_price or not flash_sale_end:
         raise HTTPException(status_code=400, detail="Prix et date de fin requis")
     
-    result = await db.products.update_one(
-        {"product_id": product_id},
-        {
-            "$set": {
-                "is_flash_sale": True,
-                "flash_sale_price": flash_sale_price,
-                "flash_sale_end": flash_sale_end,
-                "updated_at": datetime.now(timezone.utc).isoformat()
+    async with reserve_catalog_versions() as version:
+        result = await db.products.update_one(
+            {"product_id": product_id},
+            {
+                "$set": {
+                    "is_flash_sale": True,
+                    "flash_sale_price": flash_sale_price,
+                    "flash_sale_end": flash_sale_end,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                    "catalog_version": version
+                }
             }
-        }
-    )
+        )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
+    await invalidate_catalog([product_id])
+    
     return {"message": "Vente flash créée"}
 
 @api_router.delete("/admin/flash-sales/{product_id}")
 async def remove_flash_sale(product_id: str, user: User = Depends(require_admin)):
     """Remove flash sale from a product"""
-    result = await db.products.update_one(
-        {"product_id": product_id},
-        {
-            "$set": {
-                "is_flash_sale": False,
-                "flash_sale_price": None,
-                "flash_sale_end": None,
-                "updated_at": datetime.now(timezone.utc).isoformat()
+    async with reserve_catalog_versions() as version:
+        result = await db.products.update_one(
+            {"product_id": product_id},
+            {
+                "$set": {
+                    "is_flash_sale": False,
+                    "flash_sale_price": None,
+                    "flash_sale_end": None,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                    "catalog_version": version
+                }
             }
-        }
-    )
+        )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
+    await invalidate_catalog([product_id])
+    
     return {"message": "Vente flash supprimée"}
 
 # ============== SIMILAR PRODUCTS ROUTE ==============
 
+# Content-based neighbours (see services/similarity_service.py), computed in a
+# worker thread at startup and nightly, patched per product by the catalog listener.
+# Without numpy the routes keep the category heuristic below.
+similarity_index = SimilarityIndex()
+SIMILARITY_INDEX_PROJECTION = {
+    "_id": 0, "product_id": 1, "name": 1, "brand": 1, "category": 1, "subcategory": 1,
+    "short_description": 1, "description": 1, "specs": 1, "price": 1
+}
+
+# Catalog changes seen while a rebuild runs are replayed onto the new index
+# before the swap; a full refresh requested meanwhile runs another rebuild
+similarity_rebuild = {"running": False, "changed": set(), "rerun": False}
+
+async def _apply_similarity_changes(index: SimilarityIndex, product_ids: List[str]):
+    """Re-read the products into index, dropping those that no longer exist"""
+    docs = await db.products.find({"product_id": {"$in": product_ids}}, SIMILARITY_INDEX_PROJECTION).to_list(None)
+    found = set()
+    for doc in docs:
+        index.upsert(doc)
+        found.add(doc["product_id"])
+    for product_id in product_ids:
+        if product_id not in found:
+            index.remove(product_id)
+
+async def rebuild_similarity_index():
+    """Recompute every neighbour list off the event loop, then swap the index in"""
+    global similarity_index
+    if not SimilarityIndex.available():
+        return
+    if similarity_rebuild["running"]:
+        similarity_rebuild["rerun"] = True
+        return
+    similarity_rebuild.update(running=True, changed=set(), rerun=False)
+    try:
+        docs = await db.products.find({}, SIMILARITY_INDEX_PROJECTION).to_list(None)
+        index = SimilarityIndex()
+        await asyncio.to_thread(index.build, docs)
+        # Nothing awaits between the last empty check and the swap
+        while similarity_rebuild["changed"]:
+            changed, similarity_rebuild["changed"] = similarity_rebuild["changed"], set()
+            await _apply_similarity_changes(index, list(changed))
+        similarity_index = index
+        logger.info(f"Similarity index built: {index.stats()}")
+    except Exception as e:
+        logger.error(f"Similarity index rebuild failed: {e}")
+    finally:
+        similarity_rebuild["running"] = False
+    if similarity_rebuild["rerun"]:
+        await rebuild_similarity_index()
+
+async def refresh_similarity_index(product_ids=None):
+    """Catalog listener: update the changed products' vectors and affected lists"""
+    if product_ids is None:
+        await rebuild_similarity_index()
+        return
+    if similarity_rebuild["running"]:
+        similarity_rebuild["changed"].update(product_ids)
+    if similarity_index.ready:
+        await _apply_similarity_changes(similarity_index, product_ids)
+
+catalog_listeners.append(refresh_similarity_index)
+
+async def _ranked_products(
+    ranked_ids: list,
+    limit: int,
+    projection: Optional[dict] = None,
+    in_stock: bool = False
+) -> list:
+    """Fetch products by id in one query, keeping the ranking order"""
+    if not ranked_ids:
+        return []
+    if replica_ready():
+        found = catalog_replica.get_many(ranked_ids, None)
+        ranked = [found[pid] for pid in ranked_ids if pid in found]
+        if in_stock:
+            ranked = [p for p in ranked if (p.get("stock") or 0) > 0]
+        return [project(p, projection) for p in ranked[:limit]]
+    
+    # Every profile projection includes product_id, which the ranking needs
+    query = {"product_id": {"$in": ranked_ids}}
+    if in_stock:
+        query["stock"] = {"$gt": 0}
+    products = await db.products.find(query, projection or {"_id": 0}).to_list(len(ranked_ids))
+    rank = {product_id: position for position, product_id in enumerate(ranked_ids)}
+    products.sort(key=lambda p: rank[p["product_id"]])
+    return products[:limit]
+
 @api_router.get("/products/{product_id}/similar")
-async def get_similar_products(product_id: str, limit: int = 6):
-    """Get similar products based on category"""
+async def get_similar_products(
+    request: Request,
+    product_id: str,
+    limit: int = 6,
+    profile: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get similar products (content similarity, category fallback)"""
+    limit = max(1, min(limit, 24))
+    view = await resolve_product_profile(request, profile, fields, default="card")
+    neighbours = similarity_index.neighbours(product_id, limit)
+    if len(neighbours) >= limit:
+        similar = await _ranked_products([other for other, _ in neighbours], limit, view.projection)
+        return view.encode_list(similar).to_response()
+    
     # Get the current product
-    product = await db.products.find_one({"product_id": product_id}, {"_id": 0})
+    product = await db.products.find_one({"product_id": product_id}, {"_id": 0, "product_id": 1, "category": 1})
     if not product:
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     
+    return view.encode_list(await _find_similar_products(product, limit, view.projection)).to_response()
+
+async def _find_similar_products(product: dict, limit: int = 6, projection: Optional[dict] = None) -> list:
+    product_id = product["product_id"]
+    projection = projection or {"_id": 0}
+    
+    neighbours = similarity_index.neighbours(product_id, limit)
+    if neighbours:
+        similar = await _ranked_products([other for other, _ in neighbours], limit, projection)
+        return await _top_up_with_featured(product_id, similar, limit, projection)
+    
+    if replica_ready():
+        similar, _ = catalog_replica.find({"category": product["category"]}, projection, limit, exclude=[product_id])
+        return await _top_up_with_featured(product_id, similar, limit, projection)
+    
     # Find products in the same category, excluding current product
     similar = await db.products.find(
         {
             "category": product["category"],
             "product_id": {"$ne": product_id}
         },
-        {"_id": 0}
+        projection
     ).limit(limit).to_list(limit)
     
+    return await _top_up_with_featured(product_id, similar, limit, projection)
+
+async def _top_up_with_featured(product_id: str, similar: list, limit: int, projection: Optional[dict] = None) -> list:
     # If not enough, fill with featured products
     if len(similar) < limit:
         more_needed = limit - len(similar)
         existing_ids = [p["product_id"] for p in similar] + [product_id]
         
-        featured = await db.products.find(
-            {
-                "product_id": {"$nin": existing_ids},
-                "featured": True
-            },
-            {"_id": 0}
-        ).limit(more_needed).to_list(more_needed)
+        if replica_ready():
+            featured, _ = catalog_replica.find({"featured": True}, projection, more_needed, exclude=existing_ids)
+        else:
+            featured = await db.products.find(
+                {
+                    "product_id": {"$nin": existing_ids},
+                    "featured": True
+                },
+                projection or {"_id": 0}
+            ).limit(more_needed).to_list(more_needed)
         
         similar.extend(featured)
     
-    for p in similar:
-        if isinstance(p.get('created_at'), str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p.get('updated_at'), str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
-    
     return similar
 
+# ============== RECOMMENDATIONS ==============
+
+# Item-to-item co-occurrence over paid orders (see services/recommendation_service.py).
+# Built at startup and nightly; each newly paid order is counted in every worker.
+RECOMMENDATION_MEASURE = os.environ.get("RECOMMENDATION_MEASURE", "jaccard")
+if RECOMMENDATION_MEASURE not in SIMILARITY_MEASURES:
+    # Module level: the app logger is configured further down
+    logging.warning(
+        f"Unknown RECOMMENDATION_MEASURE {RECOMMENDATION_MEASURE!r} "
+        f"(expected one of {', '.join(SIMILARITY_MEASURES)}), using jaccard"
+    )
+    RECOMMENDATION_MEASURE = "jaccard"
+recommendation_index = CoOccurrenceIndex(measure=RECOMMENDATION_MEASURE)
+FREQUENTLY_BOUGHT_LIMIT = 3
+
+async def rebuild_recommendations():
+    """Recount every paid order"""
+    try:
+        # Orders counted here must not be counted again by record_paid_order
+        await db.orders.update_many(
+            {"payment_status": "paid", "recommendations_counted": {"$ne": True}},
+            {"$set": {"recommendations_counted": True}}
+        )
+        orders = []
+        async for order in db.orders.find({"payment_status": "paid"}, {"_id": 0, "items.product_id": 1}):
+            orders.append([item.get("product_id") for item in order.get("items", [])])
+        recommendation_index.build(orders)
+        logger.info(f"Recommendation index built: {recommendation_index.stats()}")
+    except Exception as e:
+        logger.error(f"Recommendation index rebuild failed: {e}")
+
+async def record_paid_order(order_id: str):
+    """Count a newly paid order once, in this worker and (through the bus) the others"""
+    order = await db.orders.find_one_and_update(
+        {"order_id": order_id, "payment_status": "paid", "recommendations_counted": {"$ne": True}},
+        {"$set": {"recommendations_counted": True}},
+        projection={"_id": 0, "items.product_id": 1}
+    )
+    if not order:
+        return
+    product_ids = [item.get("product_id") for item in order.get("items", []) if item.get("product_id")]
+    if len(product_ids) < 2:
+        return
+    recommendation_index.add_order(product_ids)
+    await invalidate_cache(["recommendations"], product_ids)
+
+async def _co_purchased_products(
+    product_id: str,
+    limit: int = FREQUENTLY_BOUGHT_LIMIT,
+    projection: Optional[dict] = None
+) -> list:
+    """In-stock products most often bought with product_id, best first"""
+    ranked = [other for other, _ in recommendation_index.neighbours(product_id)]
+    return await _ranked_products(ranked, limit, projection, in_stock=True)
+
 @api_router.get("/products/{product_id}/frequently-bought")
-async def get_frequently_bought(product_id: str):
-    """Get products frequently bought together - based on same category and price range"""
-    product = await db.products.find_one({"product_id": product_id}, {"_id": 0})
-    if not product:
-        return []
+async def get_frequently_bought(
+    request: Request,
+    product_id: str,
+    profile: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get products frequently bought together - from paid orders, topped up by category and price range"""
+    view = await resolve_product_profile(request, profile, fields, default="card")
+    bundles = await _co_purchased_products(product_id, projection=view.projection)
+    if len(bundles) >= FREQUENTLY_BOUGHT_LIMIT:
+        return view.encode_list(bundles).to_response()
     
-    # Find complementary products in same category or related categories
+    product = await db.products.find_one({"product_id": product_id}, {"_id": 0, "product_id": 1, "category": 1, "price": 1})
+    if not product:
+        return view.encode_list([]).to_response()
+    
+    return view.encode_list(await _find_frequently_bought(product, bundles, view.projection)).to_response()
+
+async def _find_frequently_bought(
+    product: dict,
+    bundles: Optional[list] = None,
+    projection: Optional[dict] = None
+) -> list:
+    product_id = product["product_id"]
+    projection = projection or {"_id": 0}
+    if bundles is None:
+        bundles = await _co_purchased_products(product_id, projection=projection)
+    if len(bundles) >= FREQUENTLY_BOUGHT_LIMIT:
+        return bundles
+    
+    # Not enough purchase history: complete with products from the same
+    # category in a similar price range
     category = product.get("category", "")
     price = product.get("price", 0)
+    exclude = [product_id] + [p["product_id"] for p in bundles]
     
     # Products in similar price range (±50%)
     min_price = int(price * 0.3)
     max_price = int(price * 1.5)
     
     # Find products that complement this one
-    bundles = await db.products.find({
-        "product_id": {"$ne": product_id},
+    needed = FREQUENTLY_BOUGHT_LIMIT - len(bundles)
+    bundles = bundles + await db.products.find({
+        "product_id": {"$nin": exclude},
         "category": category,
         "price": {"$gte": min_price, "$lte": max_price},
         "stock": {"$gt": 0}
-    }, {"_id": 0}).limit(3).to_list(3)
+    }, projection).limit(needed).to_list(needed)
     
     # If not enough, get from other categories
     if len(bundles) < 2:
         more = await db.products.find({
-            "product_id": {"$ne": product_id, "$nin": [p["product_id"] for p in bundles]},
+            "product_id": {"$nin": exclude + [p["product_id"] for p in bundles]},
             "stock": {"$gt": 0}
-        }, {"_id": 0}).limit(3 - len(bundles)).to_list(3)
+        }, projection).limit(FREQUENTLY_BOUGHT_LIMIT - len(bundles)).to_list(FREQUENTLY_BOUGHT_LIMIT)
         bundles.extend(more)
     
-    return bundles[:3]
+    return bundles[:FREQUENTLY_BOUGHT_LIMIT]
+
+# ============== PRODUCT PAGE BUNDLE ==============
+
+BUNDLE_REVIEWS_LIMIT = 20
+
+@api_router.get("/products/{product_id}/bundle")
+async def get_product_bundle(product_id: str):
+    """
+    Everything the product page needs in one response: product, reviews,
+    similar and frequently bought products. The product is read once and
+    the dependent queries run concurrently; the ETag covers the whole payload.
+    """
+    async def load_encoded():
+        product = await db.products.find_one({"product_id": product_id}, {"_id": 0})
+        if not product:
+            return None
+        cards = PRODUCT_PROFILES["card"]
+        reviews, similar, frequently_bought = await asyncio.gather(
+            _load_product_reviews(product_id, BUNDLE_REVIEWS_LIMIT),
+            _find_similar_products(product, projection=cards.projection),
+            _find_frequently_bought(product, projection=cards.projection)
+        )
+        return encode_response({
+            "product": PRODUCT_ADAPTER.dump_python(PRODUCT_ADAPTER.validate_python(product), mode="json"),
+            "reviews": reviews,
+            "similar": cards.dump_list(similar),
+            "frequently_bought": cards.dump_list(frequently_bought)
+        })
+    
+    encoded = await cache.get_or_load(
+        f"product:bundle:{product_id}",
+        load_encoded,
+        ttl=CATALOG_CACHE_TTL,
+        tags=["products", product_cache_tag(product_id)],
+        stale_ttl=CACHE_STALE_SECONDS
+    )
+    if encoded is None:
+        raise HTTPException(status_code=404, detail="Produit non trouvé")
+    
+    return encoded.to_response()
 
 # ============== REVIEWS ROUTES ==============
 
+RATING_VALUES = (1, 2, 3, 4, 5)
+# Global counters document in db.review_stats
+REVIEW_STATS_ID = "global"
+
+async def apply_rating_change(product_id: str, rating: int, delta: int):
+    """
+    Add (delta=1) or remove (delta=-1) one rating from the product's summary.
+    Counters and the average are updated in a single atomic pipeline update.
+    """
+    def plus(field):
+        return {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}
+    
+    async with reserve_catalog_versions() as version:
+        await db.products.update_one(
+            {"product_id": product_id},
+            [
+                {"$set": {
+                    "catalog_version": version,
+                    "rating_count": plus("rating_count"),
+                    "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, delta * rating]},
+                    f"rating_histogram.{rating}": plus(f"rating_histogram.{rating}")
+                }},
+                {"$set": {
+                    "rating_avg": {"$cond": [
+                        {"$gt": ["$rating_count", 0]},
+                        {"$round": [{"$divide": ["$rating_sum", "$rating_count"]}, 1]},
+                        0
+                    ]}
+                }}
+            ]
+        )
+    await db.review_stats.update_one(
+        {"_id": REVIEW_STATS_ID},
+        {"$inc": {"total_reviews": delta, "rating_sum": delta * rating, f"histogram.{rating}": delta}},
+        upsert=True
+    )
+    # Only this product's detail and bundle embed the summary; listings catch up on TTL
+    await invalidate_cache([product_cache_tag(product_id)], [product_id])
+
+async def reconcile_rating_summaries():
+    """Recompute every product's rating summary from the reviews and repair drift"""
+    try:
+        pipeline = [
+            {"$group": {
+                "_id": {"product_id": "$product_id", "rating": "$rating"},
+                "count": {"$sum": 1}
+            }}
+        ]
+        expected = {}
+        async for row in db.reviews.aggregate(pipeline):
+            product_id, rating = row["_id"].get("product_id"), row["_id"].get("rating")
+            if not product_id or rating not in RATING_VALUES:
+                continue
+            summary = expected.setdefault(product_id, {str(r): 0 for r in RATING_VALUES})
+            summary[str(rating)] += row["count"]
+        
+        # Global counters (reviews of deleted products included, as before).
+        # Repairs are compare-and-set on the counters just read: a review
+        # counted by apply_rating_change meanwhile makes them skip until the next run
+        histogram = {str(r): sum(summary[str(r)] for summary in expected.values()) for r in RATING_VALUES}
+        stats = {
+            "total_reviews": sum(histogram.values()),
+            "rating_sum": sum(int(r) * n for r, n in histogram.items()),
+            "histogram": histogram,
+            "reconciled_at": datetime.now(timezone.utc).isoformat()
+        }
+        current = await db.review_stats.find_one({"_id": REVIEW_STATS_ID})
+        if current is None:
+            await db.review_stats.replace_one({"_id": REVIEW_STATS_ID}, stats, upsert=True)
+        else:
+            await db.review_stats.replace_one(
+                {"_id": REVIEW_STATS_ID, "total_reviews": current.get("total_reviews"),
+                 "rating_sum": current.get("rating_sum")},
+                stats
+            )
+        
+        drifted = []
+        projection = {"_id": 0, "product_id": 1, "rating_count": 1, "rating_sum": 1, "rating_histogram": 1}
+        async for product in db.products.find({}, projection):
+            histogram = expected.get(product["product_id"], {str(r): 0 for r in RATING_VALUES})
+            count = sum(histogram.values())
+            total = sum(int(r) * n for r, n in histogram.items())
+            if (product.get("rating_count") == count and product.get("rating_sum") == total
+                    and product.get("rating_histogram") == histogram):
+                continue
+            drifted.append((product, count, total, histogram))
+        
+        repaired = []
+        # Each repair stamps its own version so the change feed and replicas pick it up
+        async with reserve_catalog_versions(len(drifted)) as last_version:
+            first_version = last_version - len(drifted) + 1
+            for position, (product, count, total, histogram) in enumerate(drifted):
+                result = await db.products.update_one(
+                    {"product_id": product["product_id"], "rating_count": product.get("rating_count"),
+                     "rating_sum": product.get("rating_sum")},
+                    {"$set": {
+                        "catalog_version": first_version + position,
+                        "rating_count": count,
+                        "rating_sum": total,
+                        "rating_histogram": histogram,
+                        "rating_avg": round(total / count, 1) if count else 0
+                    }}
+                )
+                if result.matched_count:
+                    repaired.append(product["product_id"])
+        
+        if repaired:
+            logger.info(f"Rating summaries repaired for {len(repaired)} products")
+            await invalidate_catalog(repaired)
+    except Exception as e:
+        logger.error(f"Rating summary reconciliation failed: {e}")
+
 @api_router.get("/products/{product_id}/reviews")
 async def get_product_reviews(product_id: str, limit: int = 50):
     """Get reviews for a product with pagination to prevent memory issues"""
     # Enforce maximum limit
-    limit = min(limit, 100)
-    
+    return await _load_product_reviews(product_id, min(limit, 100))
+
+async def _load_product_reviews(product_id: str, limit: int) -> dict:
     # Use projection to limit data transfer
     projection = {
         "_id": 0,
@@ -1772,43 +3014,22 @@ async def get_product_reviews(product_id: str, limit: int = 50):
         "created_at": 1
     }
     
-    reviews = await db.reviews.find(
-        {"product_id": product_id},
-        projection
-    ).sort("created_at", -1).limit(limit).to_list(limit)
-    
-    # Calculate average rating efficiently
-    pipeline = [
-        {"$match": {"product_id": product_id}},
-        {"$group": {
-            "_id": None,
-            "avg_rating": {"$avg": "$rating"},
-            "total_reviews": {"$sum": 1},
-            "rating_1": {"$sum": {"$cond": [{"$eq": ["$rating", 1]}, 1, 0]}},
-            "rating_2": {"$sum": {"$cond": [{"$eq": ["$rating", 2]}, 1, 0]}},
-            "rating_3": {"$sum": {"$cond": [{"$eq": ["$rating", 3]}, 1, 0]}},
-            "rating_4": {"$sum": {"$cond": [{"$eq": ["$rating", 4]}, 1, 0]}},
-            "rating_5": {"$sum": {"$cond": [{"$eq": ["$rating", 5]}, 1, 0]}}
-        }}
-    ]
-    
-    stats = await db.reviews.aggregate(pipeline).to_list(1)
-    
-    if stats:
-        stat = stats[0]
-        avg_rating = round(stat["avg_rating"], 1) if stat["avg_rating"] else 0
-        total_reviews = stat["total_reviews"]
-        distribution = {
-            1: stat["rating_1"],
-            2: stat["rating_2"],
-            3: stat["rating_3"],
-            4: stat["rating_4"],
-            5: stat["rating_5"]
-        }
-    else:
-        avg_rating = 0
-        total_reviews = 0
-        distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    # Summary maintained on the product by apply_rating_change, read alongside the page
+    reviews, summary = await asyncio.gather(
+        db.reviews.find(
+            {"product_id": product_id},
+            projection
+        ).sort("created_at", -1).limit(limit).to_list(limit),
+        db.products.find_one(
+            {"product_id": product_id},
+            {"_id": 0, "rating_avg": 1, "rating_count": 1, "rating_histogram": 1}
+        )
+    )
+    summary = summary or {}
+    histogram = summary.get("rating_histogram") or {}
+    avg_rating = summary.get("rating_avg") or 0
+    total_reviews = summary.get("rating_count") or 0
+    distribution = {rating: histogram.get(str(rating), 0) for rating in RATING_VALUES}
     
     return {
         "reviews": reviews,
@@ -1863,6 +3084,8 @@ async def create_review(product_id: str, review_data: ReviewCreate, user: User =
     }
     
     await db.reviews.insert_one(review_doc)
+    await apply_rating_change(product_id, review_data.rating, 1)
+    await invalidate_cache(["reviews"])
     
     return {"message": "Avis publié avec succès", "review_id": review_id, "verified_purchase": verified_purchase}
 
@@ -1887,7 +3110,10 @@ async def delete_review(review_id: str, user: User = Depends(require_auth)):
     if review["user_id"] != user.user_id and user.role != "admin":
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    await db.reviews.delete_one({"review_id": review_id})
+    result = await db.reviews.delete_one({"review_id": review_id})
+    if result.deleted_count and review.get("rating") in RATING_VALUES:
+        await apply_rating_change(review["product_id"], review["rating"], -1)
+    await invalidate_cache(["reviews"])
     return {"message": "Avis supprimé"}
 
 # ============== STOCK NOTIFICATION ==============
@@ -2196,11 +3422,37 @@ async def delete_promo_code(promo_id: str, user: User = Depends(require_admin)):
 async def validate_advanced_promo_code(request: Request):
     """Validate a promo code for checkout"""
     body = await request.json()
-    code = body.get("code", "").upper()
+    code = body.get("code", "")
     cart_total = body.get("cart_total", 0)
     cart_items = body.get("cart_items", [])
     user_id = body.get("user_id")
     
+    # Price the items from the catalog rather than trusting the client
+    if cart_items:
+        products = await ProductLoader(db.products, {"_id": 0, "product_id": 1, "price": 1, "category": 1}).load_many(
+            item.get("product_id") for item in cart_items
+        )
+        cart_items = [
+            {
+                "product_id": item["product_id"],
+                "price": products[item["product_id"]].get("price", 0),
+                "quantity": item.get("quantity", 1),
+                "category": products[item["product_id"]].get("category")
+            }
+            for item in cart_items if item.get("product_id") in products
+        ]
+        cart_total = sum(item["price"] * item["quantity"] for item in cart_items)
+    
+    return await evaluate_promo_code(code, cart_total, cart_items, user_id)
+
+async def evaluate_promo_code(code: str, cart_total: int, cart_items: list, user_id: Optional[str]) -> dict:
+    """
+    Discount granted by a promo code, newsletter code or loyalty coupon for a
+    cart (items: product_id, price, quantity and optionally category).
+    Raises HTTPException when the code does not apply.
+    """
+    code = code.upper()
+    
     # Find promo code
     promo = await db.promo_codes.find_one({"code": code, "is_active": True}, {"_id": 0})
     
@@ -2216,6 +3468,9 @@ async def validate_advanced_promo_code(request: Request):
                 "message": f"-{subscriber['discount_percent']}% sur votre commande",
                 "source": "newsletter"
             }
+        coupon = await find_loyalty_coupon(code, user_id)
+        if coupon:
+            return loyalty_coupon_discount(coupon, cart_total)
         raise HTTPException(status_code=404, detail="Code promo invalide ou expiré")
     
     now = datetime.now(timezone.utc)
@@ -2252,9 +3507,12 @@ async def validate_advanced_promo_code(request: Request):
     applicable_total = cart_total
     if promo.get("categories"):
         applicable_total = 0
+        products = await ProductLoader(db.products, {"_id": 0, "category": 1}).load_many(
+            item.get("product_id") for item in cart_items if "category" not in item
+        )
         for item in cart_items:
-            product = await db.products.find_one({"product_id": item.get("product_id")}, {"category": 1})
-            if product and product.get("category") in promo["categories"]:
+            category = item["category"] if "category" in item else products.get(item.get("product_id"), {}).get("category")
+            if category in promo["categories"]:
                 applicable_total += item.get("price", 0) * item.get("quantity", 1)
         
         if applicable_total == 0:
@@ -2338,6 +3596,9 @@ async def apply_promo_code(request: Request):
 @api_router.get("/reviews/featured")
 async def get_featured_reviews():
     """Get featured reviews for homepage testimonials section"""
+    return (await get_review_highlights())["featured_response"].to_response()
+
+async def _load_featured_reviews() -> list:
     # Get reviews with high ratings (4-5 stars) and verified purchases
     reviews = await db.reviews.find(
         {"rating": {"$gte": 4}, "verified_purchase": True},
@@ -2345,12 +3606,12 @@ async def get_featured_reviews():
     ).sort("created_at", -1).limit(10).to_list(10)
     
     # Enrich with product info
+    products = await ProductLoader(db.products, {"_id": 0, "name": 1, "images": {"$slice": 1}}).load_many(
+        review["product_id"] for review in reviews
+    )
     enriched_reviews = []
     for review in reviews:
-        product = await db.products.find_one(
-            {"product_id": review["product_id"]},
-            {"_id": 0, "name": 1, "images": 1}
-        )
+        product = products.get(review["product_id"])
         if product:
             review["product_name"] = product.get("name")
             review["product_image"] = product.get("images", [""])[0] if product.get("images") else ""
@@ -2361,44 +3622,62 @@ async def get_featured_reviews():
 @api_router.get("/reviews/stats")
 async def get_reviews_stats():
     """Get overall review statistics for trust indicators"""
-    pipeline = [
-        {"$group": {
-            "_id": None,
-            "total_reviews": {"$sum": 1},
-            "average_rating": {"$avg": "$rating"},
-            "five_star": {"$sum": {"$cond": [{"$eq": ["$rating", 5]}, 1, 0]}},
-            "four_star": {"$sum": {"$cond": [{"$eq": ["$rating", 4]}, 1, 0]}},
-            "three_star": {"$sum": {"$cond": [{"$eq": ["$rating", 3]}, 1, 0]}},
-            "two_star": {"$sum": {"$cond": [{"$eq": ["$rating", 2]}, 1, 0]}},
-            "one_star": {"$sum": {"$cond": [{"$eq": ["$rating", 1]}, 1, 0]}}
-        }}
-    ]
-    
-    stats = await db.reviews.aggregate(pipeline).to_list(1)
-    
-    if stats:
-        return {
-            "total_reviews": stats[0]["total_reviews"],
-            "average_rating": round(stats[0]["average_rating"], 1),
-            "rating_distribution": {
-                "5": stats[0]["five_star"],
-                "4": stats[0]["four_star"],
-                "3": stats[0]["three_star"],
-                "2": stats[0]["two_star"],
-                "1": stats[0]["one_star"]
-            },
-            "satisfaction_rate": round(
-                (stats[0]["five_star"] + stats[0]["four_star"]) / stats[0]["total_reviews"] * 100
-            ) if stats[0]["total_reviews"] > 0 else 0
-        }
-    
+    return (await get_review_highlights())["stats_response"].to_response()
+
+def _format_reviews_stats(total_reviews: int, rating_sum: int, histogram: dict) -> dict:
+    counts = {str(rating): histogram.get(str(rating), 0) for rating in (5, 4, 3, 2, 1)}
     return {
-        "total_reviews": 0,
-        "average_rating": 0,
-        "rating_distribution": {"5": 0, "4": 0, "3": 0, "2": 0, "1": 0},
-        "satisfaction_rate": 0
+        "total_reviews": total_reviews,
+        "average_rating": round(rating_sum / total_reviews, 1) if total_reviews else 0,
+        "rating_distribution": counts,
+        "satisfaction_rate": round((counts["5"] + counts["4"]) / total_reviews * 100) if total_reviews > 0 else 0
     }
 
+async def _load_reviews_stats() -> dict:
+    """Global stats from the counters document kept by apply_rating_change"""
+    stats = await db.review_stats.find_one({"_id": REVIEW_STATS_ID})
+    if stats:
+        return _format_reviews_stats(stats.get("total_reviews", 0), stats.get("rating_sum", 0), stats.get("histogram") or {})
+    # Counters not created yet (reconcile_rating_summaries writes them): count directly
+    return await _aggregate_reviews_stats()
+
+async def _aggregate_reviews_stats() -> dict:
+    rows = await db.reviews.aggregate([
+        {"$group": {"_id": "$rating", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    histogram = {str(row["_id"]): row["count"] for row in rows if row["_id"] in RATING_VALUES}
+    return _format_reviews_stats(
+        sum(histogram.values()),
+        sum(int(rating) * count for rating, count in histogram.items()),
+        histogram
+    )
+
+# Review highlights (global stats + featured testimonials) are kept in memory,
+# refreshed after review or product invalidations and every few minutes.
+REVIEW_HIGHLIGHTS_TAGS = ("reviews", "products")
+REVIEW_HIGHLIGHTS_REFRESH_MINUTES = 10
+review_highlights = {}
+
+async def refresh_review_highlights(notify_home: bool = True) -> dict:
+    stats, featured = await asyncio.gather(_load_reviews_stats(), _load_featured_reviews())
+    review_highlights.update(
+        stats=stats,
+        featured=featured,
+        stats_response=encode_response(stats),
+        featured_response=encode_response(featured)
+    )
+    if notify_home:
+        # The homepage embeds both
+        schedule_snapshot_refresh("home", build_home_snapshot)
+    return review_highlights
+
+async def get_review_highlights() -> dict:
+    if not review_highlights:
+        return await refresh_review_highlights(notify_home=False)
+    return review_highlights
+
+snapshot_subscriptions.append((REVIEW_HIGHLIGHTS_TAGS, "review_highlights", refresh_review_highlights))
+
 # ============== REFERRAL SYSTEM ==============
 
 REFERRAL_CONFIG = {
@@ -3535,7 +4814,7 @@ async def forgot_password(data: PasswordResetRequest):
         "user_id": user["user_id"],
         "email": data.email,
         "token": reset_token,
-        "expires_at": expires_at.isoformat(),
+        "expires_at": expires_at,
         "used": False,
         "created_at": datetime.now(timezone.utc).isoformat()
     })
@@ -3565,8 +4844,12 @@ async def reset_password(data: PasswordResetConfirm):
     if not reset_record:
         raise HTTPException(status_code=400, detail="Lien invalide ou expiré")
     
-    # Check expiration
-    expires_at = datetime.fromisoformat(reset_record["expires_at"])
+    # Check expiration (native Date, or ISO string on older records)
+    expires_at = reset_record["expires_at"]
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at)
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail="Ce lien a expiré. Veuillez en demander un nouveau.")
     
@@ -3725,6 +5008,10 @@ async def process_abandoned_carts():
         "abandoned_email_sent": {"$ne": True}
     }).to_list(50)
     
+    products = await ProductLoader(db.products, {"_id": 0, "name": 1, "price": 1, "images": {"$slice": 1}}).load_many(
+        item["product_id"] for cart in abandoned_carts for item in cart.get("items", [])
+    )
+    
     for cart in abandoned_carts:
         # Get user email
         email = None
@@ -3743,7 +5030,7 @@ async def process_abandoned_carts():
         items = []
         total = 0
         for item in cart.get("items", []):
-            product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+            product = products.get(item["product_id"])
             if product:
                 items.append({
                     "name": product["name"],
@@ -4162,6 +5449,17 @@ async def process_wishlist_reminders():
             ]
         }, {"_id": 0}).to_list(50)
         
+        # Items are {"product_id", "added_at"} (older wishlists stored bare ids)
+        def wishlist_product_ids(wishlist):
+            return [
+                item.get("product_id") if isinstance(item, dict) else item
+                for item in wishlist.get("items", [])[:3]  # Max 3 items
+            ]
+        
+        products = await ProductLoader(db.products, {"_id": 0, "name": 1, "price": 1, "images": {"$slice": 1}}).load_many(
+            product_id for wishlist in wishlists for product_id in wishlist_product_ids(wishlist)
+        )
+        
         sent_count = 0
         for wishlist in wishlists:
             user_id = wishlist.get("user_id")
@@ -4174,8 +5472,8 @@ async def process_wishlist_reminders():
             
             # Get wishlist items details
             items_html = ""
-            for item_id in wishlist.get("items", [])[:3]:  # Max 3 items
-                product = await db.products.find_one({"product_id": item_id}, {"_id": 0})
+            for item_id in wishlist_product_ids(wishlist):
+                product = products.get(item_id)
                 if product:
                     items_html += f"""
                     <div style="display: inline-block; width: 150px; margin: 10px; text-align: center; vertical-align: top;">
@@ -5010,15 +6308,8 @@ async def get_delivery_zones():
         "zones": zones
     }
 
-@api_router.post("/delivery/calculate")
-async def calculate_delivery(request: Request):
-    """Calculate shipping cost based on address"""
-    body = await request.json()
-    city = body.get("city", "")
-    address = body.get("address", "")
-    region = body.get("region", "")
-    
-    # If region is not Dakar, it's autre région
+def calculate_delivery_for_address(city: str, address: str = "", region: str = "") -> dict:
+    """Shipping cost for a checkout address (any region outside Dakar is autre région)"""
     if region and region.lower() not in ["dakar", "région de dakar", "region de dakar"]:
         return {
             "zone": "autre_region",
@@ -5027,26 +6318,174 @@ async def calculate_delivery(request: Request):
             "message": "Livraison Autre Région: 3 500 FCFA"
         }
     
-    result = calculate_shipping_cost(city, address)
-    return result
+    return calculate_shipping_cost(city, address)
+
+@api_router.post("/delivery/calculate")
+async def calculate_delivery(request: Request):
+    """Calculate shipping cost based on address"""
+    body = await request.json()
+    return calculate_delivery_for_address(body.get("city", ""), body.get("address", ""), body.get("region", ""))
 
 @api_router.get("/delivery/calculate")
 async def calculate_delivery_get(city: str = "", address: str = "", region: str = ""):
     """Calculate shipping cost based on address (GET version)"""
-    # If region is not Dakar, it's autre région
-    if region and region.lower() not in ["dakar", "région de dakar", "region de dakar"]:
-        return {
-            "zone": "autre_region",
-            "zone_label": "Autre Région",
-            "shipping_cost": 3500,
-            "message": "Livraison Autre Région: 3 500 FCFA"
-        }
-    
-    result = calculate_shipping_cost(city, address)
-    return result
+    return calculate_delivery_for_address(city, address, region)
 
 # ============== CART ROUTES ==============
 
+# Product fields needed to render cart and wishlist lines
+CART_PRODUCT_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "images": {"$slice": 1}, "stock": 1}
+
+async def check_cart_stock(product_id: str, quantity: int):
+    """
+    404 for unknown products, 400 when stock cannot cover quantity; products
+    sold on order are not limited, as in stock_guard at checkout
+    """
+    product = await db.products.find_one({"product_id": product_id}, {"_id": 0, "stock": 1, "is_on_order": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="Produit non trouvé")
+    if product.get("stock", 0) < quantity and not product.get("is_on_order"):
+        raise HTTPException(status_code=400, detail="Stock insuffisant")
+
+def cart_add_pipeline(product_id: str, quantity: int, now: str) -> list:
+    """
+    Update pipeline adding quantity to a cart line, or appending the line,
+    in one atomic upsert (the owner field comes from the filter on insert).
+    """
+    product_id = {"$literal": product_id}
+    items = {"$ifNull": ["$items", []]}
+    return [{"$set": {
+        "items": {"$cond": [
+            {"$in": [product_id, {"$map": {"input": items, "as": "line", "in": "$$line.product_id"}}]},
+            {"$map": {
+                "input": items,
+                "as": "line",
+                "in": {"$cond": [
+                    {"$eq": ["$$line.product_id", product_id]},
+                    {"$mergeObjects": ["$$line", {"quantity": {"$add": ["$$line.quantity", quantity]}}]},
+                    "$$line"
+                ]}
+            }},
+            {"$concatArrays": [items, [{"product_id": product_id, "quantity": quantity}]]}
+        ]},
+        "cart_id": {"$ifNull": ["$cart_id", f"cart_{uuid.uuid4().hex[:12]}"]},
+        "user_id": {"$ifNull": ["$user_id", None]},
+        "session_id": {"$ifNull": ["$session_id", None]},
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now
+    }}]
+
+async def merge_guest_cart(request: Request, user_id: str):
+    """
+    Fold the guest cart of this browser into the user's cart after sign-in:
+    quantities of common lines are added, every merged line is clamped to
+    stock, and the guest document is removed. Never fails the sign-in.
+    """
+    session_id = request.cookies.get("cart_session") or request.headers.get("X-Cart-Session")
+    if not session_id:
+        return
+    try:
+        guest = await db.carts.find_one(
+            {"session_id": session_id, "user_id": None},
+            {"_id": 0, "items": 1, "updated_at": 1}
+        )
+        if not guest:
+            return
+        quantities = defaultdict(int)
+        for line in guest.get("items", []):
+            if line.get("product_id") and line.get("quantity", 0) > 0:
+                quantities[line["product_id"]] += line["quantity"]
+        
+        products = await ProductLoader(db.products, {"_id": 0, "stock": 1, "is_on_order": 1}).load_many(quantities)
+        guest_lines = []
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if not product:
+                continue
+            # On-order products are not limited by stock
+            cap = None if product.get("is_on_order") else product.get("stock", 0)
+            if cap is not None and cap <= 0:
+                continue
+            guest_lines.append({"product_id": product_id, "quantity": quantity, "max": cap})
+        
+        if guest_lines:
+            await upsert_cart({"user_id": user_id}, cart_merge_pipeline(guest_lines, datetime.now(timezone.utc).isoformat()))
+        # Removed only once merged, and only as read: lines added meanwhile keep it for the next sign-in
+        await db.carts.delete_one({"session_id": session_id, "user_id": None, "updated_at": guest.get("updated_at")})
+    except Exception as e:
+        logger.error(f"Guest cart merge failed for {user_id}: {e}")
+
+async def ensure_cart_owner_indexes():
+    """
+    One cart per user and per guest session: unique indexes on user_id and
+    session_id, partial so the null owner field of the other kind is ignored.
+    They replace the plain indexes of the same fields.
+    """
+    for field in ("user_id", "session_id"):
+        try:
+            await db.carts.drop_index(f"{field}_1")
+        except OperationFailure:
+            pass  # Already replaced
+        try:
+            await db.carts.create_index(
+                field, unique=True, name=f"{field}_unique",
+                partialFilterExpression={field: {"$type": "string"}}
+            )
+        except OperationFailure as e:
+            # Duplicate carts from before the index: keep a plain index until they are cleaned up
+            logger.warning(f"Unique cart index on {field} not created (duplicate carts?): {e}")
+            await db.carts.create_index(field)
+
+async def upsert_cart(query: dict, pipeline: list):
+    """
+    Pipeline upsert of the cart matching query. Two first writes racing on
+    the unique owner indexes: the loser retries as a plain update.
+    """
+    try:
+        await db.carts.update_one(query, pipeline, upsert=True)
+    except DuplicateKeyError:
+        await db.carts.update_one(query, pipeline, upsert=True)
+
+def cart_merge_pipeline(guest_lines: list, now: str) -> list:
+    """
+    Update pipeline adding guest lines ({product_id, quantity, max}) to a cart;
+    $min ignores a null max (no stock limit).
+    """
+    add_to_existing = {"$map": {
+        "input": "$$existing",
+        "as": "line",
+        "in": {"$let": {
+            "vars": {"i": {"$indexOfArray": ["$$guest.product_id", "$$line.product_id"]}},
+            "in": {"$cond": [
+                {"$lt": ["$$i", 0]},
+                "$$line",
+                {"$mergeObjects": ["$$line", {"quantity": {"$min": [
+                    {"$add": ["$$line.quantity", {"$arrayElemAt": ["$$guest.quantity", "$$i"]}]},
+                    {"$arrayElemAt": ["$$guest.max", "$$i"]}
+                ]}}]}
+            ]}
+        }}
+    }}
+    new_lines = {"$map": {
+        "input": {"$filter": {
+            "input": "$$guest",
+            "as": "g",
+            "cond": {"$not": [{"$in": ["$$g.product_id", "$$existing.product_id"]}]}
+        }},
+        "as": "g",
+        "in": {"product_id": "$$g.product_id", "quantity": {"$min": ["$$g.quantity", "$$g.max"]}}
+    }}
+    return [{"$set": {
+        "items": {"$let": {
+            "vars": {"existing": {"$ifNull": ["$items", []]}, "guest": {"$literal": guest_lines}},
+            "in": {"$concatArrays": [add_to_existing, new_lines]}
+        }},
+        "cart_id": {"$ifNull": ["$cart_id", f"cart_{uuid.uuid4().hex[:12]}"]},
+        "session_id": None,
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now
+    }}]
+
 @api_router.get("/cart")
 async def get_cart(request: Request):
     user = await get_current_user(request)
@@ -5064,12 +6503,15 @@ async def get_cart(request: Request):
     if not cart:
         return {"items": [], "total": 0}
     
-    # Fetch product details for each item
+    # Fetch product details for all items in one query
+    products = await ProductLoader(db.products, CART_PRODUCT_PROJECTION).load_many(
+        item["product_id"] for item in cart.get("items", [])
+    )
     enriched_items = []
     total = 0
     
     for item in cart.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": item["product_id"],
@@ -5096,47 +6538,16 @@ async def add_to_cart(item: CartItem, request: Request, response: Response):
             httponly=True,
             secure=True,
             samesite="none",
-            max_age=30 * 24 * 3600,
-            path="/"
-        )
-    
-    # Check product exists and has stock
-    product = await db.products.find_one({"product_id": item.product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Produit non trouvé")
-    if product["stock"] < item.quantity:
-        raise HTTPException(status_code=400, detail="Stock insuffisant")
-    
-    query = {"user_id": user.user_id} if user else {"session_id": session_id}
-    cart = await db.carts.find_one(query, {"_id": 0})
-    
-    now = datetime.now(timezone.utc).isoformat()
-    
-    if cart:
-        # Update existing cart
-        items = cart.get("items", [])
-        found = False
-        for i, existing_item in enumerate(items):
-            if existing_item["product_id"] == item.product_id:
-                items[i]["quantity"] += item.quantity
-                found = True
-                break
-        
-        if not found:
-            items.append({"product_id": item.product_id, "quantity": item.quantity})
-        
-        await db.carts.update_one(query, {"$set": {"items": items, "updated_at": now}})
-    else:
-        # Create new cart
-        cart_doc = {
-            "cart_id": f"cart_{uuid.uuid4().hex[:12]}",
-            "user_id": user.user_id if user else None,
-            "session_id": session_id if not user else None,
-            "items": [{"product_id": item.product_id, "quantity": item.quantity}],
-            "created_at": now,
-            "updated_at": now
-        }
-        await db.carts.insert_one(cart_doc)
+            max_age=30 * 24 * 3600,
+            path="/"
+        )
+    
+    if item.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantité invalide")
+    await check_cart_stock(item.product_id, item.quantity)
+    
+    query = {"user_id": user.user_id} if user else {"session_id": session_id}
+    await upsert_cart(query, cart_add_pipeline(item.product_id, item.quantity, datetime.now(timezone.utc).isoformat()))
     
     return {"message": "Produit ajouté au panier"}
 
@@ -5153,24 +6564,21 @@ async def update_cart_item(item: CartItem, request: Request):
     else:
         raise HTTPException(status_code=400, detail="Panier non trouvé")
     
-    cart = await db.carts.find_one(query, {"_id": 0})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Panier non trouvé")
-    
-    items = cart.get("items", [])
-    
+    now = datetime.now(timezone.utc).isoformat()
     if item.quantity <= 0:
-        items = [i for i in items if i["product_id"] != item.product_id]
+        result = await db.carts.update_one(
+            query,
+            {"$pull": {"items": {"product_id": item.product_id}}, "$set": {"updated_at": now}}
+        )
     else:
-        for i, existing_item in enumerate(items):
-            if existing_item["product_id"] == item.product_id:
-                items[i]["quantity"] = item.quantity
-                break
-    
-    await db.carts.update_one(
-        query,
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+        await check_cart_stock(item.product_id, item.quantity)
+        result = await db.carts.update_one(
+            query,
+            {"$set": {"items.$[line].quantity": item.quantity, "updated_at": now}},
+            array_filters=[{"line.product_id": item.product_id}]
+        )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Panier non trouvé")
     
     return {"message": "Panier mis à jour"}
 
@@ -5210,6 +6618,143 @@ async def clear_cart(request: Request):
     
     return {"message": "Panier vidé"}
 
+# ============== CART QUOTE ==============
+
+# Authoritative checkout pricing: catalog prices, shipping zone, promo code or
+# loyalty coupon, priced in one call and signed so create_order can trust it.
+# The signing key is derived from (not equal to) the session key, so quote and
+# session tokens can never be swapped for one another.
+QUOTE_SECRET = os.environ.get("QUOTE_SECRET") or hashlib.sha256(f"{JWT_SECRET}:cart-quote".encode()).hexdigest()
+QUOTE_TTL_MINUTES = 30
+QUOTE_PRODUCT_PROJECTION = {
+    "_id": 0, "product_id": 1, "name": 1, "price": 1, "category": 1,
+    "images": {"$slice": 1}, "stock": 1, "is_on_order": 1
+}
+
+class CartQuoteRequest(BaseModel):
+    city: str = ""
+    address: str = ""
+    region: str = ""
+    promo_code: Optional[str] = None
+
+@api_router.post("/cart/quote")
+async def quote_cart(data: CartQuoteRequest, request: Request):
+    """
+    Price the current cart for checkout: subtotal, shipping, promo code or
+    loyalty coupon and total, plus the rewards the customer can redeem.
+    quote_token carries the breakdown for create_order.
+    """
+    user = await get_current_user(request)
+    session_id = request.cookies.get("cart_session") or request.headers.get("X-Cart-Session")
+    if not user and not session_id:
+        raise HTTPException(status_code=400, detail="Panier vide")
+    
+    async def load_loyalty_points() -> int:
+        if not user:
+            return 0
+        loyalty = await db.loyalty.find_one({"user_id": user.user_id}, {"_id": 0, "points": 1})
+        return (loyalty or {}).get("points", 0)
+    
+    query = {"user_id": user.user_id} if user else {"session_id": session_id}
+    cart, points = await asyncio.gather(
+        db.carts.find_one(query, {"_id": 0, "items": 1}),
+        load_loyalty_points()
+    )
+    cart_items = (cart or {}).get("items", [])
+    if not cart_items:
+        raise HTTPException(status_code=400, detail="Panier vide")
+    
+    products = await ProductLoader(db.products, QUOTE_PRODUCT_PROJECTION).load_many(
+        item["product_id"] for item in cart_items
+    )
+    lines = []
+    for item in cart_items:
+        product = products.get(item["product_id"])
+        if not product:
+            continue
+        lines.append({
+            "product_id": item["product_id"],
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": item["quantity"],
+            "image": product["images"][0] if product.get("images") else "",
+            "category": product.get("category"),
+            "line_total": product["price"] * item["quantity"],
+            "in_stock": product.get("stock", 0) >= item["quantity"] or bool(product.get("is_on_order"))
+        })
+    subtotal = sum(line["line_total"] for line in lines)
+    
+    delivery = calculate_delivery_for_address(data.city, data.address, data.region)
+    shipping_cost = delivery["shipping_cost"]
+    
+    promo, promo_error, discount = None, None, 0
+    if data.promo_code and lines:
+        try:
+            promo = await evaluate_promo_code(data.promo_code, subtotal, lines, user.user_id if user else None)
+        except HTTPException as e:
+            promo_error = e.detail
+    if promo:
+        discount = min(promo.get("discount_amount", 0), subtotal)
+        if promo["discount_type"] == "free_shipping":
+            shipping_cost = 0
+    total = subtotal - discount + shipping_cost
+    
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=QUOTE_TTL_MINUTES)
+    quote_token = jwt.encode({
+        "typ": "cart_quote",
+        "sub": user.user_id if user else None,
+        "items": [[line["product_id"], line["price"], line["quantity"]] for line in lines],
+        "subtotal": subtotal,
+        "shipping_cost": shipping_cost,
+        "discount": discount,
+        "total": total,
+        "promo_code": promo.get("code", data.promo_code.upper()) if promo else None,
+        "promo_source": promo.get("source") if promo else None,
+        "zone": delivery["zone"],
+        "exp": expires_at
+    }, QUOTE_SECRET, algorithm=JWT_ALGORITHM)
+    
+    return {
+        "items": lines,
+        "missing": [item["product_id"] for item in cart_items if item["product_id"] not in products],
+        "subtotal": subtotal,
+        "delivery": delivery,
+        "shipping_cost": shipping_cost,
+        "promo": promo,
+        "promo_error": promo_error,
+        "discount": discount,
+        "total": total,
+        "loyalty": {
+            "points": points,
+            "redeemable_rewards": [reward for reward in LOYALTY_REWARDS if reward["points"] <= points]
+        } if user else None,
+        "expires_at": expires_at.isoformat(),
+        "quote_token": quote_token
+    }
+
+def verify_cart_quote(token: str, items: list, shipping: ShippingAddress, user: Optional[User]) -> dict:
+    """Claims of a quote issued for exactly these items, delivery zone (and customer), 400 otherwise"""
+    try:
+        quote = jwt.decode(token, QUOTE_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=400, detail="Devis expiré, veuillez recharger le panier")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=400, detail="Devis invalide")
+    if quote.get("typ") != "cart_quote":
+        raise HTTPException(status_code=400, detail="Devis invalide")
+    if quote.get("sub") and (not user or user.user_id != quote["sub"]):
+        raise HTTPException(status_code=400, detail="Devis invalide")
+    
+    quoted = sorted((product_id, quantity) for product_id, _, quantity in quote["items"])
+    ordered = sorted((item.product_id, item.quantity) for item in items)
+    if quoted != ordered:
+        raise HTTPException(status_code=400, detail="Le panier a changé, veuillez recharger le devis")
+    # The quoted shipping cost only holds for an address in the same zone
+    delivery = calculate_delivery_for_address(shipping.city, shipping.address, shipping.region)
+    if delivery["zone"] != quote.get("zone"):
+        raise HTTPException(status_code=400, detail="L'adresse de livraison a changé, veuillez recharger le devis")
+    return quote
+
 # ============== WISHLIST ROUTES ==============
 
 @api_router.get("/wishlist")
@@ -5219,9 +6764,12 @@ async def get_wishlist(user: User = Depends(require_auth)):
         return {"items": []}
     
     # Fetch product details
+    products = await ProductLoader(db.products, CART_PRODUCT_PROJECTION).load_many(
+        item["product_id"] for item in wishlist.get("items", [])
+    )
     enriched_items = []
     for item in wishlist.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": item["product_id"],
@@ -5290,9 +6838,13 @@ async def get_shared_wishlist(share_id: str):
         raise HTTPException(status_code=404, detail="Liste introuvable")
     
     # Fetch product details
+    products = await ProductLoader(
+        db.products,
+        {"_id": 0, "product_id": 1, "name": 1, "price": 1, "original_price": 1, "images": 1, "stock": 1}
+    ).load_many(item["product_id"] for item in wishlist.get("items", []))
     enriched_items = []
     for item in wishlist.get("items", []):
-        product = await db.products.find_one({"product_id": item["product_id"]}, {"_id": 0})
+        product = products.get(item["product_id"])
         if product:
             enriched_items.append({
                 "product_id": product["product_id"],
@@ -5443,6 +6995,38 @@ async def redeem_loyalty_reward(
         "expires_at": coupon_doc["expires_at"]
     }
 
+async def find_loyalty_coupon(code: str, user_id: Optional[str]) -> Optional[dict]:
+    """Unused, unexpired coupon redeemed by this user"""
+    if not user_id:
+        return None
+    return await db.coupons.find_one({
+        "code": code,
+        "user_id": user_id,
+        "used": False,
+        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
+    }, {"_id": 0})
+
+def loyalty_coupon_discount(coupon: dict, cart_total: int) -> dict:
+    """Promo validation response for a loyalty coupon"""
+    value = coupon["value"]
+    if coupon["reward_type"] == "discount":
+        discount_type, amount, message = "percent", int(cart_total * value / 100), f"-{value}%"
+    elif coupon["reward_type"] == "credit":
+        discount_type, amount = "fixed", min(value, cart_total)
+        message = f"-{value:,} FCFA".replace(",", " ")
+    else:
+        discount_type, amount, message = "free_shipping", 0, "Livraison gratuite"
+    return {
+        "valid": True,
+        "coupon_id": coupon["coupon_id"],
+        "code": coupon["code"],
+        "discount_type": discount_type,
+        "discount_value": value,
+        "discount_amount": amount,
+        "message": message,
+        "source": "loyalty"
+    }
+
 # ============== REVIEWS WITH MEDIA ROUTES ==============
 
 @api_router.post("/products/{product_id}/reviews/with-media")
@@ -5512,6 +7096,8 @@ async def create_review_with_media(
     }
     
     await db.reviews.insert_one(review_doc)
+    await apply_rating_change(product_id, review_doc["rating"], 1)
+    await invalidate_cache(["reviews"])
     
     return {"message": "Avis publié avec succès", "review_id": review_doc["review_id"]}
 
@@ -5540,6 +7126,381 @@ async def get_review_media(filename: str):
         media_type=content_type
     )
 
+# ============== ORDER PLACEMENT ==============
+
+# Cleared on the first "transactions not supported" error (standalone mongod);
+# orders are then placed with compensating writes instead
+order_transactions = {"supported": True}
+
+class StockShortage(Exception):
+    pass
+
+def stock_guard(product_id: str, quantity: int) -> dict:
+    """Matches the product only when its stock covers the quantity or it is sold on order"""
+    return {"product_id": product_id, "$or": [{"stock": {"$gte": quantity}}, {"is_on_order": True}]}
+
+def order_stock_operations(quantities: Dict[str, int], last_version: int,
+                           hold: Optional[str] = None) -> List[UpdateOne]:
+    """
+    Guarded decrements, one per product: the filter only matches when stock
+    covers the quantity (products sold on order are not limited). Each one
+    stamps its own catalog version. Outside a transaction `hold` (the order
+    id) is added to stock_holds so the decrements that went through can be
+    told apart from concurrent writes.
+    """
+    first_version = last_version - len(quantities) + 1
+    operations = []
+    for position, (product_id, quantity) in enumerate(quantities.items()):
+        update = {"$inc": {"stock": -quantity}, "$set": {"catalog_version": first_version + position}}
+        if hold:
+            update["$addToSet"] = {"stock_holds": hold}
+        operations.append(UpdateOne(stock_guard(product_id, quantity), update))
+    return operations
+
+def order_stock_rollback(quantities: Dict[str, int], hold: str, last_version: int) -> List[UpdateOne]:
+    """
+    Increments undoing the decrements marked with `hold`, each stamping a new
+    catalog version; pulling the mark in the same update makes a repeated
+    rollback a no-op
+    """
+    first_version = last_version - len(quantities) + 1
+    return [
+        UpdateOne(
+            {"product_id": product_id, "stock_holds": hold},
+            {"$inc": {"stock": quantity}, "$pull": {"stock_holds": hold},
+             "$set": {"catalog_version": first_version + position}}
+        )
+        for position, (product_id, quantity) in enumerate(quantities.items())
+    ]
+
+async def _write_order(order_doc: dict, stock_ops: List[UpdateOne], coupon_claim: Optional[tuple],
+                       reservations: Optional[List[dict]], session=None):
+    """Coupon claim, stock decrements, reservations and order insert; raises before the insert on any failure"""
+    if coupon_claim:
+        claimed = await db.coupons.update_one(*coupon_claim, session=session)
+        if claimed.modified_count == 0:
+            raise HTTPException(status_code=400, detail="Ce coupon a déjà été utilisé")
+    if stock_ops:
+        result = await db.products.bulk_write(stock_ops, ordered=False, session=session)
+        if result.matched_count < len(stock_ops):
+            raise StockShortage()
+    if reservations:
+        await db.stock_reservations.insert_many(reservations, session=session)
+    await db.orders.insert_one(order_doc, session=session)
+
+async def _rollback_order_writes(order_id: str, quantities: Dict[str, int], coupon_claim: Optional[tuple]):
+    """Undo the stock decrements that went through, the reservations and the coupon claim"""
+    # Reservations go first so the sweeper cannot restore the same stock again
+    await db.stock_reservations.delete_many({"order_id": order_id})
+    if quantities:
+        # Restored stock is a catalog change of its own
+        async with reserve_catalog_versions(len(quantities)) as last_version:
+            await db.products.bulk_write(order_stock_rollback(quantities, order_id, last_version), ordered=False)
+    if coupon_claim:
+        query, update = coupon_claim
+        await db.coupons.update_one(
+            {"code": query["code"], "user_id": query["user_id"], "order_id": update["$set"]["order_id"]},
+            {"$set": {"used": False}, "$unset": {"order_id": "", "used_at": ""}}
+        )
+
+async def _stock_shortages(quantities: Dict[str, int]) -> List[dict]:
+    """Lines the current stock cannot cover, for the out-of-stock error"""
+    products = await ProductLoader(db.products, {"_id": 0, "name": 1, "stock": 1, "is_on_order": 1}).load_many(quantities)
+    shortages = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product and (product.get("is_on_order") or product.get("stock", 0) >= quantity):
+            continue
+        shortages.append({
+            "product_id": product_id,
+            "name": product.get("name") if product else None,
+            "requested": quantity,
+            "available": max(product.get("stock", 0), 0) if product else 0,
+        })
+    return shortages
+
+async def place_order(order_doc: dict, quantities: Dict[str, int], coupon_claim: Optional[tuple] = None,
+                      reservations: Optional[List[dict]] = None):
+    """
+    Claim the coupon, decrement stock for every line, hold the reservations
+    and insert the order as one unit: a multi-document transaction when the deployment supports it,
+    otherwise the same writes with compensation. Raises a 400 listing the
+    lines out of stock when any decrement is refused.
+    """
+    try:
+        # Reserved outside the transaction so concurrent orders do not conflict on the counter
+        async with reserve_catalog_versions(len(quantities)) as last_version:
+            if order_transactions["supported"]:
+                stock_ops = order_stock_operations(quantities, last_version)
+                try:
+                    async with await client.start_session() as session:
+                        await session.with_transaction(
+                            lambda s: _write_order(order_doc, stock_ops, coupon_claim, reservations, session=s)
+                        )
+                    return
+                except OperationFailure as e:
+                    # 20 (IllegalOperation): transactions need a replica set or mongos
+                    if e.code != 20:
+                        raise
+                    order_transactions["supported"] = False
+                    logger.warning("MongoDB transactions unavailable, placing orders with compensating writes")
+            
+            order_id = order_doc["order_id"]
+            stock_ops = order_stock_operations(quantities, last_version, hold=order_id)
+            try:
+                await _write_order(order_doc, stock_ops, coupon_claim, reservations)
+            except Exception:
+                await _rollback_order_writes(order_id, quantities, coupon_claim)
+                raise
+            # The order stands: its marks are no longer needed
+            await db.products.update_many(
+                {"product_id": {"$in": list(quantities)}, "stock_holds": order_id},
+                {"$pull": {"stock_holds": order_id}}
+            )
+    except StockShortage:
+        raise HTTPException(status_code=400, detail={
+            "message": "Stock insuffisant",
+            "items": await _stock_shortages(quantities)
+        })
+
+# ============== STOCK RESERVATIONS ==============
+
+# Orders paid through PayTech hold their stock this long once the payment is
+# initiated; unpaid holds are then released
+RESERVATION_HOLD_MINUTES = int(os.environ.get("RESERVATION_HOLD_MINUTES", "30"))
+# Orders whose payment is never initiated are released after this fallback
+RESERVATION_PENDING_HOURS = 24
+# Each initiation restarts the hold; past this many the order cannot be initiated again
+MAX_PAYMENT_INITIATIONS = 3
+# Settled reservations stay this long (TTL on purge_at) for support lookups
+RESERVATION_RETENTION_DAYS = 7
+RESERVATION_SWEEP_BATCH = 200
+# How long a late payment waits for a concurrent release to put the stock back
+RESTOCK_WAIT_ATTEMPTS = 10
+RESTOCK_WAIT_SECONDS = 0.2
+PAYTECH_PAYMENT_METHODS = {"mobile_money", "card", "wave", "orange_money", "free_money"}
+
+def build_reservations(order_id: str, quantities: Dict[str, int], now: datetime) -> List[dict]:
+    """
+    One pending reservation per order line. The short hold only starts once
+    PayTech initiation succeeds (hold_order_reservations); until then the
+    reservation expires after the RESERVATION_PENDING_HOURS fallback.
+    """
+    expires_at = now + timedelta(hours=RESERVATION_PENDING_HOURS)
+    return [
+        {
+            "reservation_id": f"res_{uuid.uuid4().hex[:12]}",
+            "order_id": order_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "status": "pending",
+            "created_at": now.isoformat(),
+            "expires_at": expires_at,
+            "purge_at": expires_at + timedelta(days=RESERVATION_RETENTION_DAYS)
+        }
+        for product_id, quantity in quantities.items()
+    ]
+
+async def hold_order_reservations(order_id: str, now: datetime) -> Optional[datetime]:
+    """
+    Start (or extend, on a new initiation) the hold of an order's reservations;
+    returns its expiry, None when the order has nothing left to hold
+    """
+    expires_at = now + timedelta(minutes=RESERVATION_HOLD_MINUTES)
+    result = await db.stock_reservations.update_many(
+        {"order_id": order_id, "status": {"$in": ["pending", "held"]}},
+        {"$set": {
+            "status": "held",
+            "expires_at": expires_at,
+            "purge_at": expires_at + timedelta(days=RESERVATION_RETENTION_DAYS)
+        }}
+    )
+    return expires_at if result.matched_count else None
+
+async def switch_to_cash_on_delivery(order_id: str, note: str):
+    """
+    Payment initiation failed and the customer was asked to pay on delivery:
+    the order becomes a cash order and its reservations no longer expire
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.orders.update_one(
+        {"order_id": order_id, "payment_status": {"$ne": "paid"}, "order_status": {"$ne": "cancelled"}},
+        {
+            "$set": {"payment_method": "cash", "reservation_expires_at": None},
+            "$push": {"status_history": {"status": "pending", "timestamp": now.isoformat(), "note": note}}
+        }
+    )
+    if result.modified_count:
+        await _settle_reservations({"order_id": order_id}, ["pending", "held"], "converted", now)
+
+async def adjust_stock(deltas: Dict[str, int]):
+    """Unconditional stock changes in one bulk write, each stamped with a catalog version"""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    async with reserve_catalog_versions(len(deltas)) as last_version:
+        first_version = last_version - len(deltas) + 1
+        await db.products.bulk_write([
+            UpdateOne({"product_id": product_id}, {"$inc": {"stock": delta}, "$set": {"catalog_version": first_version + position}})
+            for position, (product_id, delta) in enumerate(deltas.items())
+        ], ordered=False)
+
+async def _settle_reservations(query: dict, from_statuses: List[str], to_status: str, now: datetime) -> List[dict]:
+    """
+    Move reservations between states and return exactly the ones this call
+    moved: they are tagged with a fresh settle_id, so a concurrent sweep,
+    IPN or admin action never settles the same reservation twice.
+    """
+    settle_id = uuid.uuid4().hex
+    result = await db.stock_reservations.update_many(
+        {**query, "status": {"$in": from_statuses}},
+        {"$set": {
+            "status": to_status,
+            f"{to_status}_at": now.isoformat(),
+            "settle_id": settle_id,
+            "purge_at": now + timedelta(days=RESERVATION_RETENTION_DAYS)
+        }}
+    )
+    if not result.modified_count:
+        return []
+    return await db.stock_reservations.find(
+        {"settle_id": settle_id},
+        {"_id": 0, "reservation_id": 1, "order_id": 1, "product_id": 1, "quantity": 1, "settle_id": 1}
+    ).to_list(None)
+
+def _reserved_quantities(reservations: List[dict], sign: int) -> Dict[str, int]:
+    deltas = defaultdict(int)
+    for reservation in reservations:
+        deltas[reservation["product_id"]] += sign * reservation["quantity"]
+    return deltas
+
+async def release_reservations(query: dict, note: str, now: Optional[datetime] = None,
+                               from_statuses: Tuple[str, ...] = ("pending", "held")) -> List[dict]:
+    """Put the stock of unsettled reservations back on sale and cancel their unpaid orders"""
+    now = now or datetime.now(timezone.utc)
+    released = await _settle_reservations(query, list(from_statuses), "released", now)
+    if not released:
+        return []
+    await adjust_stock(_reserved_quantities(released, 1))
+    # Marks the stock as back on sale, for a late payment waiting to take it again
+    await db.stock_reservations.update_many(
+        {"reservation_id": {"$in": [r["reservation_id"] for r in released]}},
+        {"$set": {"restocked_at": now.isoformat()}}
+    )
+    await db.orders.update_many(
+        {
+            "order_id": {"$in": list({r["order_id"] for r in released})},
+            "payment_status": {"$ne": "paid"},
+            "order_status": {"$ne": "cancelled"}
+        },
+        {
+            "$set": {"order_status": "cancelled", "cancelled_at": now.isoformat()},
+            "$push": {"status_history": {"status": "cancelled", "timestamp": now.isoformat(), "note": note}}
+        }
+    )
+    return released
+
+async def _wait_for_restock(reservation_ids: List[str]) -> bool:
+    """Wait (briefly) until a concurrent release has put the stock of these reservations back on sale"""
+    for _ in range(RESTOCK_WAIT_ATTEMPTS):
+        pending = await db.stock_reservations.count_documents(
+            {"reservation_id": {"$in": reservation_ids}, "restocked_at": {"$exists": False}}
+        )
+        if not pending:
+            return True
+        await asyncio.sleep(RESTOCK_WAIT_SECONDS)
+    return False
+
+async def retake_stock(quantities: Dict[str, int]) -> List[str]:
+    """
+    Guarded decrements issued one by one, so each line is known to have
+    gone through or not; returns the products whose stock fell short
+    """
+    async with reserve_catalog_versions(len(quantities)) as last_version:
+        first_version = last_version - len(quantities) + 1
+        results = await asyncio.gather(*(
+            db.products.update_one(
+                stock_guard(product_id, quantity),
+                {"$inc": {"stock": -quantity}, "$set": {"catalog_version": first_version + position}}
+            )
+            for position, (product_id, quantity) in enumerate(quantities.items())
+        ))
+    return [product_id for product_id, result in zip(quantities, results) if not result.matched_count]
+
+async def convert_order_reservations(order_id: str):
+    """
+    Turn an order's reservations into a sale once it is paid. A payment
+    arriving after the hold was released takes the stock again only where
+    it is still available; otherwise nothing is taken and the order is
+    flagged for a refund.
+    """
+    now = datetime.now(timezone.utc)
+    await _settle_reservations({"order_id": order_id}, ["pending", "held"], "converted", now)
+    late = await _settle_reservations({"order_id": order_id}, ["released"], "converted", now)
+    if not late:
+        return
+    quantities = _reserved_quantities(late, 1)
+    # The release may still be between its settle and its restock: retaking
+    # before the stock has landed would flag a refund for nothing
+    if not await _wait_for_restock([r["reservation_id"] for r in late]):
+        logger.warning(f"Order {order_id}: released stock not back on sale yet, retaking anyway")
+    short = await retake_stock(quantities)
+    if not short:
+        # The stock is back: the cancelled order goes on
+        await db.orders.update_one(
+            {"order_id": order_id, "order_status": "cancelled"},
+            {
+                "$set": {"order_status": "processing"},
+                "$push": {"status_history": {
+                    "status": "processing", "timestamp": now.isoformat(),
+                    "note": "Paiement reçu après expiration de la réservation, stock repris"
+                }}
+            }
+        )
+        logger.warning(f"Order {order_id} paid after its stock reservation expired, stock taken again")
+        return
+    
+    # Never oversell: give back the lines taken and leave the order to be refunded
+    await adjust_stock({product_id: quantity for product_id, quantity in quantities.items() if product_id not in short})
+    await db.stock_reservations.update_many(
+        {"settle_id": late[0]["settle_id"]}, {"$set": {"status": "unfulfilled"}}
+    )
+    await db.orders.update_one(
+        {"order_id": order_id},
+        {
+            "$set": {
+                "refund_required": True,
+                "stock_shortage": [{"product_id": product_id, "quantity": quantities[product_id]} for product_id in short]
+            },
+            "$push": {"status_history": {
+                "status": "refund_required", "timestamp": now.isoformat(),
+                "note": "Paiement reçu après expiration de la réservation, stock insuffisant : remboursement requis"
+            }}
+        }
+    )
+    logger.warning(f"Order {order_id} paid after its stock reservation expired, out of stock for {short}: refund required")
+
+async def release_expired_reservations():
+    """Release pending and held reservations past expires_at (range scan on status + expires_at), oldest first"""
+    now = datetime.now(timezone.utc)
+    total = 0
+    while True:
+        expired = await db.stock_reservations.find(
+            {"status": {"$in": ["pending", "held"]}, "expires_at": {"$lte": now}}, {"_id": 1}
+        ).sort("expires_at", 1).limit(RESERVATION_SWEEP_BATCH).to_list(RESERVATION_SWEEP_BATCH)
+        if not expired:
+            break
+        # expires_at is checked again: a new initiation may have extended the hold meanwhile
+        released = await release_reservations(
+            {"_id": {"$in": [doc["_id"] for doc in expired]}, "expires_at": {"$lte": now}},
+            "Réservation de stock expirée (paiement non reçu)", now
+        )
+        total += len(released)
+        if len(expired) < RESERVATION_SWEEP_BATCH:
+            break
+    if total:
+        logger.info(f"Released {total} expired stock reservations")
+
 # ============== ORDERS ROUTES ==============
 
 @api_router.post("/orders", response_model=Order)
@@ -5556,14 +7517,41 @@ async def create_order(order_data: OrderCreate, request: Request):
     order_doc["order_status"] = "pending"
     order_doc["created_at"] = now.isoformat()
     
-    # Update stock for each product
-    for item in order_data.items:
-        await db.products.update_one(
-            {"product_id": item.product_id},
-            {"$inc": {"stock": -item.quantity}}
+    # The signed quote is the only source of prices and totals: client values are never kept
+    quote_token = order_doc.pop("quote_token", None)
+    if not quote_token:
+        raise HTTPException(status_code=400, detail="Devis manquant, veuillez recharger le panier")
+    quote = verify_cart_quote(quote_token, order_data.items, order_data.shipping, user)
+    prices = {product_id: price for product_id, price, _ in quote["items"]}
+    for item in order_doc["items"]:
+        item["price"] = prices[item["product_id"]]
+    for field in ("subtotal", "shipping_cost", "discount", "total", "promo_code"):
+        order_doc[field] = quote[field]
+    order_doc["quoted"] = True
+    
+    coupon_claim = None
+    if quote["promo_source"] == "loyalty":
+        coupon_claim = (
+            {"code": quote["promo_code"], "user_id": quote["sub"], "used": False},
+            {"$set": {"used": True, "order_id": order_id, "used_at": now.isoformat()}}
         )
     
-    await db.orders.insert_one(order_doc)
+    quantities = defaultdict(int)
+    for item in order_data.items:
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantité invalide")
+        quantities[item.product_id] += item.quantity
+    
+    # Mobile money and card payments get reservations; their short hold starts
+    # with the PayTech initiation, a never initiated order lapses after the fallback
+    reservations = None
+    if order_data.payment_method in PAYTECH_PAYMENT_METHODS:
+        reservations = build_reservations(order_id, quantities, now)
+        order_doc["reservation_expires_at"] = None
+    
+    await place_order(order_doc, dict(quantities), coupon_claim, reservations)
+    # Sold units rank suggestions right away here; other workers catch up on the hourly rebuild
+    suggest_index.add_sales(quantities)
     
     # Clear user's cart
     if user:
@@ -5741,13 +7729,25 @@ async def initiate_paytech_payment(payment: PaymentRequest):
     api_secret = os.environ.get('PAYTECH_SECRET_KEY', '')
     env = os.environ.get('PAYTECH_ENV', 'test')
     
-    if not api_key or api_key == 'votre_cle_api':
-        raise HTTPException(status_code=500, detail="PayTech API non configurée. Veuillez ajouter vos clés API PayTech.")
-    
     # Get order details
     order = await db.orders.find_one({"order_id": payment.order_id}, {"_id": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
+    if order.get("order_status") == "cancelled":
+        raise HTTPException(status_code=400, detail="Cette commande a été annulée")
+    if order.get("payment_status") == "paid":
+        raise HTTPException(status_code=400, detail="Cette commande est déjà payée")
+    # Every initiation restarts the stock hold: capped so it cannot be extended forever
+    claimed = await db.orders.update_one(
+        {"order_id": payment.order_id, "payment_initiations": {"$not": {"$gte": MAX_PAYMENT_INITIATIONS}}},
+        {"$inc": {"payment_initiations": 1}}
+    )
+    if not claimed.modified_count:
+        raise HTTPException(status_code=400, detail="Nombre maximal de tentatives de paiement atteint")
+    
+    if not api_key or api_key == 'votre_cle_api':
+        await switch_to_cash_on_delivery(payment.order_id, "Paiement en ligne indisponible : paiement à la livraison")
+        raise HTTPException(status_code=500, detail="PayTech API non configurée. Veuillez ajouter vos clés API PayTech.")
     
     # Get total amount - ensure it's the correct value
     total_amount = order.get('total', 0)
@@ -5803,6 +7803,9 @@ async def initiate_paytech_payment(payment: PaymentRequest):
             
             if 'token' in result:
                 checkout_url = f"{PAYTECH_CHECKOUT_URL}{result['token']}"
+                now = datetime.now(timezone.utc)
+                # The stock is held from now on, for RESERVATION_HOLD_MINUTES
+                expires_at = await hold_order_reservations(payment.order_id, now)
                 
                 # Store payment reference
                 await db.orders.update_one(
@@ -5810,7 +7813,8 @@ async def initiate_paytech_payment(payment: PaymentRequest):
                     {"$set": {
                         "paytech_token": result['token'],
                         "paytech_ref": paytech_data['ref_command'],
-                        "payment_initiated_at": datetime.now(timezone.utc).isoformat()
+                        "payment_initiated_at": now.isoformat(),
+                        "reservation_expires_at": expires_at.isoformat() if expires_at else None
                     }}
                 )
                 
@@ -5823,9 +7827,11 @@ async def initiate_paytech_payment(payment: PaymentRequest):
                 error_msg = result.get('error', [result.get('message', 'Erreur inconnue')])
                 if isinstance(error_msg, list):
                     error_msg = error_msg[0] if error_msg else 'Erreur PayTech'
+                await switch_to_cash_on_delivery(payment.order_id, "Paiement en ligne refusé : paiement à la livraison")
                 raise HTTPException(status_code=400, detail=f"Erreur PayTech: {error_msg}")
                 
         except httpx.RequestError as e:
+            await switch_to_cash_on_delivery(payment.order_id, "Paiement en ligne indisponible : paiement à la livraison")
             raise HTTPException(status_code=500, detail=f"Erreur de connexion à PayTech: {str(e)}")
 
 
@@ -5839,7 +7845,7 @@ async def paytech_ipn_webhook(request: Request):
         
         type_event = data.get('type_event')
         
-        if type_event == 'sale_complete':
+        if type_event in ('sale_complete', 'sale_canceled'):
             # Verify API keys hash
             api_key = os.environ.get('PAYTECH_API_KEY', '')
             api_secret = os.environ.get('PAYTECH_API_SECRET', '')
@@ -5859,17 +7865,26 @@ async def paytech_ipn_webhook(request: Request):
             order_id = custom_field.get('order_id')
             payment_method = data.get('payment_method', 'PayTech')
             
+            if order_id and type_event == 'sale_canceled':
+                await release_reservations({"order_id": order_id}, "Paiement annulé")
+                return JSONResponse(content={"status": "OK"})
+            
             if order_id:
-                # Update order status
+                # Update order status; a cancelled order is only resumed by
+                # convert_order_reservations when its stock can be taken again
                 await db.orders.update_one(
                     {"order_id": order_id},
-                    {"$set": {
+                    [{"$set": {
                         "payment_status": "paid",
-                        "order_status": "processing",
-                        "payment_method_used": payment_method,
+                        "order_status": {"$cond": [
+                            {"$eq": ["$order_status", "cancelled"]}, "$order_status", "processing"
+                        ]},
+                        "payment_method_used": {"$literal": payment_method},
                         "paid_at": datetime.now(timezone.utc).isoformat()
-                    }}
+                    }}]
                 )
+                await convert_order_reservations(order_id)
+                await record_paid_order(order_id)
                 
                 return JSONResponse(content={"status": "OK"})
         
@@ -6027,21 +8042,25 @@ async def get_all_orders(
     status: Optional[str] = None,
     limit: int = 50,
     skip: int = 0,
+    cursor: Optional[str] = None,
+    count: str = "exact",
     user: User = Depends(require_admin)
 ):
     query = {}
     if status:
         query["order_status"] = status
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    orders, next_cursor = await paginate_or_400(
+        db.orders, query, {"_id": 0}, ORDER_LIST_SORT, min(limit, 200), cursor, skip
+    )
     
     for order in orders:
         if isinstance(order.get('created_at'), str):
             order['created_at'] = datetime.fromisoformat(order['created_at'])
     
-    total = await db.orders.count_documents(query)
+    total = await count_or_400(db.orders, query, count)
     
-    return {"orders": orders, "total": total}
+    return {"orders": orders, "total": total, "next_cursor": next_cursor}
 
 @api_router.put("/admin/orders/{order_id}/status")
 async def update_order_status(
@@ -6080,6 +8099,12 @@ async def update_order_status(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
+    if payment_status == "paid":
+        await convert_order_reservations(order_id)
+        await record_paid_order(order_id)
+    elif order_status == "cancelled":
+        await release_reservations({"order_id": order_id}, note or "Commande annulée")
+    
     # Send shipping notification email if status changed to shipped
     if order_status == "shipped":
         order = await db.orders.find_one({"order_id": order_id}, {"_id": 0})
@@ -6415,15 +8440,36 @@ async def get_admin_stats(user: User = Depends(require_admin)):
         "total_revenue": total_revenue
     }
 
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(user: User = Depends(require_admin)):
+    """Get in-memory cache counters (hits, misses, evictions, occupancy)"""
+    return {**cache.stats(), "bus": cache_bus.stats(), "catalog_replica": {**catalog_replica.stats(), "in_use": replica_ready()}}
+
+@api_router.post("/admin/cache/clear")
+async def clear_cache_admin(tag: Optional[str] = None, user: User = Depends(require_admin)):
+    """Clear the in-memory cache of every worker, optionally a single tag (e.g. products)"""
+    removed = len(cache)
+    if tag:
+        removed = cache.invalidate_tag(tag)
+        await cache_bus.publish([tag])
+    else:
+        cache.clear()
+        await cache_bus.publish([CACHE_CLEAR_ALL_TAG])
+    return {"message": "Cache vidé", "removed": removed}
+
 @api_router.get("/admin/users")
 async def get_all_users(
     limit: int = 50,
     skip: int = 0,
+    cursor: Optional[str] = None,
+    count: str = "exact",
     user: User = Depends(require_admin)
 ):
-    users = await db.users.find({}, {"_id": 0, "password": 0}).skip(skip).limit(limit).to_list(limit)
-    total = await db.users.count_documents({})
-    return {"users": users, "total": total}
+    users, next_cursor = await paginate_or_400(
+        db.users, {}, {"_id": 0, "password": 0}, USER_LIST_SORT, min(limit, 200), cursor, skip
+    )
+    total = await count_or_400(db.users, {}, count)
+    return {"users": users, "total": total, "next_cursor": next_cursor}
 
 @api_router.get("/admin/export/orders")
 async def export_orders_csv(user: User = Depends(require_admin)):
@@ -6528,6 +8574,9 @@ async def get_abandoned_carts(user: User = Depends(require_admin)):
     }, {"_id": 0}).sort("updated_at", -1).to_list(100)
     
     # Enrich with user data and product details
+    products = await ProductLoader(db.products, {"_id": 0, "name": 1, "price": 1, "images": {"$slice": 1}}).load_many(
+        item["product_id"] for cart in carts for item in cart.get("items", [])
+    )
     result = []
     for cart in carts:
         user_doc = await db.users.find_one({"user_id": cart["user_id"]}, {"_id": 0, "email": 1, "name": 1})
@@ -6538,10 +8587,7 @@ async def get_abandoned_carts(user: User = Depends(require_admin)):
         items_with_details = []
         total = 0
         for item in cart.get("items", []):
-            product = await db.products.find_one(
-                {"product_id": item["product_id"]},
-                {"_id": 0, "name": 1, "price": 1, "images": 1}
-            )
+            product = products.get(item["product_id"])
             if product:
                 item_total = product.get("price", 0) * item.get("quantity", 1)
                 items_with_details.append({
@@ -6608,6 +8654,20 @@ async def trigger_abandoned_cart_detection(user: User = Depends(require_admin)):
     asyncio.create_task(detect_and_process_abandoned_carts())
     return {"message": "Détection des paniers abandonnés lancée"}
 
+@api_router.get("/admin/retention")
+async def get_retention_status(user: User = Depends(require_admin)):
+    """Retention policies and the result of the last sweep"""
+    return {
+        "policies": {policy.name: policy.describe() for policy in RETENTION_POLICIES},
+        "archive_dir": str(RETENTION_ARCHIVE_DIR),
+        "last_run": retention_state["last_run"],
+    }
+
+@api_router.post("/admin/retention/run")
+async def trigger_retention_sweep(user: User = Depends(require_admin)):
+    """Run the retention sweep now"""
+    return {"results": await run_retention_sweep()}
+
 @api_router.get("/admin/abandoned-carts/emails")
 async def get_abandoned_cart_emails(user: User = Depends(require_admin)):
     """Get list of sent abandoned cart emails"""
@@ -6665,15 +8725,81 @@ async def send_abandoned_cart_email_manually(cart_id: str, user: User = Depends(
 
 # ============== CATEGORIES ==============
 
+CATEGORIES = [
+    {"id": "electronique", "name": "Électronique", "icon": "Smartphone"},
+    {"id": "electromenager", "name": "Électroménager", "icon": "Refrigerator"},
+    {"id": "decoration", "name": "Décoration & Mobilier", "icon": "Sofa"},
+    {"id": "beaute", "name": "Beauté & Bien-être", "icon": "Sparkles"},
+    {"id": "automobile", "name": "Automobile", "icon": "Car"}
+]
+
+# Static payload, encoded once at import
+CATEGORIES_RESPONSE = encode_response(CATEGORIES)
+
 @api_router.get("/categories")
 async def get_categories():
-    return [
-        {"id": "electronique", "name": "Électronique", "icon": "Smartphone"},
-        {"id": "electromenager", "name": "Électroménager", "icon": "Refrigerator"},
-        {"id": "decoration", "name": "Décoration & Mobilier", "icon": "Sofa"},
-        {"id": "beaute", "name": "Beauté & Bien-être", "icon": "Sparkles"},
-        {"id": "automobile", "name": "Automobile", "icon": "Car"}
-    ]
+    return CATEGORIES_RESPONSE.to_response()
+
+# ============== HOMEPAGE ==============
+
+# The homepage payload is built in the background and served from memory.
+# Catalog and flash sale invalidations (local or from other workers) schedule
+# a rebuild, as does every refresh of the review highlights; a periodic
+# refresh also picks up stock changes and flash sales reaching their end date.
+HOME_SNAPSHOT_TAGS = ("products", "flash_sales")
+HOME_SNAPSHOT_REFRESH_SECONDS = 60
+HOME_SECTION_LIMIT = 8
+
+home_snapshot = {"encoded": None, "version": 0, "built_at": None}
+home_snapshot_lock = asyncio.Lock()
+
+async def build_home_snapshot() -> EncodedResponse:
+    """Query every homepage section concurrently and encode them as one payload"""
+    async with home_snapshot_lock:
+        (featured, _), (new, _), (promo, _), flash_sales, highlights = await asyncio.gather(
+            _load_products(None, True, None, None, None, HOME_SECTION_LIMIT, 0),
+            _load_products(None, None, True, None, None, HOME_SECTION_LIMIT, 0),
+            _load_products(None, None, None, True, None, HOME_SECTION_LIMIT, 0),
+            _load_flash_sales(),
+            get_review_highlights()
+        )
+        now = datetime.now(timezone.utc)
+        version = home_snapshot["version"] + 1
+        
+        def product_list(products):
+            return PRODUCT_LIST_ADAPTER.dump_python(PRODUCT_LIST_ADAPTER.validate_python(products), mode="json")
+        
+        encoded = encode_response({
+            "version": version,
+            "catalog_version": catalog_state["version"],
+            "generated_at": now.isoformat(),
+            "featured": product_list(featured),
+            "new_arrivals": product_list(new),
+            "promotions": product_list(promo),
+            "flash_sales": flash_sales,
+            "featured_reviews": highlights["featured"],
+            "reviews_stats": highlights["stats"],
+            "categories": CATEGORIES
+        })
+        home_snapshot.update(encoded=encoded, version=version, built_at=now)
+        return encoded
+
+snapshot_subscriptions.append((HOME_SNAPSHOT_TAGS, "home", build_home_snapshot))
+
+async def refresh_home_snapshot():
+    """Scheduled refresh, also the startup pre-warm"""
+    try:
+        await build_home_snapshot()
+    except Exception as e:
+        logger.error(f"Homepage snapshot refresh failed: {e}")
+
+@api_router.get("/home")
+async def get_home():
+    """Homepage sections in one payload, served from memory"""
+    encoded = home_snapshot["encoded"]
+    if encoded is None:
+        encoded = await build_home_snapshot()
+    return encoded.to_response()
 
 # ============== SEO - SITEMAP ==============
 
@@ -7147,6 +9273,10 @@ async def seed_database():
             }
         )
     
+    # Seeded products join the change feed and replace any cached empty listings
+    await backfill_catalog_versions()
+    await invalidate_catalog()
+    
     return {"message": "Base de données initialisée", "products": total_products, "flash_sales": len(flash_sale_updates)}
 
 # ============== APPOINTMENT BOOKING SYSTEM ==============
@@ -8005,7 +10135,9 @@ async def get_service_providers(
     search: Optional[str] = None,
     sort_by: str = "rating",  # rating, price, reviews
     limit: int = 20,
-    skip: int = 0
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    count: str = "exact"
 ):
     """Get service providers with filters"""
     query = {"is_active": True}
@@ -8031,23 +10163,26 @@ async def get_service_providers(
             {"description": {"$regex": search, "$options": "i"}}
         ]
     
-    # Sort options
+    # Sort options (provider_id breaks ties so cursors are unambiguous)
     sort_options = {
-        "rating": [("is_premium", -1), ("rating", -1)],
-        "price": [("is_premium", -1), ("price_from", 1)],
-        "reviews": [("is_premium", -1), ("review_count", -1)],
-        "newest": [("created_at", -1)]
+        "rating": [("is_premium", -1), ("rating", -1), ("provider_id", 1)],
+        "price": [("is_premium", -1), ("price_from", 1), ("provider_id", 1)],
+        "reviews": [("is_premium", -1), ("review_count", -1), ("provider_id", 1)],
+        "newest": [("created_at", -1), ("provider_id", 1)]
     }
     sort = sort_options.get(sort_by, sort_options["rating"])
     
-    providers = await db.service_providers.find(query, {"_id": 0, "password": 0}).sort(sort).skip(skip).limit(limit).to_list(limit)
-    total = await db.service_providers.count_documents(query)
+    providers, next_cursor = await paginate_or_400(
+        db.service_providers, query, {"_id": 0, "password": 0}, sort, min(limit, 100), cursor, skip
+    )
+    total = await count_or_400(db.service_providers, query, count)
     
     return {
         "providers": providers,
         "total": total,
         "limit": limit,
-        "skip": skip
+        "skip": skip,
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/services/providers/{provider_id}")
@@ -8861,6 +10996,10 @@ async def reset_test_data(user: User = Depends(require_admin)):
     
     # Delete all reviews
     await db.reviews.delete_many({})
+    await db.products.update_many({}, {"$unset": {
+        "rating_avg": "", "rating_count": "", "rating_sum": "", "rating_histogram": ""
+    }})
+    await db.review_stats.delete_many({})
     
     # Delete cart items
     await db.cart_items.delete_many({})
@@ -8868,10 +11007,8 @@ async def reset_test_data(user: User = Depends(require_admin)):
     # Delete wishlist items
     await db.wishlist_items.delete_many({})
     
-    # Clear all caches
-    clear_cache("products")
-    clear_cache("flash_sales")
-    clear_cache("orders")
+    # Clear all caches in every worker
+    await invalidate_cache(["products", "flash_sales", "orders", "reviews"])
     
     return {
         "message": "Données de test réinitialisées",
@@ -9648,6 +11785,7 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Logging
@@ -9672,12 +11810,20 @@ async def startup_event():
         await db.products.create_index("is_promo")
         await db.products.create_index("is_flash_sale")
         await db.products.create_index([("name", "text"), ("description", "text")])
+        # Keyset pagination of category listings (PRODUCT_LIST_SORT); unfiltered pages use _id directly
+        await db.products.create_index([("category", 1), ("_id", 1)])
+        # Catalog change feed
+        await db.products.create_index("catalog_version", sparse=True)
+        await db.catalog_tombstones.create_index("catalog_version")
         
         # Orders indexes
         await db.orders.create_index("order_id", unique=True)
         await db.orders.create_index("user_id")
         await db.orders.create_index("created_at")
         await db.orders.create_index("order_status")
+        # Keyset pagination for the admin order list (ORDER_LIST_SORT), with and without status filter
+        await db.orders.create_index([("created_at", -1), ("order_id", -1)])
+        await db.orders.create_index([("order_status", 1), ("created_at", -1), ("order_id", -1)])
         
         # Users indexes
         await db.users.create_index("user_id", unique=True)
@@ -9694,17 +11840,41 @@ async def startup_event():
         
         # Cart indexes
         await db.carts.create_index("cart_id", unique=True)
-        await db.carts.create_index("user_id")
-        await db.carts.create_index("session_id")
+        await ensure_cart_owner_indexes()
+        # Abandoned-cart scans and the retention sweep select by updated_at
+        await db.carts.create_index([("user_id", 1), ("updated_at", 1)])
         
         # Sessions indexes
         await db.user_sessions.create_index("session_token")
         await db.user_sessions.create_index("user_id")
         
+        # Retention: the age fields the sweep scans (TTL indexes are created below)
+        await db.password_resets.create_index("token")
+        await db.chat_sessions.create_index("updated_at")
+        await db.notifications.create_index("sent_at")
+        await db.abandoned_cart_stats.create_index("run_at")
+        await db.abandoned_cart_emails.create_index("sent_at")
+        
+        # Stock reservations: the expiry sweep scans held reservations by expires_at
+        await db.stock_reservations.create_index("reservation_id", unique=True)
+        await db.stock_reservations.create_index("order_id")
+        await db.stock_reservations.create_index([("status", 1), ("expires_at", 1)])
+        await db.stock_reservations.create_index("settle_id", sparse=True)
+        
+        # Service providers: keyset pagination for each sort_by option
+        await db.service_providers.create_index("provider_id", unique=True)
+        await db.service_providers.create_index([("is_active", 1), ("is_premium", -1), ("rating", -1), ("provider_id", 1)])
+        await db.service_providers.create_index([("is_active", 1), ("is_premium", -1), ("price_from", 1), ("provider_id", 1)])
+        await db.service_providers.create_index([("is_active", 1), ("is_premium", -1), ("review_count", -1), ("provider_id", 1)])
+        await db.service_providers.create_index([("is_active", 1), ("created_at", -1), ("provider_id", 1)])
+        
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.warning(f"Index creation warning (may already exist): {e}")
     
+    # Separate so a conflicting TTL index cannot stop the indexes above
+    await ensure_ttl_indexes(db, RETENTION_POLICIES)
+    
     # Start abandoned cart scheduler
     logger.info("Starting abandoned cart scheduler...")
     scheduler.add_job(
@@ -9715,6 +11885,24 @@ async def startup_event():
         replace_existing=True
     )
     
+    # Release stock held by unpaid mobile money orders
+    scheduler.add_job(
+        release_expired_reservations,
+        IntervalTrigger(minutes=1),
+        id="reservation_sweep",
+        name="Stock Reservation Expiry",
+        replace_existing=True
+    )
+    
+    # Data retention sweep (nightly, before the index rebuilds)
+    scheduler.add_job(
+        run_retention_sweep,
+        CronTrigger(hour=3, minute=15),
+        id="retention_sweep",
+        name="Data Retention Sweep",
+        replace_existing=True
+    )
+    
     # Start post-purchase review scheduler (daily at 10 AM)
     scheduler.add_job(
         process_post_purchase_reviews,
@@ -9760,10 +11948,122 @@ async def startup_event():
         replace_existing=True
     )
     
+    # Full search index rebuild as a safety net for missed invalidations
+    scheduler.add_job(
+        rebuild_search_index,
+        IntervalTrigger(hours=1),
+        id="search_index_rebuild",
+        name="Search Index Rebuild",
+        replace_existing=True
+    )
+    
+    # Drop expired cache entries in the background
+    scheduler.add_job(
+        purge_expired_cache,
+        IntervalTrigger(seconds=CACHE_PURGE_INTERVAL_SECONDS),
+        id="cache_purge_expired",
+        name="Cache Expiry Sweep",
+        replace_existing=True
+    )
+    
+    # Safety net for the in-memory review highlights
+    scheduler.add_job(
+        refresh_review_highlights,
+        IntervalTrigger(minutes=REVIEW_HIGHLIGHTS_REFRESH_MINUTES),
+        id="review_highlights_refresh",
+        name="Review Highlights Refresh",
+        replace_existing=True
+    )
+    
+    # Repair drift in the per-product rating summaries
+    scheduler.add_job(
+        reconcile_rating_summaries,
+        CronTrigger(hour=4, minute=0),
+        id="rating_summaries_reconcile",
+        name="Rating Summary Reconciliation",
+        replace_existing=True
+    )
+    
+    # Nightly recomputation of content-similarity neighbours
+    scheduler.add_job(
+        rebuild_similarity_index,
+        CronTrigger(hour=3, minute=45),
+        id="similarity_index_rebuild",
+        name="Similarity Index Rebuild",
+        replace_existing=True
+    )
+    
+    # Nightly full recount of purchase co-occurrences
+    scheduler.add_job(
+        rebuild_recommendations,
+        CronTrigger(hour=3, minute=30),
+        id="recommendations_rebuild",
+        name="Recommendation Index Rebuild",
+        replace_existing=True
+    )
+    
+    # Keep the homepage snapshot fresh (stock levels, ending flash sales)
+    scheduler.add_job(
+        refresh_home_snapshot,
+        IntervalTrigger(seconds=HOME_SNAPSHOT_REFRESH_SECONDS),
+        id="home_snapshot_refresh",
+        name="Homepage Snapshot Refresh",
+        replace_existing=True
+    )
+    
+    if CATALOG_REPLICA_ENABLED:
+        # Catch up with catalog writes that did not publish an invalidation (stock)
+        scheduler.add_job(
+            sync_catalog_replica,
+            IntervalTrigger(seconds=CATALOG_REPLICA_POLL_SECONDS),
+            id="catalog_replica_sync",
+            name="Catalog Replica Sync",
+            replace_existing=True
+        )
+        # Full reload as a safety net for changes made outside the API
+        scheduler.add_job(
+            load_catalog_replica,
+            IntervalTrigger(minutes=CATALOG_REPLICA_RELOAD_MINUTES),
+            id="catalog_replica_reload",
+            name="Catalog Replica Reload",
+            replace_existing=True
+        )
+    
     scheduler.start()
     logger.info("All email marketing schedulers started successfully")
+    
+    # Build the in-memory search index
+    try:
+        await rebuild_search_index()
+    except Exception as e:
+        logger.warning(f"Search index build failed, falling back to MongoDB text search: {e}")
+    
+    # Version products that predate the catalog change feed
+    await backfill_catalog_versions()
+    
+    # Load the in-memory catalog replica (listings fall back to MongoDB until then)
+    await load_catalog_replica()
+    
+    # Backfill rating summaries on products that predate them
+    asyncio.create_task(reconcile_rating_summaries())
+    
+    # Similar-product neighbours take a few seconds on large catalogs, build them in the background
+    asyncio.create_task(rebuild_similarity_index())
+    
+    # Load purchase co-occurrences for "frequently bought together"
+    await rebuild_recommendations()
+    
+    # Pre-warm the homepage snapshot
+    await refresh_home_snapshot()
+    
+    # Receive cache invalidations published by the other workers
+    try:
+        await cache_bus.start(on_remote_invalidation)
+    except Exception as e:
+        logger.warning(f"Cache invalidation bus unavailable, relying on TTL expiry: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     scheduler.shutdown()
+    await cache_bus.stop()
     client.close()
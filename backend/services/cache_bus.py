@@ -0,0 +1,162 @@
+"""
+Cache invalidation bus for YAMA+ e-commerce platform
+Broadcasts tagged invalidations so every uvicorn worker drops the same cache entries
+"""
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# handler(tags, product_ids) - product_ids is None when the whole tag changed
+InvalidationHandler = Callable[[List[str], Optional[List[str]]], Awaitable[None]]
+
+
+class InvalidationBus(ABC):
+    """
+    Base class for invalidation backends.
+
+    publish() never calls back into the publishing worker: callers apply the
+    invalidation locally first, the bus only fans it out to the other workers.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._handler: Optional[InvalidationHandler] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: InvalidationHandler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    @abstractmethod
+    async def publish(self, tags: Iterable[str], product_ids: Optional[Iterable[str]] = None):
+        """Fan an invalidation out to the other workers"""
+
+    async def _deliver(self, tags: List[str], product_ids: Optional[List[str]]):
+        if not self._handler:
+            return
+        self.received += 1
+        try:
+            await self._handler(tags, product_ids)
+        except Exception as e:
+            logger.error(f"Cache invalidation handler failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "received": self.received
+        }
+
+
+class InProcessInvalidationBus(InvalidationBus):
+    """
+    Single-process backend (tests, one worker).
+    Buses sharing the same hub list behave like separate workers.
+    """
+
+    def __init__(self, hub: Optional[list] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+
+    async def publish(self, tags: Iterable[str], product_ids: Optional[Iterable[str]] = None):
+        tags = list(tags)
+        product_ids = list(product_ids) if product_ids is not None else None
+        self.published += 1
+        for bus in self.hub:
+            if bus is not self:
+                await bus._deliver(tags, product_ids)
+
+
+class MongoInvalidationBus(InvalidationBus):
+    """
+    Multi-worker backend tailing a capped collection.
+    Works on standalone MongoDB (unlike change streams, which need a replica set).
+    """
+
+    def __init__(self, database, collection_name: str = "cache_invalidations",
+                 size_bytes: int = 1024 * 1024, max_documents: int = 5000):
+        super().__init__()
+        self.database = database
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.max_documents = max_documents
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.database[self.collection_name]
+
+    async def start(self, handler: InvalidationHandler):
+        await super().start(handler)
+        try:
+            await self.database.create_collection(
+                self.collection_name, capped=True, size=self.size_bytes, max=self.max_documents
+            )
+        except CollectionInvalid:
+            pass  # Already created by another worker
+
+        # A tailable cursor on an empty capped collection dies immediately
+        last = await self.collection.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            result = await self.collection.insert_one({"tags": [], "origin": "bootstrap"})
+            last_id = result.inserted_id
+        else:
+            last_id = last["_id"]
+
+        self._task = asyncio.create_task(self._tail(last_id))
+        logger.info(f"Cache invalidation bus started (worker {self.worker_id})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await super().stop()
+
+    async def publish(self, tags: Iterable[str], product_ids: Optional[Iterable[str]] = None):
+        try:
+            await self.collection.insert_one({
+                "tags": list(tags),
+                "product_ids": list(product_ids) if product_ids is not None else None,
+                "origin": self.worker_id,
+                "created_at": datetime.now(timezone.utc)
+            })
+            self.published += 1
+        except Exception as e:
+            # Other workers fall back to TTL expiry; never fail the write that triggered this
+            logger.error(f"Failed to publish cache invalidation: {e}")
+
+    async def _tail(self, last_id):
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {"_id": {"$gt": last_id}},
+                    cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        if doc.get("origin") != self.worker_id and doc.get("tags"):
+                            await self._deliver(doc["tags"], doc.get("product_ids"))
+                await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation bus cursor error, retrying: {e}")
+                await asyncio.sleep(2)
@@ -0,0 +1,291 @@
+"""
+In-memory cache service for YAMA+ e-commerce platform
+Bounded LRU cache with TTL expiry, tag-indexed invalidation and hit/miss counters,
+plus single-flight loading and optional stale-while-revalidate
+"""
+import asyncio
+import heapq
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value) + 33
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def key_namespace(key: str) -> str:
+    """Namespace of a cache key ("products:electronique:..." -> "products")"""
+    return key.split(":", 1)[0]
+
+
+class _CacheEntry:
+    __slots__ = ("value", "size", "expires_at", "stale_until", "tags")
+
+    def __init__(self, value: Any, size: int, expires_at: float, stale_until: float, tags: Set[str]):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.tags = tags
+
+
+class TTLCache:
+    """
+    LRU cache bounded by entry count and byte budget.
+
+    Every key is tagged with its namespace (the part before the first ":")
+    plus any extra tags passed to set(), so invalidating a tag only touches
+    the keys indexed under it. Expired entries are dropped lazily on read
+    and eagerly by purge_expired(), which the scheduler runs periodically.
+
+    get_or_load() coalesces concurrent misses for the same key onto a single
+    loader call. With stale_ttl > 0 an expired entry is kept that much longer
+    and served while one background task refreshes it.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        # Tags each in-flight load will store its result under
+        self._inflight_tags: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.rejected = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.load_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires_at > time.time()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        now = time.time()
+        if entry.expires_at <= now:
+            # Entries still inside their stale window stay around for get_or_load()
+            if entry.stale_until <= now:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, tags: Optional[Iterable[str]] = None,
+            stale_ttl: float = 0) -> bool:
+        """Store a value; returns False if it is larger than the whole byte budget"""
+        size = estimate_size(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            self.rejected += 1
+            return False
+
+        if key in self._entries:
+            self._remove(key)
+
+        entry_tags = {key_namespace(key)}
+        if tags:
+            entry_tags.update(tags)
+
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        stale_until = expires_at + max(stale_ttl, 0)
+        self._entries[key] = _CacheEntry(value, size, expires_at, stale_until, entry_tags)
+        self._bytes += size
+        for tag in entry_tags:
+            self._tags.setdefault(tag, set()).add(key)
+        heapq.heappush(self._expiry_heap, (stale_until, key))
+
+        self._evict_overflow()
+        return True
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                          tags: Optional[Iterable[str]] = None, stale_ttl: float = 0) -> Any:
+        """
+        Read-through lookup: on a miss, the first caller runs loader() and every
+        concurrent caller for the same key awaits that same result.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.time()
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            if now < entry.stale_until:
+                # Serve the last value and let a single background task refresh it
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._start_load(key, loader, ttl, tags, stale_ttl)
+                return entry.value
+
+        self.misses += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._start_load(key, loader, ttl, tags, stale_ttl)
+        else:
+            self.coalesced += 1
+        # shield: a cancelled request must not cancel the load other callers wait on
+        return await asyncio.shield(future)
+
+    def delete(self, key: str) -> bool:
+        """Remove a single key"""
+        self._forget_load(key)
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+            return True
+        return False
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Remove every key indexed under a tag; cost is proportional to that tag's size"""
+        # Loads already running under this tag may have read pre-invalidation data,
+        # don't let them store it; loads for other tags are unaffected
+        for key in [k for k, load_tags in self._inflight_tags.items() if tag in load_tags]:
+            self._forget_load(key)
+        keys = self._tags.pop(tag, None)
+        if not keys:
+            return 0
+        for key in list(keys):
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        self._inflight.clear()
+        self._inflight_tags.clear()
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+        self._expiry_heap.clear()
+        self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Remove all expired entries, returns how many were dropped"""
+        now = time.time()
+        purged = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            stale_until, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # Heap items are never updated in place; skip those superseded by a later set()
+            if entry is not None and entry.stale_until == stale_until:
+                self._remove(key)
+                purged += 1
+
+        # Overwritten keys leave stale heap items behind, rebuild when they pile up
+        if len(heap) > 2 * len(self._entries) + 1024:
+            self._expiry_heap = [(e.stale_until, k) for k, e in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+        self.expirations += purged
+        return purged
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and occupancy for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "tags": len(self._tags),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "rejected": self.rejected,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "load_errors": self.load_errors,
+            "inflight": len(self._inflight)
+        }
+
+    def _start_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float],
+                    tags: Optional[Iterable[str]], stale_ttl: float) -> "asyncio.Future":
+        load_tags = {key_namespace(key)}
+        if tags:
+            load_tags.update(tags)
+
+        async def run():
+            # Still the registered load at the end means no invalidation touched it
+            current = False
+            try:
+                value = await loader()
+            except Exception:
+                self.load_errors += 1
+                raise
+            finally:
+                current = self._inflight.get(key) is future
+                if current:
+                    self._forget_load(key)
+            if current:
+                self.set(key, value, ttl=ttl, tags=tags, stale_ttl=stale_ttl)
+            return value
+
+        future = asyncio.ensure_future(run())
+        future.add_done_callback(self._log_load_error)
+        self._inflight[key] = future
+        self._inflight_tags[key] = load_tags
+        return future
+
+    def _forget_load(self, key: str):
+        self._inflight.pop(key, None)
+        self._inflight_tags.pop(key, None)
+
+    @staticmethod
+    def _log_load_error(future: "asyncio.Future"):
+        # Background refreshes have no awaiting caller, surface their failures here
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Cache loader failed: {future.exception()}")
+
+    def _evict_overflow(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
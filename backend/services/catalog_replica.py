@@ -0,0 +1,233 @@
+"""
+Catalog replica for YAMA+ e-commerce platform
+In-process copy of the product collection with bitmap indexes, answering
+listing, flash sale and facet queries without a database round trip
+"""
+import bisect
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Fields with an equality bitmap (value -> rows); listing filters may only use these
+BITMAP_FIELDS = ("category", "featured", "is_new", "is_promo", "is_flash_sale")
+
+# Dead rows are reclaimed once they make up this share of the table
+COMPACT_RATIO = 0.5
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    """
+    Apply a MongoDB-style top-level projection: inclusion (field: 1,
+    field: {"$slice": n}) or exclusion (field: 0). _id is never stored.
+    """
+    if not projection:
+        return dict(doc)
+    included = {k: v for k, v in projection.items() if k != "_id" and v}
+    if not included:
+        excluded = {k for k, v in projection.items() if not v}
+        return {k: v for k, v in doc.items() if k not in excluded}
+    result = {}
+    for field, spec in included.items():
+        if field not in doc:
+            continue
+        value = doc[field]
+        if isinstance(spec, dict) and "$slice" in spec and isinstance(value, list):
+            count = spec["$slice"]
+            value = value[:count] if count >= 0 else value[count:]
+        result[field] = value
+    return result
+
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Set bit positions of a bitmap, lowest first"""
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+class CatalogReplica:
+    """
+    Products held in rows ordered by _id (the listing order).
+
+    Each row keeps the stored document and its _id; BITMAP_FIELDS get one
+    Python int per distinct value with a bit set for every row holding it,
+    so a filter is an AND of a few ints and a page walks the set bits from
+    the cursor position. version is the highest catalog_version applied.
+    """
+
+    def __init__(self):
+        self._docs: List[Optional[dict]] = []
+        self._keys: List[Any] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = 0
+        self._bitmaps: Dict[str, Dict[Any, int]] = {field: {} for field in BITMAP_FIELDS}
+        self.version = 0
+        self.ready = False
+
+    # ----- maintenance -----
+
+    def load(self, products: Iterable[dict], version: int):
+        """Replace the replica with full product documents (including _id)"""
+        self._docs = []
+        self._keys = []
+        self._rows = {}
+        self._alive = 0
+        self._bitmaps = {field: {} for field in BITMAP_FIELDS}
+        for product in sorted(products, key=lambda p: p["_id"]):
+            self._append(product)
+        self.version = version
+        self.ready = True
+
+    def apply(self, upserts: Iterable[dict], deleted_ids: Iterable[str], version: int):
+        """Apply changes read from the catalog; replays of older changes are ignored"""
+        for product in upserts:
+            row = self._rows.get(product["product_id"])
+            if row is not None:
+                current = self._docs[row]
+                if (current.get("catalog_version") or 0) > (product.get("catalog_version") or 0):
+                    continue
+                self._unindex(row)
+                self._docs[row] = self._strip(product)
+                self._index(row)
+            elif not self._keys or product["_id"] > self._keys[-1]:
+                self._append(product)
+            else:
+                # Out-of-order _id (ids generated elsewhere): rebuild the row order
+                self.load(list(self._documents_with_keys()) + [product], self.version)
+        for product_id in deleted_ids:
+            self._delete(product_id)
+        self.version = max(self.version, version)
+        if len(self._docs) > 32 and len(self._rows) < len(self._docs) * COMPACT_RATIO:
+            self.load(list(self._documents_with_keys()), self.version)
+
+    @staticmethod
+    def _strip(product: dict) -> dict:
+        return {k: v for k, v in product.items() if k != "_id"}
+
+    def _append(self, product: dict):
+        row = len(self._docs)
+        self._docs.append(self._strip(product))
+        self._keys.append(product["_id"])
+        self._rows[product["product_id"]] = row
+        self._index(row)
+
+    def _delete(self, product_id: str):
+        row = self._rows.pop(product_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        # The key stays so _keys remains sorted for cursor lookups
+        self._docs[row] = None
+
+    def _index(self, row: int):
+        doc = self._docs[row]
+        bit = 1 << row
+        self._alive |= bit
+        for field, bitmaps in self._bitmaps.items():
+            value = doc.get(field)
+            bitmaps[value] = bitmaps.get(value, 0) | bit
+
+    def _unindex(self, row: int):
+        doc = self._docs[row]
+        bit = 1 << row
+        self._alive &= ~bit
+        for field, bitmaps in self._bitmaps.items():
+            value = doc.get(field)
+            remaining = bitmaps.get(value, 0) & ~bit
+            if remaining:
+                bitmaps[value] = remaining
+            else:
+                bitmaps.pop(value, None)
+
+    def _documents_with_keys(self) -> Iterator[dict]:
+        for key, doc in zip(self._keys, self._docs):
+            if doc is not None:
+                yield {**doc, "_id": key}
+
+    # ----- querying -----
+
+    @staticmethod
+    def supports(filters: dict) -> bool:
+        """Whether a listing filter is plain equality on indexed fields"""
+        return all(field in BITMAP_FIELDS and not isinstance(value, dict) for field, value in filters.items())
+
+    def match(self, filters: dict, product_ids: Optional[Iterable[str]] = None) -> int:
+        """Bitmap of the rows matching every equality filter (and product_ids when given)"""
+        bitmap = self._alive
+        for field, value in filters.items():
+            bitmap &= self._bitmaps[field].get(value, 0)
+            if not bitmap:
+                return 0
+        if product_ids is not None:
+            wanted = 0
+            for product_id in product_ids:
+                row = self._rows.get(product_id)
+                if row is not None:
+                    wanted |= 1 << row
+            bitmap &= wanted
+        return bitmap
+
+    def count(self, bitmap: int) -> int:
+        return bitmap.bit_count()
+
+    def documents(self, bitmap: int) -> Iterator[dict]:
+        """Stored documents of a bitmap in listing order (read-only)"""
+        for row in iter_bits(bitmap):
+            yield self._docs[row]
+
+    def find(
+        self,
+        filters: dict,
+        projection: Optional[dict],
+        limit: int,
+        skip: int = 0,
+        after: Any = None,
+        exclude: Iterable[str] = ()
+    ) -> Tuple[List[dict], Optional[Any]]:
+        """
+        One page in _id order, starting after the _id `after` (keyset) or at
+        `skip`. Returns (documents, _id of the last one when more follow).
+        """
+        bitmap = self.match(filters)
+        for product_id in exclude:
+            row = self._rows.get(product_id)
+            if row is not None:
+                bitmap &= ~(1 << row)
+        if after is not None:
+            start = bisect.bisect_right(self._keys, after)
+            bitmap = (bitmap >> start) << start
+
+        page: List[int] = []
+        for row in iter_bits(bitmap):
+            if skip:
+                skip -= 1
+                continue
+            page.append(row)
+            if len(page) > limit:
+                break
+
+        more = len(page) > limit
+        page = page[:limit]
+        docs = [project(self._docs[row], projection) for row in page]
+        return docs, (self._keys[page[-1]] if more and page else None)
+
+    def get_many(self, product_ids: Iterable[str], projection: Optional[dict],
+                 filters: Optional[dict] = None) -> Dict[str, dict]:
+        """{product_id: projected document} for the ids present (and matching filters)"""
+        found = {}
+        for product_id in product_ids:
+            row = self._rows.get(product_id)
+            if row is None:
+                continue
+            doc = self._docs[row]
+            if filters and any(doc.get(field) != value for field, value in filters.items()):
+                continue
+            found[product_id] = project(doc, projection)
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "version": self.version,
+            "products": len(self._rows),
+            "rows": len(self._docs),
+        }
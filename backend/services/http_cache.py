@@ -0,0 +1,183 @@
+"""
+HTTP response cache helpers for YAMA+ e-commerce platform
+Pre-encoded JSON bodies with strong ETags, per-route Cache-Control policies
+and conditional GET (If-None-Match / If-Modified-Since -> 304)
+"""
+import hashlib
+import json
+import re
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, the stdlib encoder produces the same JSON (just slower)
+    orjson = None
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Encode a payload to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class EncodedResponse:
+    """A JSON body encoded once, stored in the cache and replayed on every hit"""
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.etag = make_etag(body)
+        self.headers = headers or {}
+
+    def to_response(self, status_code: int = 200) -> Response:
+        return Response(
+            content=self.body,
+            status_code=status_code,
+            media_type="application/json",
+            headers={"ETag": self.etag, **self.headers}
+        )
+
+
+def encode_response(payload: Any, headers: Optional[Dict[str, str]] = None) -> EncodedResponse:
+    """Encode a plain JSON-compatible payload"""
+    return EncodedResponse(dumps(payload), headers)
+
+
+# ============== CACHE POLICIES ==============
+
+class CachePolicy:
+    """
+    Cache-Control value for a group of routes.
+    Conditional policies get an ETag (and Last-Modified when a clock is set)
+    and answer 304 when the client already holds the current representation.
+    """
+    __slots__ = ("name", "cache_control", "conditional", "last_modified")
+
+    def __init__(self, name: str, cache_control: str, conditional: bool = False,
+                 last_modified: Optional[Callable[[], datetime]] = None):
+        self.name = name
+        self.cache_control = cache_control
+        self.conditional = conditional
+        self.last_modified = last_modified
+
+
+NO_STORE = CachePolicy("no-store", "no-store, max-age=0")
+
+
+class CachePolicyRegistry:
+    """Maps GET routes ("/api/products/{product_id}") to cache policies, anything else is no-store"""
+
+    def __init__(self, default: CachePolicy = NO_STORE):
+        self.default = default
+        self._exact: Dict[str, CachePolicy] = {}
+        self._patterns: List[Tuple["re.Pattern", CachePolicy]] = []
+
+    def add(self, route: str, policy: CachePolicy):
+        if "{" in route:
+            regex = re.escape(route)
+            regex = re.sub(r"\\\{[^}]+\\\}", "[^/]+", regex)
+            self._patterns.append((re.compile(f"^{regex}$"), policy))
+        else:
+            self._exact[route] = policy
+
+    def resolve(self, method: str, path: str) -> CachePolicy:
+        if method not in ("GET", "HEAD"):
+            return self.default
+        policy = self._exact.get(path)
+        if policy is not None:
+            return policy
+        for pattern, policy in self._patterns:
+            if pattern.match(path):
+                return policy
+        return self.default
+
+
+# ============== CONDITIONAL GET ==============
+
+def format_http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """If-None-Match wins over If-Modified-Since when both are sent"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return bool(etag) and etag_matches(if_none_match, etag)
+    if last_modified is not None:
+        since = parse_http_date(request.headers.get("if-modified-since"))
+        if since is not None:
+            return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+async def conditional_response(request: Request, response: Response, policy: CachePolicy) -> Response:
+    """
+    Add validators to a 200 response and turn it into a 304 when the client's
+    copy is current. Responses without an ETag are buffered and hashed.
+    """
+    etag = response.headers.get("etag")
+    if etag is None:
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+        response = Response(content=body, status_code=response.status_code, headers=headers)
+        etag = make_etag(body)
+        response.headers["ETag"] = etag
+
+    last_modified = policy.last_modified() if policy.last_modified else None
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        headers = {"ETag": etag}
+        if last_modified is not None:
+            headers["Last-Modified"] = response.headers["Last-Modified"]
+        return Response(status_code=304, headers=headers)
+
+    return response
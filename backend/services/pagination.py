@@ -0,0 +1,152 @@
+"""
+Pagination helpers for YAMA+ e-commerce platform
+Keyset (cursor) pagination over MongoDB collections and optional count modes
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+
+SortSpec = Sequence[Tuple[str, int]]
+
+# exact: count_documents, estimated: collection metadata when the query is
+# unfiltered (capped count otherwise), none: skip counting entirely
+COUNT_MODES = ("exact", "estimated", "none")
+ESTIMATED_COUNT_CAP = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# ============== CURSOR ENCODING ==============
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$oid" in value:
+            return ObjectId(value["$oid"])
+        if "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort: SortSpec, doc: dict) -> str:
+    """Opaque cursor holding the sort key of the last document of a page"""
+    values = [_encode_value(doc.get(field)) for field, _ in sort]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(sort: SortSpec, cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise ValueError("sort key mismatch")
+        return [_decode_value(v) for v in values]
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {e}") from e
+
+
+# ============== KEYSET FILTER ==============
+
+def _after(field: str, value: Any, direction: int) -> Optional[dict]:
+    """
+    Condition for documents strictly after value on one field.
+    MongoDB sorts null/missing below everything, and $gt/$lt never match
+    null, so nulls need their own branch.
+    """
+    if value is None:
+        return {field: {"$ne": None}} if direction == 1 else None
+    if direction == 1:
+        return {field: {"$gt": value}}
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> dict:
+    """
+    Filter selecting documents after the cursor in sort order:
+    (a > x) or (a == x and b > y) or ...
+    """
+    branches = []
+    equal: Dict[str, Any] = {}
+    for (field, direction), value in zip(sort, values):
+        condition = _after(field, value, direction)
+        if condition is not None:
+            branches.append({**equal, **condition})
+        equal = {**equal, field: value}
+    if not branches:
+        # Cursor on the very last possible key
+        return {"_id": {"$exists": False}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def _merge(query: dict, extra: dict) -> dict:
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
+
+
+async def paginate(
+    collection,
+    query: dict,
+    projection: Optional[dict],
+    sort: SortSpec,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch one page sorted by `sort`, whose last field must be unique.
+    Returns (documents, next_cursor); next_cursor is None on the last page.
+    skip is only honoured without a cursor (legacy offset clients).
+    """
+    if cursor:
+        query = _merge(query, keyset_filter(sort, decode_cursor(sort, cursor)))
+        skip = 0
+
+    # Sort fields must come back to build the next cursor
+    fetch_projection = projection
+    hidden = []
+    if projection is not None:
+        fetch_projection = dict(projection)
+        inclusive = any(v for k, v in projection.items() if k != "_id")
+        for field, _ in sort:
+            if fetch_projection.get(field) == 0 or (inclusive and field not in fetch_projection):
+                fetch_projection[field] = 1
+                hidden.append(field)
+
+    find = collection.find(query, fetch_projection).sort(list(sort))
+    if skip:
+        find = find.skip(skip)
+    docs = await find.limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(sort, docs[-1])
+    for doc in docs:
+        for field in hidden:
+            doc.pop(field, None)
+    return docs, next_cursor
+
+
+async def count(collection, query: dict, mode: str = "exact") -> Optional[int]:
+    """Total for a list response according to the requested count mode"""
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        if not query:
+            return await collection.estimated_document_count()
+        return await collection.count_documents(query, limit=ESTIMATED_COUNT_CAP)
+    return await collection.count_documents(query)
@@ -0,0 +1,49 @@
+"""
+Product loader for YAMA+ e-commerce platform
+Batched product lookups: the ids a request or job needs are resolved with
+one $in query per chunk
+"""
+from typing import Dict, Iterable, List, Optional
+
+# Keeps each $in list (and the BSON query document) reasonably small
+MAX_BATCH_SIZE = 500
+
+
+class ProductLoader:
+    """
+    Batched product loader.
+
+    load_many() fetches the ids it has not seen yet in one query; results
+    (including misses) are memoised for the loader's lifetime, so create one
+    per request or per background job run.
+    """
+
+    def __init__(self, collection, projection: Optional[dict] = None, id_field: str = "product_id"):
+        self.collection = collection
+        self.projection = projection if projection is not None else {"_id": 0}
+        self.id_field = id_field
+        self._results: Dict[str, Optional[dict]] = {}
+        self.queries = 0
+
+    async def load_many(self, product_ids: Iterable[str]) -> Dict[str, dict]:
+        """{product_id: product} for the ids that exist, in one round trip"""
+        ids = [pid for pid in dict.fromkeys(product_ids) if pid]
+        missing = [pid for pid in ids if pid not in self._results]
+        if missing:
+            await self._fetch(missing)
+        return {pid: self._results[pid] for pid in ids if self._results.get(pid) is not None}
+
+    async def _fetch(self, product_ids: List[str]):
+        projection = self.projection
+        if any(v for k, v in projection.items() if k != "_id") and self.id_field not in projection:
+            projection = {**projection, self.id_field: 1}
+        for start in range(0, len(product_ids), MAX_BATCH_SIZE):
+            chunk = product_ids[start:start + MAX_BATCH_SIZE]
+            self.queries += 1
+            docs = await self.collection.find(
+                {self.id_field: {"$in": chunk}}, projection
+            ).to_list(len(chunk))
+            for product_id in chunk:
+                self._results[product_id] = None
+            for doc in docs:
+                self._results[doc[self.id_field]] = doc
@@ -0,0 +1,114 @@
+"""
+Recommendation service for YAMA+ e-commerce platform
+Item-to-item co-occurrence over paid orders ("frequently bought together")
+"""
+import heapq
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Neighbours kept per product
+DEFAULT_TOP_K = 10
+
+# Pairs seen in fewer orders than this are treated as noise
+MIN_CO_OCCURRENCE = 1
+
+
+def jaccard(pair_count: int, count_a: int, count_b: int, n_orders: int) -> float:
+    """Share of orders containing either product that contain both"""
+    union = count_a + count_b - pair_count
+    return pair_count / union if union else 0.0
+
+
+def lift(pair_count: int, count_a: int, count_b: int, n_orders: int) -> float:
+    """How much more often the pair occurs than if purchases were independent"""
+    if not count_a or not count_b:
+        return 0.0
+    return pair_count * n_orders / (count_a * count_b)
+
+
+SIMILARITY_MEASURES = {"jaccard": jaccard, "lift": lift}
+
+
+class CoOccurrenceIndex:
+    """
+    Counts how many orders contain each product and each pair of products.
+
+    Orders are added one at a time as they are paid (add_order) or in bulk
+    by build(). Top-K neighbour lists are computed on first request and kept
+    until an order touching that product arrives, so lookups are a dict read.
+    """
+
+    def __init__(self, measure: str = "jaccard", top_k: int = DEFAULT_TOP_K,
+                 min_co_occurrence: int = MIN_CO_OCCURRENCE):
+        self.similarity = SIMILARITY_MEASURES[measure]
+        self.measure = measure
+        self.top_k = top_k
+        self.min_co_occurrence = min_co_occurrence
+        self._item_counts: Dict[str, int] = defaultdict(int)
+        self._pair_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        self.n_orders = 0
+        self.ready = False
+
+    def build(self, orders: Iterable[Iterable[str]]):
+        """Replace the index with the given orders (each an iterable of product ids)"""
+        self._item_counts = defaultdict(int)
+        self._pair_counts = defaultdict(lambda: defaultdict(int))
+        self._neighbours = {}
+        self.n_orders = 0
+        for product_ids in orders:
+            self._count(product_ids)
+        self.ready = True
+
+    def add_order(self, product_ids: Iterable[str]):
+        """Count one more paid order"""
+        items = self._count(product_ids)
+        # Lift depends on the order total, so every list may shift slightly;
+        # only the lists of the products in this order change materially
+        for product_id in items:
+            self._neighbours.pop(product_id, None)
+            for other in self._pair_counts.get(product_id, ()):
+                self._neighbours.pop(other, None)
+
+    def _count(self, product_ids: Iterable[str]) -> List[str]:
+        items = sorted({pid for pid in product_ids if pid})
+        if not items:
+            return []
+        self.n_orders += 1
+        for position, product_id in enumerate(items):
+            self._item_counts[product_id] += 1
+            for other in items[position + 1:]:
+                self._pair_counts[product_id][other] += 1
+                self._pair_counts[other][product_id] += 1
+        return items
+
+    def neighbours(self, product_id: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """[(product_id, score)] best first"""
+        cached = self._neighbours.get(product_id)
+        if cached is None:
+            cached = self._compute(product_id)
+            self._neighbours[product_id] = cached
+        return cached[:limit] if limit else cached
+
+    def _compute(self, product_id: str) -> List[Tuple[str, float]]:
+        pairs = self._pair_counts.get(product_id)
+        if not pairs:
+            return []
+        count_a = self._item_counts[product_id]
+        scored = (
+            (other, self.similarity(pair_count, count_a, self._item_counts[other], self.n_orders), pair_count)
+            for other, pair_count in pairs.items()
+            if pair_count >= self.min_co_occurrence
+        )
+        # Ties (common with few orders) go to the pair bought together most often
+        best = heapq.nlargest(self.top_k, scored, key=lambda row: (row[1], row[2]))
+        return [(other, round(score, 4)) for other, score, _ in best]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "measure": self.measure,
+            "orders": self.n_orders,
+            "products": len(self._item_counts),
+            "pairs": sum(len(p) for p in self._pair_counts.values()) // 2,
+        }
@@ -0,0 +1,106 @@
+"""
+Retention service for YAMA+ e-commerce platform
+Declarative per-collection retention: TTL indexes on native dates and a
+sweep archiving aged documents to gzip NDJSON cold storage
+"""
+import asyncio
+import gzip
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# Documents archived and deleted per round trip
+SWEEP_BATCH_SIZE = 500
+
+
+class RetentionPolicy:
+    """
+    How long documents of one collection are kept.
+
+    Documents whose `field` is older than `keep` are removed; `query`
+    narrows the policy (e.g. guest carts only). With ttl=True the field is
+    a native Date carrying a TTL index, so MongoDB expires documents itself
+    and the sweep only handles older documents that stored an ISO string.
+    With archive=True documents are copied to cold storage before deletion.
+    """
+    __slots__ = ("name", "collection", "field", "keep", "query", "ttl", "archive")
+
+    def __init__(self, name: str, collection: str, field: str, keep: timedelta,
+                 query: Optional[dict] = None, ttl: bool = False, archive: bool = True):
+        self.name = name
+        self.collection = collection
+        self.field = field
+        self.keep = keep
+        self.query = query or {}
+        self.ttl = ttl
+        self.archive = archive
+
+    def describe(self) -> dict:
+        return {
+            "collection": self.collection,
+            "field": self.field,
+            "keep_days": round(self.keep.total_seconds() / 86400, 2),
+            "ttl": self.ttl,
+            "archive": self.archive,
+        }
+
+
+async def ensure_ttl_indexes(db, policies: Iterable[RetentionPolicy]):
+    """
+    One TTL index per ttl policy. A failure (e.g. an existing non-TTL index
+    on the field) is logged and skipped so the other indexes are still created.
+    """
+    for policy in policies:
+        if not policy.ttl:
+            continue
+        try:
+            await db[policy.collection].create_index(
+                policy.field, expireAfterSeconds=int(policy.keep.total_seconds())
+            )
+        except Exception as e:
+            logger.warning(f"TTL index on {policy.collection}.{policy.field} not created: {e}")
+
+
+def archive_path(archive_dir: Path, policy: RetentionPolicy, now: datetime) -> Path:
+    """One file per policy and day; reruns append a new gzip member"""
+    return archive_dir / policy.collection / f"{policy.name}-{now:%Y-%m-%d}.ndjson.gz"
+
+
+def write_archive(path: Path, docs: List[dict]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "ab") as archive:
+        for doc in docs:
+            archive.write(json_util.dumps(doc).encode("utf-8") + b"\n")
+
+
+async def sweep(db, policy: RetentionPolicy, archive_dir: Path, now: Optional[datetime] = None) -> dict:
+    """
+    Archive then delete the documents past retention, oldest first.
+    A document is deleted only after its batch is written, so a crash can
+    archive it twice but never lose it.
+    """
+    now = now or datetime.now(timezone.utc)
+    collection = db[policy.collection]
+    # Dates are stored as ISO strings, which sort chronologically; for TTL
+    # policies this only matches the legacy string values
+    query = {**policy.query, policy.field: {"$lt": (now - policy.keep).isoformat()}}
+    path = archive_path(archive_dir, policy, now)
+
+    archived = deleted = 0
+    while True:
+        docs = await collection.find(query).sort(policy.field, 1).limit(SWEEP_BATCH_SIZE).to_list(SWEEP_BATCH_SIZE)
+        if not docs:
+            break
+        if policy.archive:
+            await asyncio.to_thread(write_archive, path, docs)
+            archived += len(docs)
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        deleted += result.deleted_count
+        if len(docs) < SWEEP_BATCH_SIZE:
+            break
+    return {"archived": archived, "deleted": deleted, "file": str(path) if archived else None}
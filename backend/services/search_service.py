@@ -0,0 +1,250 @@
+"""
+Product search service for YAMA+ e-commerce platform
+In-process inverted index with French accent folding, light stemming,
+BM25 ranking, prefix matching and typo tolerance
+"""
+import bisect
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Searchable fields and their weight in the score
+SEARCH_FIELDS = {
+    "name": 3.0,
+    "brand": 2.5,
+    "subcategory": 1.5,
+    "category": 1.5,
+    "short_description": 1.0,
+    "description": 1.0,
+}
+
+FRENCH_STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "d", "dans", "de", "des", "du", "en", "et",
+    "l", "la", "le", "les", "leur", "ou", "par", "pour", "qu", "que", "qui", "sa", "se",
+    "ses", "son", "sur", "un", "une", "vos", "votre", "the", "and", "for", "with", "of",
+}
+
+# Longest suffixes first; a stem always keeps at least 3 characters
+FRENCH_SUFFIXES = (
+    "issements", "issement", "ations", "ation", "ements", "ement", "ateurs", "ateur",
+    "atrices", "atrice", "euses", "euse", "iques", "ique", "ables", "able", "istes",
+    "iste", "eurs", "eur", "ites", "ite", "ees", "ee", "es", "s", "x", "e",
+)
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Score multipliers for approximate matches
+PREFIX_MATCH_FACTOR = 0.7
+FUZZY_MATCH_FACTOR = 0.5
+
+
+def fold_text(text: Optional[str]) -> str:
+    """Lowercase and strip accents ("Électroménager" -> "electromenager")"""
+    if not text:
+        return ""
+    text = str(text).lower()
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text.replace("œ", "oe").replace("æ", "ae"))
+        text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def stem(token: str) -> str:
+    """Light French stemmer (plural and common derivational suffixes)"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    for suffix in FRENCH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Folded, stemmed tokens without stopwords"""
+    return [stem(t) for t in fold_text(text).split() if t not in FRENCH_STOPWORDS]
+
+
+def _deletes(term: str) -> Set[str]:
+    """All strings at one deletion from term (SymSpell neighbourhood)"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class SearchIndex:
+    """
+    Inverted index over product documents.
+
+    Postings store a field-weighted term frequency per product. Queries are
+    ranked with BM25; products matching more query terms always rank first.
+    The last query term also matches as a prefix, and terms absent from the
+    vocabulary fall back to one-edit typo candidates.
+    """
+
+    def __init__(self, fields: Optional[Dict[str, float]] = None, id_field: str = "product_id"):
+        self.fields = fields or SEARCH_FIELDS
+        self.id_field = id_field
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._doc_len: Dict[str, float] = {}
+        self._total_len = 0.0
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self._sorted_terms: Optional[List[str]] = None
+        self._norms: Optional[Dict[str, float]] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    # ----- maintenance -----
+
+    def build(self, docs: Iterable[dict]):
+        """Replace the whole index"""
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._total_len = 0.0
+        self._deletes = defaultdict(set)
+        self._sorted_terms = None
+        self._norms = None
+        for doc in docs:
+            self.upsert(doc)
+        self.ready = True
+
+    def upsert(self, doc: dict):
+        """Index (or re-index) one product"""
+        doc_id = doc[self.id_field]
+        self.remove(doc_id)
+        self._norms = None
+
+        weights: Dict[str, float] = defaultdict(float)
+        for field, weight in self.fields.items():
+            for term in tokenize(doc.get(field)):
+                weights[term] += weight
+        if not weights:
+            return
+
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._add_term(term)
+            self._postings[term][doc_id] = weight
+        self._doc_terms[doc_id] = set(weights)
+        length = sum(weights.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: str):
+        """Drop one product from the index"""
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._norms = None
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._remove_term(term)
+
+    def _add_term(self, term: str):
+        self._sorted_terms = None
+        for variant in _deletes(term) | {term}:
+            self._deletes[variant].add(term)
+
+    def _remove_term(self, term: str):
+        self._sorted_terms = None
+        for variant in _deletes(term) | {term}:
+            terms = self._deletes.get(variant)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._deletes[variant]
+
+    # ----- querying -----
+
+    def _length_norms(self) -> Dict[str, float]:
+        """BM25 length normalisation per product, recomputed only after writes"""
+        if self._norms is None:
+            avg_len = self._total_len / len(self._doc_len) if self._doc_len else 1.0
+            self._norms = {
+                doc_id: BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                for doc_id, length in self._doc_len.items()
+            }
+        return self._norms
+
+    def _prefix_terms(self, prefix: str, limit: int = 50) -> List[str]:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        start = bisect.bisect_left(terms, prefix)
+        matches = []
+        for term in terms[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                matches.append(term)
+        return matches
+
+    def _fuzzy_terms(self, term: str) -> Set[str]:
+        """Vocabulary terms at edit distance 1 (insert, delete, substitute, transpose)"""
+        if len(term) < 4:
+            return set()
+        candidates = set(self._deletes.get(term, ()))
+        for variant in _deletes(term):
+            candidates |= self._deletes.get(variant, set())
+        candidates.discard(term)
+        return candidates
+
+    def _expand(self, term: str, is_last: bool, fuzzy: bool) -> List[Tuple[str, float]]:
+        expansions = []
+        if term in self._postings:
+            expansions.append((term, 1.0))
+        if is_last and len(term) >= 2:
+            expansions.extend((t, PREFIX_MATCH_FACTOR) for t in self._prefix_terms(term))
+        if fuzzy and not expansions:
+            expansions.extend((t, FUZZY_MATCH_FACTOR) for t in self._fuzzy_terms(term))
+        return expansions
+
+    def search(self, query: str, limit: int = 50, fuzzy_max_terms: int = 3) -> List[Tuple[str, float]]:
+        """Return [(product_id, score)] best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self._doc_terms:
+            return []
+
+        # Typo tolerance only for short queries, long ones have enough signal
+        fuzzy = len(terms) <= fuzzy_max_terms
+        n_docs = len(self._doc_terms)
+        norms = self._length_norms()
+
+        scores: Dict[str, float] = defaultdict(float)
+        matched: Dict[str, int] = defaultdict(int)
+        for position, term in enumerate(terms):
+            best_for_term: Dict[str, float] = {}
+            for candidate, factor in self._expand(term, position == len(terms) - 1, fuzzy):
+                postings = self._postings[candidate]
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = factor * idf * (BM25_K1 + 1)
+                for doc_id, tf in postings.items():
+                    score = weight * tf / (tf + norms[doc_id])
+                    if score > best_for_term.get(doc_id, 0.0):
+                        best_for_term[doc_id] = score
+            for doc_id, score in best_for_term.items():
+                scores[doc_id] += score
+                matched[doc_id] += 1
+
+        ranked = sorted(scores, key=lambda d: (matched[d], scores[d]), reverse=True)
+        return [(doc_id, round(scores[doc_id], 4)) for doc_id in ranked[:limit]]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "documents": len(self._doc_terms),
+            "terms": len(self._postings),
+        }
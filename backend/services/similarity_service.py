@@ -0,0 +1,224 @@
+"""
+Product similarity service for YAMA+ e-commerce platform
+TF-IDF content vectors plus category and price affinity, with precomputed
+top-K nearest neighbours per product
+"""
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .search_service import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, without it the similar-products route keeps its category heuristic
+    np = None
+
+# Text fields and how many times each counts in the term frequencies
+TEXT_FIELDS = {"name": 3, "brand": 2, "subcategory": 2, "short_description": 1, "description": 1}
+
+# Vocabulary cap (by document frequency) keeps the dense matrix small
+MAX_FEATURES = 2048
+
+# Score = text cosine + CATEGORY_WEIGHT * same category + PRICE_WEIGHT * price affinity
+CATEGORY_WEIGHT = 0.3
+PRICE_WEIGHT = 0.2
+
+DEFAULT_TOP_K = 12
+
+# Rows multiplied at once during a full build (bounds the n x n scratch memory)
+BLOCK_SIZE = 256
+
+
+def product_text_terms(product: dict) -> Counter:
+    """Weighted term counts for a product, including its specs"""
+    counts: Counter = Counter()
+    for field, weight in TEXT_FIELDS.items():
+        for term in tokenize(product.get(field)):
+            counts[term] += weight
+    specs = product.get("specs")
+    if isinstance(specs, dict):
+        for key, value in specs.items():
+            for term in tokenize(f"{key} {value}"):
+                counts[term] += 1
+    return counts
+
+
+class SimilarityIndex:
+    """
+    Content-based nearest neighbours over the catalog.
+
+    build() vectorises every product and stores the top-K neighbours of each
+    one. upsert()/remove() handle single-product changes against the current
+    vocabulary; new words are only picked up by the next full build.
+    """
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K, max_features: int = MAX_FEATURES):
+        self.top_k = top_k
+        self.max_features = max_features
+        self._vocabulary: Dict[str, int] = {}
+        self._idf = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors = None
+        self._categories = None
+        self._log_prices = None
+        self._active = None
+        self._category_codes: Dict[str, int] = {}
+        self._neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        self.ready = False
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    # ----- vectorisation -----
+
+    def _fit_vocabulary(self, term_counts: List[Counter]):
+        df: Counter = Counter()
+        for counts in term_counts:
+            df.update(counts.keys())
+        # Terms in a single product cannot link two products
+        common = [term for term, freq in df.most_common() if freq > 1][:self.max_features]
+        self._vocabulary = {term: column for column, term in enumerate(common)}
+        n_docs = max(len(term_counts), 1)
+        self._idf = np.array(
+            [math.log((1 + n_docs) / (1 + df[term])) + 1 for term in common], dtype=np.float32
+        )
+
+    def _vectorise(self, counts: Counter):
+        vector = np.zeros(len(self._vocabulary), dtype=np.float32)
+        for term, count in counts.items():
+            column = self._vocabulary.get(term)
+            if column is not None:
+                vector[column] = 1 + math.log(count)
+        if len(vector):
+            vector *= self._idf
+            norm = float(np.linalg.norm(vector))
+            if norm:
+                vector /= norm
+        return vector
+
+    def _category_code(self, category: Optional[str]) -> int:
+        if not category:
+            return -1
+        return self._category_codes.setdefault(category, len(self._category_codes))
+
+    @staticmethod
+    def _log_price(product: dict) -> float:
+        price = product.get("price") or 0
+        return math.log1p(price) if isinstance(price, (int, float)) and price > 0 else 0.0
+
+    # ----- scoring -----
+
+    def _scores(self, rows):
+        """Similarity of the given rows against every product (rows x n)"""
+        scores = self._vectors[rows] @ self._vectors.T
+        same_category = self._categories[rows][:, None] == self._categories[None, :]
+        same_category &= self._categories[None, :] >= 0
+        scores += CATEGORY_WEIGHT * same_category
+        scores += PRICE_WEIGHT * np.exp(-np.abs(self._log_prices[rows][:, None] - self._log_prices[None, :]))
+        scores[:, ~self._active] = -np.inf
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def _top_k(self, scores) -> List[Tuple[str, float]]:
+        k = min(self.top_k, len(scores) - 1)
+        if k <= 0:
+            return []
+        candidates = np.argpartition(-scores, k)[:k]
+        ordered = candidates[np.argsort(-scores[candidates])]
+        return [(self._ids[i], round(float(scores[i]), 4)) for i in ordered if np.isfinite(scores[i])]
+
+    # ----- maintenance -----
+
+    def build(self, products: Iterable[dict]):
+        """Vectorise the catalog and precompute every neighbour list (CPU bound, run in a thread)"""
+        products = [p for p in products if p.get("product_id")]
+        term_counts = [product_text_terms(p) for p in products]
+        self._fit_vocabulary(term_counts)
+        self._category_codes = {}
+        self._ids = [p["product_id"] for p in products]
+        self._rows = {product_id: row for row, product_id in enumerate(self._ids)}
+        self._vectors = np.vstack([self._vectorise(c) for c in term_counts]) if products else \
+            np.zeros((0, len(self._vocabulary)), dtype=np.float32)
+        self._categories = np.array([self._category_code(p.get("category")) for p in products], dtype=np.int32)
+        self._log_prices = np.array([self._log_price(p) for p in products], dtype=np.float32)
+        self._active = np.ones(len(products), dtype=bool)
+
+        neighbours = {}
+        for start in range(0, len(products), BLOCK_SIZE):
+            rows = np.arange(start, min(start + BLOCK_SIZE, len(products)))
+            for row, scores in zip(rows, self._scores(rows)):
+                neighbours[self._ids[row]] = self._top_k(scores)
+        self._neighbours = neighbours
+        self.ready = True
+
+    def upsert(self, product: dict):
+        """Re-vectorise one product and refresh the lists it appears in"""
+        if not self.ready:
+            return
+        product_id = product["product_id"]
+        vector = self._vectorise(product_text_terms(product))
+        row = self._rows.get(product_id)
+        if row is None:
+            row = len(self._ids)
+            self._ids.append(product_id)
+            self._rows[product_id] = row
+            self._vectors = np.vstack([self._vectors, vector[None, :]])
+            self._categories = np.append(self._categories, np.int32(self._category_code(product.get("category"))))
+            self._log_prices = np.append(self._log_prices, np.float32(self._log_price(product)))
+            self._active = np.append(self._active, True)
+        else:
+            self._vectors[row] = vector
+            self._categories[row] = self._category_code(product.get("category"))
+            self._log_prices[row] = self._log_price(product)
+            self._active[row] = True
+
+        scores = self._scores(np.array([row]))[0]
+        self._neighbours[product_id] = self._top_k(scores)
+        self._refresh_lists_affected_by(product_id, scores)
+
+    def remove(self, product_id: str):
+        row = self._rows.get(product_id)
+        if row is None or not self.ready:
+            return
+        self._active[row] = False
+        self._neighbours.pop(product_id, None)
+        self._refresh_lists_affected_by(product_id, None)
+
+    def _refresh_lists_affected_by(self, product_id: str, scores):
+        """
+        Recompute lists that contain product_id, and (when scores are given)
+        lists whose weakest neighbour is now beaten by it. Similarity is
+        symmetric, so scores[j] is also product_id's score in j's list.
+        """
+        stale = []
+        for other, neighbours in self._neighbours.items():
+            if other == product_id:
+                continue
+            if any(n == product_id for n, _ in neighbours):
+                stale.append(other)
+            elif scores is not None:
+                score = scores[self._rows[other]]
+                if np.isfinite(score) and (len(neighbours) < self.top_k or score > neighbours[-1][1]):
+                    stale.append(other)
+        for start in range(0, len(stale), BLOCK_SIZE):
+            chunk = stale[start:start + BLOCK_SIZE]
+            rows = np.array([self._rows[other] for other in chunk])
+            for other, other_scores in zip(chunk, self._scores(rows)):
+                self._neighbours[other] = self._top_k(other_scores)
+
+    # ----- querying -----
+
+    def neighbours(self, product_id: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        result = self._neighbours.get(product_id, [])
+        return result[:limit] if limit else result
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "products": int(self._active.sum()) if self._active is not None else 0,
+            "features": len(self._vocabulary),
+        }
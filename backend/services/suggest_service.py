@@ -0,0 +1,218 @@
+"""
+Search suggestion service for YAMA+ e-commerce platform
+Typeahead over product names, brands, categories and subcategories using a
+sorted prefix array, ranked by popularity
+"""
+import bisect
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+
+from .search_service import fold_text
+
+# Popularity boosts for product flags
+FEATURED_BOOST = 2.0
+NEW_BOOST = 0.5
+PROMO_BOOST = 0.5
+
+# Upper bound on prefix keys examined per lookup for prefixes longer than
+# SHORT_PREFIX; shorter ones match a large share of the catalog and are
+# scanned fully once, then served from the memo until the next write
+MAX_SCANNED_KEYS = 2000
+SHORT_PREFIX = 2
+MEMO_MAX_ENTRIES = 4096
+
+
+def product_popularity(product: dict, sales: int = 0) -> float:
+    """Popularity weight from sales volume and merchandising flags"""
+    weight = 1.0 + math.log1p(sales)
+    if product.get("featured"):
+        weight += FEATURED_BOOST
+    if product.get("is_new"):
+        weight += NEW_BOOST
+    if product.get("is_promo"):
+        weight += PROMO_BOOST
+    if product.get("stock", 0) <= 0 and not product.get("is_on_order"):
+        weight *= 0.5
+    return weight
+
+
+class SuggestIndex:
+    """
+    Prefix index for the storefront search box.
+
+    Each suggestion (a product, brand, category or subcategory) is reachable
+    from its folded label and from every word inside it, so "sams" finds both
+    the "Samsung" brand and "Réfrigérateur Samsung 300L". Brand and category
+    weights are the sum of their products' popularity. Products are updated
+    one at a time with upsert()/remove() as the catalog changes, and
+    add_sales() re-ranks the products of each new order.
+    """
+
+    GROUP_FIELDS = ("brand", "category", "subcategory")
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+        self._entry_keys: Dict[str, List[str]] = {}
+        self._entries: Dict[str, dict] = {}
+        self._group_members: Dict[str, Dict[str, float]] = {}
+        self._product_groups: Dict[str, List[str]] = {}
+        self._sales: Dict[str, int] = {}
+        # Fields product_popularity() reads, to re-weight a product when it sells
+        self._popularity_fields: Dict[str, dict] = {}
+        self.category_labels: Dict[str, str] = {}
+        self._memo: Dict[Tuple[str, int], List[dict]] = {}
+        self.ready = False
+
+    # ----- maintenance -----
+
+    def build(self, products: List[dict], sales: Optional[Dict[str, int]] = None,
+              category_labels: Optional[Dict[str, str]] = None):
+        """Replace the whole index"""
+        self._keys = []
+        self._entry_keys = {}
+        self._entries = {}
+        self._group_members = {}
+        self._product_groups = {}
+        self._popularity_fields = {}
+        self._sales = dict(sales or {})
+        self._memo = {}
+        if category_labels is not None:
+            self.category_labels = category_labels
+
+        # Bulk load: collect every key, then sort once
+        pending: List[Tuple[str, str]] = []
+        for product in products:
+            self._add_product(product, pending)
+        pending.sort()
+        self._keys = pending
+        self.ready = True
+
+    def upsert(self, product: dict):
+        """Add or refresh one product (and its brand/category weights)"""
+        self.remove(product["product_id"])
+        self._memo = {}
+        added: List[Tuple[str, str]] = []
+        self._add_product(product, added)
+        for item in added:
+            bisect.insort(self._keys, item)
+
+    def remove(self, product_id: str):
+        """Drop one product; groups left without products disappear"""
+        entry_id = f"product:{product_id}"
+        if entry_id not in self._entries:
+            return
+        self._memo = {}
+        self._drop_entry(entry_id)
+        self._popularity_fields.pop(product_id, None)
+        for group_id in self._product_groups.pop(product_id, []):
+            members = self._group_members.get(group_id)
+            if members is None:
+                continue
+            weight = members.pop(product_id, 0.0)
+            if members:
+                self._entries[group_id]["weight"] -= weight
+            else:
+                del self._group_members[group_id]
+                self._drop_entry(group_id)
+
+    def add_sales(self, quantities: Dict[str, int]):
+        """Count units sold and re-weight those products and their groups right away"""
+        for product_id, quantity in quantities.items():
+            self._sales[product_id] = self._sales.get(product_id, 0) + quantity
+            fields = self._popularity_fields.get(product_id)
+            if fields is None:
+                continue
+            self._memo = {}
+            entry = self._entries[f"product:{product_id}"]
+            weight = product_popularity(fields, self._sales[product_id])
+            delta = weight - entry["weight"]
+            entry["weight"] = weight
+            for group_id in self._product_groups.get(product_id, []):
+                self._group_members[group_id][product_id] = weight
+                self._entries[group_id]["weight"] += delta
+
+    def _add_product(self, product: dict, keys_out: List[Tuple[str, str]]):
+        product_id = product["product_id"]
+        self._popularity_fields[product_id] = {
+            field: product.get(field) for field in ("featured", "is_new", "is_promo", "stock", "is_on_order")
+        }
+        weight = product_popularity(product, self._sales.get(product_id, 0))
+        images = product.get("images") or []
+        entry_id = f"product:{product_id}"
+        self._entries[entry_id] = {
+            "type": "product",
+            "label": product.get("name", ""),
+            "product_id": product_id,
+            "price": product.get("price"),
+            "image": images[0] if images else None,
+            "weight": weight,
+        }
+        self._index_label(entry_id, product.get("name", ""), keys_out)
+
+        groups = []
+        for field in self.GROUP_FIELDS:
+            value = product.get(field)
+            if not value:
+                continue
+            label = self.category_labels.get(value, value) if field == "category" else value
+            group_id = f"{field}:{fold_text(value)}"
+            members = self._group_members.setdefault(group_id, {})
+            if group_id not in self._entries:
+                self._entries[group_id] = {"type": field, "label": label, "value": value, "weight": 0.0}
+                self._index_label(group_id, label, keys_out)
+                if label != value:
+                    self._index_label(group_id, value, keys_out)
+            members[product_id] = weight
+            self._entries[group_id]["weight"] += weight
+            groups.append(group_id)
+        self._product_groups[product_id] = groups
+
+    def _index_label(self, entry_id: str, label: str, keys_out: List[Tuple[str, str]]):
+        words = fold_text(label).split()
+        keys = {" ".join(words[i:]) for i in range(len(words))}
+        self._entry_keys.setdefault(entry_id, []).extend(keys)
+        keys_out.extend((key, entry_id) for key in keys)
+
+    def _drop_entry(self, entry_id: str):
+        self._entries.pop(entry_id, None)
+        for key in self._entry_keys.pop(entry_id, []):
+            position = bisect.bisect_left(self._keys, (key, entry_id))
+            if position < len(self._keys) and self._keys[position] == (key, entry_id):
+                del self._keys[position]
+
+    # ----- querying -----
+
+    def suggest(self, query: str, limit: int = 8) -> List[dict]:
+        """Best suggestions whose label (or a word in it) starts with the query"""
+        prefix = " ".join(fold_text(query).split())
+        if not prefix:
+            return []
+
+        memo_key = (prefix, limit)
+        cached = self._memo.get(memo_key)
+        if cached is not None:
+            return cached
+
+        start = bisect.bisect_left(self._keys, (prefix, ""))
+        end = len(self._keys) if len(prefix) <= SHORT_PREFIX else min(start + MAX_SCANNED_KEYS, len(self._keys))
+        matched = set()
+        for position in range(start, end):
+            key, entry_id = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            matched.add(entry_id)
+
+        entries = heapq.nlargest(limit, (self._entries[e] for e in matched), key=lambda e: e["weight"])
+        results = [{k: v for k, v in entry.items() if k != "weight"} for entry in entries]
+        if len(self._memo) >= MEMO_MAX_ENTRIES:
+            self._memo.clear()
+        self._memo[memo_key] = results
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "suggestions": len(self._entries),
+            "keys": len(self._keys),
+        }
@@ -102,6 +102,17 @@ export function CartProvider({ children }) {
     }
   };
 
+  // Server-side price breakdown for checkout; its quote_token is sent with the order
+  const quoteCart = async ({ city, address, region, promoCode }) => {
+    const response = await cartApi.post("/api/cart/quote", {
+      city,
+      address,
+      region,
+      promo_code: promoCode || null,
+    });
+    return response.data;
+  };
+
   // Get cart count
   const cartCount = cart.items.reduce((sum, item) => sum + item.quantity, 0);
 
@@ -115,6 +126,7 @@ export function CartProvider({ children }) {
     removeFromCart,
     clearCart,
     fetchCart,
+    quoteCart,
     cartCount,
   };
 
@@ -97,7 +97,7 @@ const regions = [
 ];
 
 export default function CheckoutPage() {
-  const { cart, clearCart } = useCart();
+  const { cart, clearCart, quoteCart } = useCart();
   const { user, isAuthenticated } = useAuth();
   const navigate = useNavigate();
   
@@ -270,8 +270,34 @@ export default function CheckoutPage() {
     setLoading(true);
     
     try {
+      // Prices, shipping and discount come from the server; the signed quote is checked with the order
+      const quote = await quoteCart({
+        city: formData.city,
+        address: formData.address,
+        region: formData.region,
+        promoCode: appliedPromo?.code,
+      });
+
+      // Never charge another amount than the one shown without the customer's consent
+      const changes = [];
+      if (quote.promo_error) {
+        changes.push(`Code promo non appliqué : ${typeof quote.promo_error === "string" ? quote.promo_error : "code invalide"}`);
+      }
+      if (quote.missing?.length) {
+        const names = quote.missing.map(
+          (productId) => cart.items.find((item) => item.product_id === productId)?.name || productId
+        );
+        changes.push(`Produits retirés (plus disponibles) : ${names.join(", ")}`);
+      }
+      if (quote.total !== total) {
+        changes.push(`Nouveau total : ${formatPrice(quote.total)} au lieu de ${formatPrice(total)}`);
+      }
+      if (changes.length && !window.confirm(`Votre commande a changé :\n\n${changes.join("\n")}\n\nConfirmer la commande ?`)) {
+        return;
+      }
+
       const orderData = {
-        items: cart.items.map((item) => ({
+        items: quote.items.map((item) => ({
           product_id: item.product_id,
           name: item.name,
           price: item.price,
@@ -289,11 +315,12 @@ export default function CheckoutPage() {
           notes: formData.notes,
         },
         payment_method: formData.payment_method,
-        subtotal,
-        shipping_cost: shippingCost,
-        discount,
-        total,
-        promo_code: appliedPromo?.code || null,
+        subtotal: quote.subtotal,
+        shipping_cost: quote.shipping_cost,
+        discount: quote.discount,
+        total: quote.total,
+        promo_code: quote.promo?.code || null,
+        quote_token: quote.quote_token,
       };
 
       const response = await axios.post(`${API_URL}/api/orders`, orderData);
@@ -331,7 +358,9 @@ export default function CheckoutPage() {
       toast.success("Commande passée avec succès !");
     } catch (error) {
       console.error("Order error:", error);
-      toast.error("Erreur lors de la commande. Veuillez réessayer.");
+      // Quote and stock errors carry a reason (stock shortages: { message, items })
+      const detail = error.response?.data?.detail;
+      toast.error((typeof detail === "string" ? detail : detail?.message) || "Erreur lors de la commande. Veuillez réessayer.");
     } finally {
       setLoading(false);
     }